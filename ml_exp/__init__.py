@@ -23,10 +23,25 @@ SOFTWARE.
 from ml_exp.compound import Compound
 from ml_exp.representations import coulomb_matrix, lennard_jones_matrix,\
         get_helping_data, adjacency_matrix, epsilon_index, bag_of_bonds
+from ml_exp.descriptors import gen_descriptors, release_descriptors,\
+        descriptor_params, compound_descriptors, fill_descriptors
+from ml_exp.cache import DescriptorCache, dataset_fingerprint, KernelCache,\
+        array_fingerprint
 from ml_exp.readdb import qm7db, qm9db
-from ml_exp.data import NUCLEAR_CHARGE, POSSIBLE_BONDS
-from ml_exp.kernels import gaussian_kernel, laplacian_kernel, wasserstein_kernel
-from ml_exp.krr import krr, multi_krr
+from ml_exp.data import NUCLEAR_CHARGE, POSSIBLE_BONDS, QM9_PROPERTIES
+from ml_exp.kernels import gaussian_kernel, laplacian_kernel,\
+        wasserstein_kernel, distance_matrix, kernel_from_distance,\
+        multi_sigma_kernels, kernel_matrix, kernel_memmap, squared_norms,\
+        kernel_tile, kernel_matvec
+from ml_exp.krr import krr, multi_krr, multi_sigma_krr, ooc_krr, nystrom_krr,\
+        rff_krr, regularization_path_krr, loo_krr, krr_cv, learning_curve_krr,\
+        cg_krr, mixed_krr, local_krr, dc_krr, pipelined_multi_krr
+from ml_exp.model import KRRModel
+from ml_exp.neighbors import NeighborIndex, VPTree
+from ml_exp.selection import farthest_point_sampling, cur_selection
+from ml_exp.tuning import successive_halving
+from ml_exp.preprocessing import collapse_duplicates
+from ml_exp.decomposition import PCAProjection
 
 __all__ = ['Compound',
            'coulomb_matrix',
@@ -35,12 +50,51 @@ __all__ = ['Compound',
            'adjacency_matrix',
            'epsilon_index',
            'bag_of_bonds',
+           'gen_descriptors',
+           'release_descriptors',
+           'descriptor_params',
+           'compound_descriptors',
+           'fill_descriptors',
+           'DescriptorCache',
+           'dataset_fingerprint',
+           'KernelCache',
+           'array_fingerprint',
            'qm7db',
            'qm9db',
            'gaussian_kernel',
            'laplacian_kernel',
            'wasserstein_kernel',
+           'distance_matrix',
+           'kernel_from_distance',
+           'multi_sigma_kernels',
+           'kernel_matrix',
+           'kernel_memmap',
+           'squared_norms',
+           'kernel_tile',
+           'kernel_matvec',
            'krr',
            'multi_krr',
+           'multi_sigma_krr',
+           'ooc_krr',
+           'nystrom_krr',
+           'rff_krr',
+           'regularization_path_krr',
+           'loo_krr',
+           'krr_cv',
+           'learning_curve_krr',
+           'cg_krr',
+           'mixed_krr',
+           'local_krr',
+           'dc_krr',
+           'pipelined_multi_krr',
+           'KRRModel',
+           'NeighborIndex',
+           'VPTree',
+           'farthest_point_sampling',
+           'cur_selection',
+           'successive_halving',
+           'collapse_duplicates',
+           'PCAProjection',
            'NUCLEAR_CHARGE',
-           'POSSIBLE_BONDS']
+           'POSSIBLE_BONDS',
+           'QM9_PROPERTIES']
@@ -0,0 +1,205 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import numpy as np
+from scipy import linalg as LA
+from scipy import sparse
+from ml_exp.kernels import distance_matrix, kernel_matrix
+
+
+def kmeans(X,
+           n_clusters,
+           n_iter=10,
+           r_seed=111):
+    """
+    K-means clustering with k-means++ initialization.
+    X: array of descriptors.
+    n_clusters: number of clusters.
+    n_iter: number of Lloyd iterations.
+    r_seed: random seed to use.
+    Returns the centroids and the cluster label of each descriptor.
+    """
+    X = X.reshape(X.shape[0], -1)
+    data_size = X.shape[0]
+    rng = np.random.default_rng(r_seed)
+
+    # k-means++, the distances to the closest centroid are updated with
+    # only the last centroid added.
+    centroids = np.empty((n_clusters, X.shape[1]), dtype=np.float64)
+    centroids[0] = X[rng.integers(data_size)]
+    min_d = distance_matrix(centroids[:1], X, squared=True)[0]
+    for k in range(1, n_clusters):
+        total = min_d.sum()
+        if total > 0.0:
+            i = rng.choice(data_size, p=min_d/total)
+        else:
+            i = rng.integers(data_size)
+        centroids[k] = X[i]
+        np.minimum(min_d,
+                   distance_matrix(centroids[k:k + 1], X, squared=True)[0],
+                   out=min_d)
+
+    for _ in range(n_iter):
+        labels = np.argmin(distance_matrix(X, centroids, squared=True),
+                           axis=1)
+        counts = np.bincount(labels, minlength=n_clusters)
+        members = sparse.csr_matrix((np.ones(data_size),
+                                     (labels, np.arange(data_size))),
+                                    shape=(n_clusters, data_size))
+        sums = members.dot(X)
+        # Empty clusters keep their previous centroid.
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+
+    labels = np.argmin(distance_matrix(X, centroids, squared=True), axis=1)
+
+    return centroids, labels
+
+
+def select_landmarks(X,
+                     n_landmarks,
+                     method='uniform',
+                     sigma=1000.0,
+                     kernel='gaussian',
+                     metric='l2',
+                     r_seed=111):
+    """
+    Selects the landmark molecules for the Nystrom approximation.
+    X: array of descriptors.
+    n_landmarks: number of landmarks to select.
+    method: 'uniform' (random), 'kmeans' (molecules closest to the k-means
+        centroids) or 'leverage' (sampled by approximate leverage scores).
+    sigma: kernel width, only used for the leverage scores.
+    kernel: which kernel to use, only used for the leverage scores.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    r_seed: random seed to use.
+    Returns the sorted array of landmark indices.
+    """
+    data_size = X.shape[0]
+    if n_landmarks >= data_size:
+        return np.arange(data_size)
+
+    rng = np.random.default_rng(r_seed)
+    if method == 'uniform':
+        idx = rng.choice(data_size, n_landmarks, replace=False)
+
+    elif method == 'kmeans':
+        X_flat = X.reshape(data_size, -1)
+        centroids, _ = kmeans(X_flat,
+                              n_landmarks,
+                              r_seed=r_seed)
+        # Use the closest molecule to each centroid, as unique indices.
+        idx = np.unique(np.argmin(distance_matrix(centroids, X_flat), axis=1))
+
+        # Empty or repeated clusters are filled uniformly.
+        missing = n_landmarks - idx.shape[0]
+        if missing > 0:
+            rest = np.setdiff1d(np.arange(data_size), idx)
+            idx = np.concatenate([idx, rng.choice(rest, missing,
+                                                  replace=False)])
+
+    elif method == 'leverage':
+        # Leverage scores of the rank n_landmarks subspace of a uniform
+        # Nystrom sketch (twice the size) of the kernel.
+        sketch = rng.choice(data_size,
+                            min(2*n_landmarks, data_size),
+                            replace=False)
+        K_ss = kernel_matrix(X[sketch], X[sketch], sigma,
+                             kernel=kernel, metric=metric)
+        K_ss[np.diag_indices_from(K_ss)] += 1e-8
+        L_ss = LA.cholesky(K_ss, lower=True)
+        phi = LA.solve_triangular(L_ss,
+                                  kernel_matrix(X[sketch], X, sigma,
+                                                kernel=kernel, metric=metric),
+                                  lower=True).T
+        # Rows of U (phi = USV^T) from the small eigenproblem of phi^T phi.
+        eig_vals, eig_vecs = LA.eigh(np.dot(phi.T, phi))
+        eig_vals = np.maximum(eig_vals[-n_landmarks:], 1e-12)
+        U = np.dot(phi, eig_vecs[:, -n_landmarks:])
+        scores = np.einsum('ij,ij->i', U, U / eig_vals)
+        idx = rng.choice(data_size,
+                         n_landmarks,
+                         replace=False,
+                         p=scores/scores.sum())
+
+    else:
+        raise TypeError(f'{method} landmark method not found.')
+
+    return np.sort(idx)
+
+
+def sample_fourier_weights(n_dims,
+                           n_features,
+                           sigma,
+                           kernel='gaussian',
+                           metric='l2',
+                           r_seed=111):
+    """
+    Samples the random Fourier frequencies and phases of a kernel.
+    n_dims: dimension of the (flattened) descriptors.
+    n_features: number of random features (D).
+    sigma: kernel width.
+    kernel: which kernel to approximate, 'gaussian' or 'laplacian'.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    r_seed: random seed to use.
+    Returns the (n_dims, n_features) frequencies and the phases.
+    NOTE: the frequencies are sampled from the kernel spectral density,
+        gaussian for the gaussian kernel, independent cauchy for the l1
+        laplacian kernel and multivariate cauchy for the l2 laplacian kernel.
+    """
+    rng = np.random.default_rng(r_seed)
+
+    if kernel == 'gaussian':
+        W = rng.standard_normal((n_dims, n_features)) / sigma
+    elif kernel == 'laplacian':
+        # exp(-|x|/(2 sigma)), so the cauchy scale is 1/(2 sigma).
+        gamma = 0.5 / sigma
+        if metric == 'l1':
+            W = gamma * rng.standard_cauchy((n_dims, n_features))
+        elif metric == 'l2':
+            W = gamma * rng.standard_normal((n_dims, n_features)) \
+                / np.abs(rng.standard_normal(n_features))
+        else:
+            raise TypeError(f'{metric} metric not found.')
+    else:
+        raise TypeError(f'{kernel} kernel not supported for random features.')
+
+    b = rng.uniform(0.0, 2.0*np.pi, n_features)
+
+    return W, b
+
+
+def random_fourier_features(X,
+                            W,
+                            b):
+    """
+    Maps descriptors to random Fourier features, K(x, y) ~ z(x)z(y).
+    X: array of descriptors.
+    W: frequencies, as given by sample_fourier_weights.
+    b: phases, as given by sample_fourier_weights.
+    """
+    Z = np.dot(X.reshape(X.shape[0], -1), W)
+    Z += b
+    np.cos(Z, out=Z)
+    Z *= np.sqrt(2.0 / W.shape[1])
+
+    return Z
@@ -0,0 +1,1047 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.misc import printc
+from ml_exp.readdb import qm7db, qm9db
+from ml_exp.kernels import distance_matrix, kernel_from_distance
+from ml_exp.krr import krr, cg_krr, mixed_krr, local_krr, dc_krr,\
+    multi_krr, pipelined_multi_krr
+from ml_exp.model import KRRModel
+from ml_exp.tuning import successive_halving
+from ml_exp.preprocessing import collapse_duplicates
+from ml_exp.decomposition import PCAProjection
+from ml_exp.descriptors import gen_descriptors, release_descriptors
+from ml_exp.cache import KernelCache
+
+
+def _qm7_descriptors(db_path='data',
+                     identifier='CM',
+                     r_seed=111,
+                     as_eig=True):
+    """
+    Reads the qm7 database and creates the descriptors used by benchmarks.
+    db_path: path to the database directory.
+    identifier: descriptor to create, 'CM', 'LJM', 'AM' or 'BOB'.
+    r_seed: random seed to use for the shuffling.
+    as_eig: if CM and LJM should be the eigenvalues, instead of the
+        flattened (row-norm sorted) matrices. AM is always a matrix.
+    """
+    compounds, energy_pbe0, _ = qm7db(db_path=db_path,
+                                      r_seed=r_seed,
+                                      use_tf=False)
+
+    for compound in compounds:
+        if identifier == 'CM':
+            compound.gen_cm(sort=not as_eig,
+                            as_eig=as_eig)
+        elif identifier == 'LJM':
+            compound.gen_ljm(sort=not as_eig,
+                             as_eig=as_eig)
+        elif identifier == 'AM':
+            compound.gen_hd()
+            compound.gen_am(sort=True)
+        elif identifier == 'BOB':
+            compound.gen_cm(as_eig=False,
+                            flatten=False)
+            compound.gen_bob()
+        else:
+            raise TypeError(f'{identifier} descriptor not supported.')
+
+    descriptors = np.array([getattr(comp, identifier.lower())
+                            for comp in compounds], dtype=np.float64)
+
+    return descriptors, energy_pbe0
+
+
+def _qm9_descriptors(db_path='data',
+                     identifier='CM',
+                     r_seed=111):
+    """
+    Reads the qm9 database and creates the descriptors used by benchmarks.
+    db_path: path to the database directory.
+    identifier: descriptor to create, 'CM' (eigenvalues) or 'BOB'.
+    r_seed: random seed to use for the shuffling.
+    Returns the descriptors and the (data size, 15) matrix of properties.
+    """
+    compounds = qm9db(db_path=db_path,
+                      r_seed=r_seed,
+                      use_tf=False)
+
+    for compound in compounds:
+        if identifier == 'CM':
+            compound.gen_cm(size=29)
+        elif identifier == 'BOB':
+            compound.gen_cm(size=29,
+                            as_eig=False,
+                            flatten=False)
+            compound.gen_bob(acount={'C':9, 'H':20, 'N':7, 'O':5, 'F':6})
+        else:
+            raise TypeError(f'{identifier} descriptor not supported.')
+
+    if identifier == 'CM':
+        descriptors = np.array([comp.cm for comp in compounds],
+                               dtype=np.float64)
+    else:
+        descriptors = np.array([comp.bob for comp in compounds],
+                               dtype=np.float64)
+    properties = np.array([comp.qm9prop for comp in compounds],
+                          dtype=np.float64)
+
+    return descriptors, properties
+
+
+def _rowwise_distance(X1,
+                      X2):
+    """
+    Row by row euclidean distance, as previously done in the kernels.
+    Used only as a reference for the benchmarks.
+    X1: first representations.
+    X2: second representations.
+    """
+    D = np.zeros((X1.shape[0], X2.shape[0]), dtype=np.float64)
+    for i in range(X1.shape[0]):
+        D[i, :] = np.linalg.norm(X2 - X1[i], axis=-1)
+
+    return D
+
+
+def bob_laplacian_benchmark(db_path='data',
+                            training_size=1500,
+                            test_size=None,
+                            sigma=1000.0,
+                            r_seed=111,
+                            n_jobs=1,
+                            show_msgs=True):
+    """
+    Benchmarks the l1 and l2 laplacian kernels on the qm7 Bag of Bonds.
+    db_path: path to the database directory.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    r_seed: random seed to use for the shuffling.
+    n_jobs: number of threads for the blocked distance computation.
+    show_msgs: if debug messages should be shown.
+    Returns a dictionary with the distance timings and the maes.
+    """
+    bob_data, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                             identifier='BOB',
+                                             r_seed=r_seed)
+    X_tr = bob_data[:training_size]
+
+    results = dict()
+    tic = time.perf_counter()
+    _rowwise_distance(X_tr, X_tr)
+    results['rowwise_l2_time'] = time.perf_counter() - tic
+
+    for metric in ['l2', 'l1']:
+        tic = time.perf_counter()
+        distance_matrix(X_tr, X_tr, metric=metric, n_jobs=n_jobs)
+        results[f'blocked_{metric}_time'] = time.perf_counter() - tic
+
+        mae, tictoc = krr(bob_data,
+                          energy_pbe0,
+                          training_size=training_size,
+                          test_size=test_size,
+                          sigma=sigma,
+                          identifier=f'BOB ({metric})',
+                          kernel='laplacian',
+                          metric=metric,
+                          use_tf=False,
+                          show_msgs=False)
+        results[f'{metric}_mae'] = mae
+        results[f'{metric}_time'] = tictoc
+
+    if show_msgs:
+        printc('BOB laplacian benchmark (qm7).', 'GREEN')
+        printc(f'\tRow-wise l2 distances: {results["rowwise_l2_time"]:.4f} s',
+               'CYAN')
+        for metric in ['l2', 'l1']:
+            printc(f'\tBlocked {metric} distances: '
+                   f'{results[f"blocked_{metric}_time"]:.4f} s', 'CYAN')
+            printc(f'\tMAE ({metric}): {results[f"{metric}_mae"]:.4f}, '
+                   f'krr took {results[f"{metric}_time"]:.4f} s', 'CYAN')
+
+    return results
+
+
+def nystrom_benchmark(db_path='data',
+                      identifier='BOB',
+                      training_size=4000,
+                      test_size=None,
+                      sigma=1000.0,
+                      kernel='laplacian',
+                      metric='l1',
+                      landmarks=[250, 500, 1000, 2000],
+                      landmark_methods=['uniform', 'kmeans', 'leverage'],
+                      r_seed=111,
+                      show_msgs=True):
+    """
+    Benchmarks the nystrom krr against the exact krr on qm7.
+    db_path: path to the database directory.
+    identifier: descriptor to use, 'CM' or 'BOB'.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    landmarks: list of numbers of landmarks (M) to try.
+    landmark_methods: list of landmark selection methods to try.
+    r_seed: random seed to use.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (method, M, mae, time), M is None for the exact krr.
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed)
+
+    mae, tictoc = krr(descriptors,
+                      energy_pbe0,
+                      training_size=training_size,
+                      test_size=test_size,
+                      sigma=sigma,
+                      kernel=kernel,
+                      metric=metric,
+                      use_tf=False,
+                      show_msgs=False)
+    results = [('exact', None, mae, tictoc)]
+
+    for landmark_method in landmark_methods:
+        for n_landmarks in landmarks:
+            mae, tictoc = krr(descriptors,
+                              energy_pbe0,
+                              training_size=training_size,
+                              test_size=test_size,
+                              sigma=sigma,
+                              kernel=kernel,
+                              metric=metric,
+                              use_tf=False,
+                              method='nystrom',
+                              n_landmarks=n_landmarks,
+                              landmark_method=landmark_method,
+                              r_seed=r_seed,
+                              show_msgs=False)
+            results.append((landmark_method, n_landmarks, mae, tictoc))
+
+    if show_msgs:
+        printc(f'Nystrom benchmark (qm7, {identifier}, {kernel}).', 'GREEN')
+        for method, n_landmarks, mae, tictoc in results:
+            printc(f'\t{method:>8} M={str(n_landmarks):>5}: '
+                   f'MAE {mae:.4f}, {tictoc:.4f} s', 'CYAN')
+
+    return results
+
+
+def rff_benchmark(db_path='data',
+                  identifier='BOB',
+                  training_size=5000,
+                  test_size=None,
+                  sigma=1000.0,
+                  kernel='laplacian',
+                  metric='l1',
+                  n_features=[250, 500, 1000, 2000, 4000],
+                  r_seed=111,
+                  show_msgs=True):
+    """
+    Accuracy versus number of random features (D) curve on qm7.
+    db_path: path to the database directory.
+    identifier: descriptor to use, 'CM' or 'BOB'.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    kernel: which kernel to use, 'gaussian' or 'laplacian'.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_features: list of numbers of random features to try.
+    r_seed: random seed to use.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (D, mae, time), D is None for the exact krr.
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed)
+
+    mae, tictoc = krr(descriptors,
+                      energy_pbe0,
+                      training_size=training_size,
+                      test_size=test_size,
+                      sigma=sigma,
+                      kernel=kernel,
+                      metric=metric,
+                      use_tf=False,
+                      show_msgs=False)
+    results = [(None, mae, tictoc)]
+
+    for D in n_features:
+        mae, tictoc = krr(descriptors,
+                          energy_pbe0,
+                          training_size=training_size,
+                          test_size=test_size,
+                          sigma=sigma,
+                          kernel=kernel,
+                          metric=metric,
+                          use_tf=False,
+                          method='rff',
+                          n_features=D,
+                          r_seed=r_seed,
+                          show_msgs=False)
+        results.append((D, mae, tictoc))
+
+    if show_msgs:
+        printc(f'Random features benchmark (qm7, {identifier}, {kernel}).',
+               'GREEN')
+        for D, mae, tictoc in results:
+            name = 'exact' if D is None else f'D={D}'
+            printc(f'\t{name:>7}: MAE {mae:.4f}, {tictoc:.4f} s', 'CYAN')
+
+    return results
+
+
+def cg_benchmark(db_path='data',
+                 identifier='CM',
+                 training_size=3000,
+                 test_size=None,
+                 sigma=100.0,
+                 kernel='gaussian',
+                 metric='l2',
+                 regs=[1e-4, 1e-6],
+                 preconditioners=['nystrom', 'jacobi', None],
+                 n_landmarks=300,
+                 maxiter=500,
+                 r_seed=111,
+                 show_msgs=True):
+    """
+    Benchmarks the conjugate gradient solver against the cholesky one on qm7.
+    db_path: path to the database directory.
+    identifier: descriptor to use, 'CM' or 'BOB'.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    regs: list of regularization values to try.
+    preconditioners: list of preconditioners to try.
+    n_landmarks: number of landmarks for the nystrom preconditioner.
+    maxiter: maximum number of cg iterations.
+    r_seed: random seed to use.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (reg, solver, iterations, mae, time).
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed)
+
+    results = []
+    for reg in regs:
+        mae, tictoc = krr(descriptors,
+                          energy_pbe0,
+                          training_size=training_size,
+                          test_size=test_size,
+                          sigma=sigma,
+                          kernel=kernel,
+                          metric=metric,
+                          use_tf=False,
+                          reg=reg,
+                          show_msgs=False)
+        results.append((reg, 'cholesky', None, mae, tictoc))
+
+        for preconditioner in preconditioners:
+            mae, tictoc, n_iter = cg_krr(descriptors,
+                                         energy_pbe0,
+                                         training_size=training_size,
+                                         test_size=test_size,
+                                         sigma=sigma,
+                                         kernel=kernel,
+                                         metric=metric,
+                                         reg=reg,
+                                         preconditioner=preconditioner,
+                                         n_landmarks=n_landmarks,
+                                         maxiter=maxiter,
+                                         r_seed=r_seed,
+                                         return_iters=True,
+                                         show_msgs=False)
+            results.append((reg, f'cg ({preconditioner})', n_iter, mae,
+                            tictoc))
+
+    if show_msgs:
+        printc(f'CG benchmark (qm7, {identifier}, {kernel}).', 'GREEN')
+        for reg, solver, n_iter, mae, tictoc in results:
+            printc(f'\treg={reg:.0e} {solver:>15}: iterations {n_iter}, '
+                   f'MAE {mae:.4f}, {tictoc:.4f} s', 'CYAN')
+
+    return results
+
+
+def _peak_rss_run(solver,
+                  descriptors,
+                  labels,
+                  kwargs):
+    """
+    Runs a krr solver and measures the peak resident memory it added.
+    Used by the benchmarks in a fresh process, so peaks don't mix.
+    solver: 'cholesky' (krr) or 'mixed' (mixed_krr).
+    descriptors: array of descriptors.
+    labels: array of labels.
+    kwargs: keyword arguments for the solver.
+    Returns the mae, the time, the refinement steps (None for cholesky) and
+        the peak rss added in MB.
+    """
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if solver == 'cholesky':
+        mae, tictoc = krr(descriptors, labels, use_tf=False, **kwargs)
+        n_iter = None
+    else:
+        mae, tictoc, n_iter = mixed_krr(descriptors, labels,
+                                        return_iters=True, **kwargs)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on linux.
+    return mae, tictoc, n_iter, (peak_rss - base_rss) / 1024.0
+
+
+def mixed_precision_benchmark(db_path='data',
+                              identifier='CM',
+                              training_sizes=[2000, 4000],
+                              test_size=1000,
+                              sigma=1000.0,
+                              kernel='gaussian',
+                              metric='l2',
+                              regs=[1e-4, 1e-6, 1e-8],
+                              r_seed=111,
+                              show_msgs=True):
+    """
+    Benchmarks the mixed precision solver against the cholesky one on qm7.
+    db_path: path to the database directory.
+    identifier: descriptor to use, 'CM' or 'BOB'.
+    training_sizes: list of training sizes to try.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    regs: list of regularization values, each used by both solvers. The
+        refinement steps (and so the time) of the mixed solver grow as reg
+        gets smaller than its float32 diagonal shift.
+    r_seed: random seed to use for the shuffling.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (training size, reg, solver, refinement steps, mae,
+        time, peak rss in MB).
+    NOTE: each run is done in a new process, the peak rss is the increase
+        of the maximum resident memory over the one after start up.
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed)
+
+    results = []
+    for training_size in training_sizes:
+        for reg in regs:
+            kwargs = {'training_size': training_size,
+                      'test_size': test_size,
+                      'sigma': sigma,
+                      'kernel': kernel,
+                      'metric': metric,
+                      'reg': reg,
+                      'show_msgs': False}
+            for solver in ['cholesky', 'mixed']:
+                with ProcessPoolExecutor(
+                        max_workers=1,
+                        mp_context=get_context('spawn')) as ex:
+                    mae, tictoc, n_iter, rss = ex.submit(_peak_rss_run,
+                                                         solver,
+                                                         descriptors,
+                                                         energy_pbe0,
+                                                         kwargs).result()
+                results.append((training_size, reg, solver, n_iter, mae,
+                                tictoc, rss))
+
+    if show_msgs:
+        printc(f'Mixed precision benchmark (qm7, {identifier}, {kernel}).',
+               'GREEN')
+        for training_size, reg, solver, n_iter, mae, tictoc, rss in results:
+            printc(f'\t{training_size:>6} reg={reg:.0e} {solver:>9}: steps '
+                   f'{n_iter}, MAE {mae:.4f}, {tictoc:.4f} s, peak rss '
+                   f'{rss:.1f} MB', 'CYAN')
+
+    return results
+
+
+def local_benchmark(db_path='data',
+                    identifier='CM',
+                    training_sizes=[2000, 4000, 6000],
+                    test_size=1000,
+                    sigma=1000.0,
+                    kernel='gaussian',
+                    metric='l2',
+                    n_neighbors=[50, 100, 200],
+                    r_seed=111,
+                    show_msgs=True):
+    """
+    Benchmarks the local krr against the global model on qm7.
+    db_path: path to the database directory.
+    identifier: descriptor to use, 'CM' or 'BOB'.
+    training_sizes: list of training sizes to try.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_neighbors: list of numbers of neighbors to try.
+    r_seed: random seed to use for the shuffling.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (training size, model, mae, training time,
+        prediction time per molecule in ms).
+    NOTE: the local model training time is the index building time.
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed)
+    X_te = descriptors[-test_size:]
+    Y_te = energy_pbe0[-test_size:]
+
+    results = []
+    for training_size in training_sizes:
+        model = KRRModel(sigma=sigma, kernel=kernel, metric=metric)
+        tic = time.perf_counter()
+        model.fit(descriptors[:training_size], energy_pbe0[:training_size])
+        fit_time = time.perf_counter() - tic
+        tic = time.perf_counter()
+        Y_pr = model.predict(X_te)
+        predict_time = time.perf_counter() - tic
+        results.append((training_size, 'global',
+                        np.mean(np.abs(Y_pr - Y_te)), fit_time,
+                        1e3*predict_time/test_size))
+
+        for k in n_neighbors:
+            mae, _, times = local_krr(descriptors,
+                                      energy_pbe0,
+                                      training_size=training_size,
+                                      test_size=test_size,
+                                      sigma=sigma,
+                                      kernel=kernel,
+                                      metric=metric,
+                                      n_neighbors=k,
+                                      return_times=True,
+                                      show_msgs=False)
+            results.append((training_size, f'local (k={k})', mae, times[0],
+                            1e3*times[1]/test_size))
+
+    if show_msgs:
+        printc(f'Local krr benchmark (qm7, {identifier}, {kernel}).', 'GREEN')
+        for training_size, name, mae, fit_time, latency in results:
+            printc(f'\t{training_size:>6} {name:>13}: MAE {mae:.4f}, '
+                   f'training {fit_time:.4f} s, {latency:.4f} ms per '
+                   'molecule', 'CYAN')
+
+    return results
+
+
+def dc_benchmark(db_path='data',
+                 identifier='CM',
+                 training_size=6000,
+                 test_size=1000,
+                 sigma=1000.0,
+                 kernel='gaussian',
+                 metric='l2',
+                 n_partitions=[2, 4, 8],
+                 workers=1,
+                 r_seed=111,
+                 show_msgs=True):
+    """
+    Benchmarks the divide-and-conquer krr against the exact one on qm7.
+    db_path: path to the database directory.
+    identifier: descriptor to use, 'CM' or 'BOB'.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_partitions: list of numbers of partitions to try.
+    workers: number of processes for the partitions.
+    r_seed: random seed to use.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (model, mae, wall time).
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed)
+
+    mae, tictoc = krr(descriptors,
+                      energy_pbe0,
+                      training_size=training_size,
+                      test_size=test_size,
+                      sigma=sigma,
+                      kernel=kernel,
+                      metric=metric,
+                      use_tf=False,
+                      show_msgs=False)
+    results = [('exact', mae, tictoc)]
+
+    for P in n_partitions:
+        for partition, combine in [('random', 'average'),
+                                   ('kmeans', 'route')]:
+            mae, tictoc = dc_krr(descriptors,
+                                 energy_pbe0,
+                                 training_size=training_size,
+                                 test_size=test_size,
+                                 sigma=sigma,
+                                 kernel=kernel,
+                                 metric=metric,
+                                 n_partitions=P,
+                                 partition=partition,
+                                 combine=combine,
+                                 workers=workers,
+                                 r_seed=r_seed,
+                                 show_msgs=False)
+            results.append((f'P={P} {partition}/{combine}', mae, tictoc))
+
+    if show_msgs:
+        printc(f'Divide-and-conquer benchmark (qm7, {identifier}, {kernel}, '
+               f'{workers} workers).', 'GREEN')
+        for name, mae, tictoc in results:
+            printc(f'\t{name:>22}: MAE {mae:.4f}, {tictoc:.4f} s', 'CYAN')
+
+    return results
+
+
+def halving_benchmark(db_path='data',
+                      identifier='CM',
+                      sigmas=[10.0, 30.0, 100.0, 300.0, 1000.0, 3000.0],
+                      regs=[1e-8, 1e-6, 1e-4],
+                      kernels=['gaussian', 'laplacian'],
+                      metrics=['l2', 'l1'],
+                      training_size=5000,
+                      validation_size=1000,
+                      r_seed=111,
+                      show_msgs=True):
+    """
+    Benchmarks successive halving against a full grid search on qm7.
+    db_path: path to the database directory.
+    identifier: descriptor to use, 'CM' or 'BOB'.
+    sigmas: list of kernel widths to try.
+    regs: list of regularization values to try.
+    kernels: list of kernels to try.
+    metrics: list of norms to try for the laplacian kernel.
+    training_size: training size of the grid (and of the last round).
+    validation_size: number of molecules used to score.
+    r_seed: random seed to use for the shuffling.
+    show_msgs: if debug messages should be shown.
+    Returns the best grid candidate and its time, and the best successive
+        halving candidate, its time and its rank in the grid.
+    NOTE: the grid computes each distance matrix once and factorizes every
+        candidate at the full training size.
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed)
+    data_size = training_size + validation_size
+    descriptors = descriptors[:data_size]
+    energy_pbe0 = energy_pbe0[:data_size]
+    X_tr = descriptors[:training_size]
+    Y_tr = energy_pbe0[:training_size]
+    X_va = descriptors[-validation_size:]
+    Y_va = energy_pbe0[-validation_size:]
+
+    tic = time.perf_counter()
+    grid = []
+    for kernel in kernels:
+        for metric in (['l2'] if kernel == 'gaussian' else metrics):
+            squared = kernel == 'gaussian'
+            D_tr = distance_matrix(X_tr, X_tr, metric=metric,
+                                   squared=squared)
+            D_va = distance_matrix(X_va, X_tr, metric=metric,
+                                   squared=squared)
+            for sigma in sigmas:
+                for reg in regs:
+                    K_tr = kernel_from_distance(D_tr, sigma, kernel=kernel)
+                    K_tr[np.diag_indices_from(K_tr)] += reg
+                    try:
+                        alpha = LA.cho_solve(LA.cho_factor(K_tr,
+                                                           overwrite_a=True),
+                                             Y_tr)
+                    except LA.LinAlgError:
+                        continue
+                    K_va = kernel_from_distance(D_va, sigma, kernel=kernel)
+                    mae = np.mean(np.abs(np.dot(K_va, alpha) - Y_va))
+                    grid.append({'kernel': kernel,
+                                 'metric': metric,
+                                 'sigma': sigma,
+                                 'reg': reg,
+                                 'mae': float(mae)})
+    grid_time = time.perf_counter() - tic
+    grid_best = min(grid, key=lambda c: c['mae'])
+
+    tic = time.perf_counter()
+    sh_best, _ = successive_halving(descriptors,
+                                    energy_pbe0,
+                                    sigmas,
+                                    regs=regs,
+                                    kernels=kernels,
+                                    metrics=metrics,
+                                    training_size=training_size,
+                                    validation_size=validation_size,
+                                    show_msgs=False)
+    sh_time = time.perf_counter() - tic
+
+    # Position of the successive halving choice in the full grid ranking.
+    grid.sort(key=lambda c: c['mae'])
+    sh_rank = next((i + 1 for i, c in enumerate(grid)
+                    if all(c[k] == sh_best[k] for k in ['kernel', 'metric',
+                                                        'sigma', 'reg'])),
+                   None)
+
+    if show_msgs:
+        printc(f'Successive halving benchmark (qm7, {identifier}).', 'GREEN')
+        printc(f'\tGrid ({len(grid)} candidates): {grid_best}, '
+               f'{grid_time:.4f} s', 'CYAN')
+        printc(f'\tSuccessive halving: {sh_best}, {sh_time:.4f} s, '
+               f'rank {sh_rank} in the grid', 'CYAN')
+
+    return grid_best, grid_time, sh_best, sh_time, sh_rank
+
+
+def duplicates_benchmark(db_path='data',
+                         db='qm7',
+                         identifiers=['CM', 'BOB'],
+                         eps_values=[0.0, 1e-6, 1e-3, 1e-2],
+                         r_seed=111,
+                         show_msgs=True):
+    """
+    Reports how much the data size shrinks collapsing duplicated descriptors.
+    db_path: path to the database directory.
+    db: database to use, 'qm7' or 'qm9'.
+    identifiers: list of descriptors to use, 'CM' or 'BOB'.
+    eps_values: list of tolerances to try, see collapse_duplicates.
+    r_seed: random seed to use for the shuffling.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (descriptor, eps, data size, collapsed size, biggest
+        group, time).
+    """
+    results = []
+    for identifier in identifiers:
+        if db == 'qm7':
+            descriptors, labels = _qm7_descriptors(db_path=db_path,
+                                                   identifier=identifier,
+                                                   r_seed=r_seed)
+        elif db == 'qm9':
+            descriptors, labels = _qm9_descriptors(db_path=db_path,
+                                                   identifier=identifier,
+                                                   r_seed=r_seed)
+        else:
+            raise ValueError(f'{db} database not found.')
+
+        for eps in eps_values:
+            tic = time.perf_counter()
+            _, _, weights, _ = collapse_duplicates(descriptors, labels,
+                                                   eps=eps)
+            tictoc = time.perf_counter() - tic
+            results.append((identifier, eps, descriptors.shape[0],
+                            weights.shape[0], int(weights.max()), tictoc))
+
+    if show_msgs:
+        printc(f'Duplicates benchmark ({db}).', 'GREEN')
+        for identifier, eps, size, new_size, biggest, tictoc in results:
+            printc(f'\t{identifier:>4} eps={eps:.0e}: {size} -> {new_size} '
+                   f'({100*(size - new_size)/size:.2f}% less), biggest group '
+                   f'{biggest}, {tictoc:.4f} s', 'CYAN')
+
+    return results
+
+
+def pca_benchmark(db_path='data',
+                  identifier='CM',
+                  training_size=4000,
+                  test_size=1000,
+                  sigma=1000.0,
+                  ranks=[10, 25, 50, 100],
+                  method='randomized',
+                  r_seed=111,
+                  show_msgs=True):
+    """
+    Benchmarks the kernel time and mae of projected matrix descriptors.
+    db_path: path to the database directory.
+    identifier: matrix descriptor to use, 'CM', 'LJM' or 'AM' (flattened).
+    training_size: size of the training set to use.
+    test_size: size of the test set to use.
+    sigma: depth of the kernel.
+    ranks: list of projection ranks to try.
+    method: 'randomized' or 'incremental' fit of the projection.
+    r_seed: random seed to use for the shuffling.
+    show_msgs: if debug messages should be shown.
+    Returns a list of (rank, projection fit time, kernel time, mae), the
+        first one without projection (rank None).
+    NOTE: the kernel time is the training kernel build, distance_matrix
+        plus kernel_from_distance.
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed,
+                                                as_eig=False)
+    X_tr = descriptors[:training_size]
+    X_te = descriptors[-test_size:]
+    Y_tr = energy_pbe0[:training_size]
+    Y_te = energy_pbe0[-test_size:]
+
+    results = []
+    for rank in [None] + ranks:
+        tic = time.perf_counter()
+        if rank is None:
+            Z_tr = X_tr
+            Z_te = X_te
+        else:
+            projection = PCAProjection(rank, method=method, r_seed=r_seed)
+            Z_tr = projection.fit_transform(X_tr)
+            Z_te = projection.transform(X_te)
+        fit_time = time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        K_tr = distance_matrix(Z_tr, Z_tr, squared=True)
+        kernel_from_distance(K_tr, sigma, out=K_tr)
+        kernel_time = time.perf_counter() - tic
+
+        K_tr[np.diag_indices_from(K_tr)] += 1e-8
+        alpha = LA.cho_solve(LA.cho_factor(K_tr, overwrite_a=True), Y_tr)
+        K_te = distance_matrix(Z_te, Z_tr, squared=True)
+        kernel_from_distance(K_te, sigma, out=K_te)
+        mae = np.mean(np.abs(np.dot(K_te, alpha) - Y_te))
+        results.append((rank, fit_time, kernel_time, mae))
+
+    if show_msgs:
+        printc(f'PCA benchmark (qm7, {identifier} matrix, '
+               f'{descriptors[0].size} dimensions, {method}).', 'GREEN')
+        for rank, fit_time, kernel_time, mae in results:
+            printc(f'\trank {str(rank):>4}: fit {fit_time:.4f} s, kernel '
+                   f'{kernel_time:.4f} s, MAE {mae:.4f}', 'CYAN')
+
+    return results
+
+
+def descriptors_benchmark(db_path='data',
+                          identifiers=['CM', 'LJM', 'AM', 'BOB'],
+                          workers_list=[1, 2, 4],
+                          r_seed=111,
+                          show_msgs=True):
+    """
+    Benchmarks the descriptors calculation, serial loop against the pool.
+    db_path: path to the database directory.
+    identifiers: list of names (strings) of descriptors to calculate.
+    workers_list: list of numbers of workers to try with gen_descriptors.
+    r_seed: random seed to use for the shuffling.
+    show_msgs: if debug messages should be shown.
+    Returns the time of the serial loop (Compound methods plus the final
+        np.array copy) and a list of (workers, time).
+    NOTE: the matrices are unsorted and not flattened (as BOB needs them).
+    """
+    compounds, _, _ = qm7db(db_path=db_path,
+                            r_seed=r_seed,
+                            use_tf=False)
+
+    tic = time.perf_counter()
+    for compound in compounds:
+        if 'CM' in identifiers or 'BOB' in identifiers:
+            compound.gen_cm(flatten=False,
+                            as_eig=False)
+        if 'LJM' in identifiers:
+            compound.gen_ljm(flatten=False,
+                             as_eig=False)
+        if 'AM' in identifiers:
+            compound.gen_hd()
+            compound.gen_am(flatten=False)
+        if 'BOB' in identifiers:
+            compound.gen_bob()
+    reference = {identifier: np.array([getattr(comp, identifier.lower())
+                                       for comp in compounds],
+                                      dtype=np.float64)
+                 for identifier in identifiers}
+    serial_time = time.perf_counter() - tic
+
+    results = []
+    for workers in workers_list:
+        tic = time.perf_counter()
+        descriptors, shms = gen_descriptors(compounds,
+                                            identifiers=identifiers,
+                                            flatten=False,
+                                            as_eig=False,
+                                            workers=workers,
+                                            show_msgs=False)
+        tictoc = time.perf_counter() - tic
+        try:
+            for identifier in identifiers:
+                if not np.array_equal(descriptors[identifier],
+                                      reference[identifier]):
+                    raise ValueError(f'{identifier} descriptors differ '
+                                     'from the serial loop.')
+        finally:
+            release_descriptors(descriptors, shms)
+        results.append((workers, tictoc))
+
+    if show_msgs:
+        data_size = len(compounds)
+        printc(f'Descriptors benchmark (qm7, {data_size} compounds, '
+               f'{", ".join(identifiers)}).', 'GREEN')
+        printc(f'\tserial loop: {serial_time:.4f} s, '
+               f'{data_size/serial_time:.1f} compounds/s', 'CYAN')
+        for workers, tictoc in results:
+            printc(f'\t{workers} workers: {tictoc:.4f} s, '
+                   f'{data_size/tictoc:.1f} compounds/s', 'CYAN')
+
+    return serial_time, results
+
+
+def kernel_cache_benchmark(db_path='data',
+                           identifier='CM',
+                           data_size=5000,
+                           training_size=2000,
+                           test_size=1000,
+                           n_splits=4,
+                           regs=[1e-8, 1e-4],
+                           sigma=1000.0,
+                           kernel='gaussian',
+                           metric='l2',
+                           cache_dir=None,
+                           r_seed=111,
+                           show_msgs=True):
+    """
+    Benchmarks reruns of krr over random splits and regs with a kernel cache.
+    db_path: path to the database directory.
+    identifier: matrix descriptor to use, 'CM', 'LJM' or 'AM' (flattened).
+    data_size: number of molecules used (the full kernel is of this size).
+    training_size: size of each training set, drawn from the molecules
+        before the test set.
+    test_size: size of the test set (the last molecules).
+    n_splits: number of random training sets.
+    regs: list of regularizations tried for each training set.
+    sigma: depth of the kernel.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    cache_dir: directory for the kernels, in memory if None.
+    r_seed: random seed to use for the shuffling and the splits.
+    show_msgs: if debug messages should be shown.
+    Returns the total time without and with the cache and the largest mae
+        difference between both.
+    """
+    descriptors, energy_pbe0 = _qm7_descriptors(db_path=db_path,
+                                                identifier=identifier,
+                                                r_seed=r_seed,
+                                                as_eig=False)
+    descriptors = descriptors[:data_size]
+    energy_pbe0 = energy_pbe0[:data_size]
+
+    rng = np.random.default_rng(r_seed)
+    splits = [rng.choice(data_size - test_size, training_size, replace=False)
+              for _ in range(n_splits)]
+    cache = KernelCache(cache_dir=cache_dir)
+
+    times = [0.0, 0.0]
+    max_diff = 0.0
+    for split in splits:
+        for reg in regs:
+            maes = []
+            for i, kernel_cache in enumerate([None, cache]):
+                tic = time.perf_counter()
+                mae, _ = krr(descriptors,
+                             energy_pbe0,
+                             test_size=test_size,
+                             sigma=sigma,
+                             kernel=kernel,
+                             metric=metric,
+                             reg=reg,
+                             training_indices=split,
+                             kernel_cache=kernel_cache,
+                             use_tf=False,
+                             show_msgs=False)
+                times[i] += time.perf_counter() - tic
+                maes.append(mae)
+            max_diff = max(max_diff, abs(maes[0] - maes[1]))
+
+    if show_msgs:
+        printc(f'Kernel cache benchmark (qm7, {identifier} matrix, {kernel} '
+               f'kernel, {n_splits} splits x {len(regs)} regs).', 'GREEN')
+        printc(f'\tno cache: {times[0]:.4f} s', 'CYAN')
+        printc(f'\tcache: {times[1]:.4f} s, max MAE difference '
+               f'{max_diff:.2e}', 'CYAN')
+        cache.summary()
+
+    return times[0], times[1], max_diff
+
+
+def pipeline_benchmark(db_path='data',
+                       identifiers=['CM', 'LJM', 'AM', 'BOB'],
+                       training_size=1500,
+                       test_size=1500,
+                       batch_size=512,
+                       workers=1,
+                       show_msgs=True):
+    """
+    Benchmarks the end-to-end time of multi_krr, sequential and pipelined.
+    db_path: path to the database directory (qm7).
+    identifiers: list of names (strings) of descriptors to use.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use.
+    batch_size: number of molecules per batch of the pipeline.
+    workers: number of processes for the descriptors.
+    show_msgs: if debug messages should be shown.
+    Returns a dictionary of run name: wall time, and the largest mae
+        difference against the sequential run.
+    NOTE: the matrices aren't eigenvalues nor flattened, so BOB can use the
+        CM. The 'single batch' run has the pipeline with only one batch, so
+        nothing overlaps but, as every pipelined run, only the training and
+        test molecules are read.
+    """
+    kwargs = {'db_path': db_path,
+              'identifiers': identifiers,
+              'as_eig': False,
+              'flatten': False,
+              'training_size': training_size,
+              'test_size': test_size,
+              'workers': workers,
+              'show_msgs': False}
+    runs = [('sequential', multi_krr, {'use_tf': False}),
+            ('single batch', pipelined_multi_krr,
+             {'batch_size': training_size + test_size}),
+            ('pipelined', pipelined_multi_krr, {'batch_size': batch_size}),
+            ('pipelined, concurrent fits', pipelined_multi_krr,
+             {'batch_size': batch_size, 'concurrent_fits': True})]
+
+    times = dict()
+    maes = dict()
+    for name, function, extra in runs:
+        tic = time.perf_counter()
+        results = function(**kwargs, **extra)
+        times[name] = time.perf_counter() - tic
+        maes[name] = results
+
+    max_diff = max(abs(maes[name][identifier][0] -
+                       maes['sequential'][identifier][0])
+                   for name in maes for identifier in identifiers)
+
+    if show_msgs:
+        printc(f'Pipeline benchmark (qm7, {", ".join(identifiers)}, '
+               f'{training_size} training, {test_size} test, {workers} '
+               'workers).', 'GREEN')
+        for name, tictoc in times.items():
+            printc(f'\t{name}: {tictoc:.4f} s', 'CYAN')
+        printc(f'\tmax MAE difference: {max_diff:.2e}', 'CYAN')
+
+    return times, max_diff
@@ -0,0 +1,393 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from ml_exp.misc import printc
+from ml_exp.kernels import kernel_matrix
+
+# Descriptor parameters each descriptor depends on (see gen_descriptors).
+DESCRIPTOR_PARAMS = {'CM': ['size', 'sort', 'flatten', 'as_eig', 'bohr_ru'],
+                     'LJM': ['diag_value', 'lj_sigma', 'lj_epsilon', 'size',
+                             'sort', 'flatten', 'as_eig', 'bohr_ru'],
+                     'AM': ['use_forces', 'size', 'sort', 'flatten',
+                            'bohr_ru'],
+                     'BOB': ['acount', 'size', 'sort', 'flatten', 'as_eig',
+                             'bohr_ru']}
+
+
+def dataset_fingerprint(compounds):
+    """
+    Hashes the content of a list of compounds, in order.
+    compounds: list of Compound objects.
+    Returns the hex digest (sha256) of the atoms, nuclear charges and
+        coordinates of all compounds.
+    NOTE: the order is part of the fingerprint, so a different shuffling
+        gives a different one.
+    """
+    h = hashlib.sha256()
+    for compound in compounds:
+        h.update(' '.join(compound.atoms).encode())
+        h.update(np.ascontiguousarray(compound.nc, dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(compound.coordinates,
+                                      dtype=np.float64).tobytes())
+
+    return h.hexdigest()
+
+
+def descriptor_key(fingerprint,
+                   identifier,
+                   params,
+                   with_cm=False):
+    """
+    Creates the cache key of one descriptor array.
+    fingerprint: dataset fingerprint (see dataset_fingerprint).
+    identifier: name of the descriptor.
+    params: dictionary of descriptor parameters (see gen_descriptors). Only
+        the ones the descriptor depends on are used.
+    with_cm: if the CM is calculated too, only used by BOB (it then uses the
+        CM parameters instead of the plain matrix).
+    Returns the hex digest (sha256) of the key.
+    """
+    used = {name: params[name] for name in DESCRIPTOR_PARAMS[identifier]}
+    if identifier == 'BOB':
+        used['with_cm'] = with_cm
+    key = json.dumps([fingerprint, identifier, used],
+                     sort_keys=True,
+                     default=str)
+
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ArrayCache:
+    """
+    On disk store of arrays, addressed by content keys.
+    """
+    def __init__(self,
+                 cache_dir,
+                 max_bytes=2**30,
+                 name='Array'):
+        """
+        Initialization of the cache.
+        cache_dir: directory of the cache, created if needed.
+        max_bytes: size limit of the stored arrays, the least recently used
+            ones are removed when it is exceeded.
+        name: name of the cache, for the messages.
+        NOTE: each array is a .npy file named by its key, its modification
+            time is the last use, so several processes can share a cache.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self,
+              key):
+        """
+        Path of the file of a key.
+        key: cache key.
+        """
+        return os.path.join(self.cache_dir, f'{key}.npy')
+
+    def get(self,
+            key):
+        """
+        Gets a stored array.
+        key: cache key.
+        Returns the array, memory mapped copy-on-write (writes aren't
+            stored), or None if the key isn't stored.
+        """
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode='c')
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return array
+
+    def put(self,
+            key,
+            array):
+        """
+        Stores an array, then removes the least recently used arrays over
+        the size limit.
+        key: cache key.
+        array: array to store.
+        NOTE: arrays bigger than the limit aren't stored.
+        """
+        array = np.asarray(array)
+        if array.nbytes > self.max_bytes:
+            return
+
+        # Written to a temporary file first, so readers never see it partial.
+        fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        Lists the stored arrays.
+        Returns a list of (last use, size, path), least recently used first.
+        """
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith('.npy') or fname.startswith('tmp'):
+                continue
+            path = os.path.join(self.cache_dir, fname)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        return sorted(entries)
+
+    def evict(self,
+              keep=None):
+        """
+        Removes the least recently used arrays until the size limit is met.
+        keep: key that isn't removed (the one just stored).
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        keep_path = None if keep is None else self._path(keep)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def size(self):
+        """
+        Total size in bytes of the stored arrays.
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def summary(self):
+        """
+        Prints the hits, misses and evictions since the initialization.
+        """
+        printc(f'{self.name} cache: {self.hits} hits, {self.misses} misses, '
+               f'{self.evictions} evictions, {self.size()/2**20:.1f} MiB '
+               f'in {self.cache_dir}.', 'CYAN')
+
+
+class DescriptorCache(ArrayCache):
+    """
+    On disk store of descriptor arrays, see gen_descriptors.
+    """
+    def __init__(self,
+                 cache_dir,
+                 max_bytes=2**30):
+        """
+        Initialization of the cache.
+        cache_dir: directory of the cache, created if needed.
+        max_bytes: size limit of the stored arrays.
+        """
+        super().__init__(cache_dir,
+                         max_bytes=max_bytes,
+                         name='Descriptor')
+
+
+def array_fingerprint(X):
+    """
+    Hashes the content of an array.
+    X: array (or tensor) to hash.
+    Returns the hex digest (blake2b) of the shape, dtype and values.
+    """
+    X = np.ascontiguousarray(X)
+    h = hashlib.blake2b(digest_size=32)
+    h.update(f'{X.shape} {X.dtype.str}'.encode())
+    h.update(memoryview(X).cast('B'))
+
+    return h.hexdigest()
+
+
+class KernelCache:
+    """
+    Store of full dataset kernel matrices, serving blocks of them.
+    """
+    def __init__(self,
+                 max_bytes=2**30,
+                 cache_dir=None):
+        """
+        Initialization of the cache.
+        max_bytes: size limit of the stored kernels, the least recently used
+            ones are removed when it is exceeded.
+        cache_dir: if given, the kernels are stored there (memory mapped
+            when used) instead of in memory.
+        NOTE: the kernels are keyed by the fingerprint of the descriptors
+            (see array_fingerprint), the kernel, metric and sigma.
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypasses = 0
+        self._memory = OrderedDict()
+        self._store = None
+        if cache_dir is not None:
+            self._store = ArrayCache(cache_dir,
+                                     max_bytes=max_bytes,
+                                     name='Kernel')
+
+    def key(self,
+            X,
+            sigma,
+            kernel='gaussian',
+            metric='l2'):
+        """
+        Creates the cache key of a kernel.
+        X: array of descriptors (all the dataset).
+        sigma: kernel width.
+        kernel: which kernel to use.
+        metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+        Returns the hex digest (sha256) of the key.
+        """
+        if kernel != 'laplacian':
+            metric = None
+        key = json.dumps([array_fingerprint(X), kernel, metric,
+                          float(sigma)])
+
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def kernel(self,
+               X,
+               sigma,
+               kernel='gaussian',
+               metric='l2'):
+        """
+        Gets the kernel matrix of all the descriptors, calculating it if it
+        isn't stored.
+        X: array of descriptors (all the dataset).
+        sigma: kernel width.
+        kernel: which kernel to use.
+        metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+        Returns the (data size, data size) kernel matrix. It shouldn't be
+            modified, it is shared by every later use.
+        """
+        key = self.key(X, sigma, kernel=kernel, metric=metric)
+        if self._store is not None:
+            K = self._store.get(key)
+            if K is None:
+                self.misses += 1
+                K = kernel_matrix(X, X, sigma, kernel=kernel, metric=metric)
+                self._store.put(key, K)
+                self.evictions = self._store.evictions
+            else:
+                self.hits += 1
+            return K
+
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+
+        self.misses += 1
+        K = kernel_matrix(X, X, sigma, kernel=kernel, metric=metric)
+        K.flags.writeable = False
+        self._memory[key] = K
+        total = sum(M.nbytes for M in self._memory.values())
+        while total > self.max_bytes and len(self._memory) > 1:
+            _, M = self._memory.popitem(last=False)
+            total -= M.nbytes
+            self.evictions += 1
+
+        return K
+
+    def blocks(self,
+               X,
+               index_pairs,
+               sigma,
+               kernel='gaussian',
+               metric='l2'):
+        """
+        Gets blocks of the kernel matrix of all the descriptors.
+        X: array of descriptors (all the dataset).
+        index_pairs: list of (rows, cols) of each block, as arrays or slices.
+        sigma: kernel width.
+        kernel: which kernel to use.
+        metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+        Returns a list of new (writable) arrays with the blocks.
+        NOTE: if the full kernel doesn't fit in max_bytes, the blocks are
+            calculated directly and nothing is stored.
+        """
+        data_size = X.shape[0]
+        if data_size**2 * 8 > self.max_bytes:
+            self.bypasses += 1
+            return [kernel_matrix(X[rows], X[cols], sigma,
+                                  kernel=kernel, metric=metric)
+                    for rows, cols in index_pairs]
+
+        K = self.kernel(X, sigma, kernel=kernel, metric=metric)
+        out = []
+        for rows, cols in index_pairs:
+            if isinstance(rows, slice) and isinstance(cols, slice):
+                out.append(np.array(K[rows, cols]))
+            else:
+                rows = np.arange(data_size)[rows]
+                cols = np.arange(data_size)[cols]
+                out.append(K[np.ix_(rows, cols)])
+
+        return out
+
+    def size(self):
+        """
+        Total size in bytes of the stored kernels.
+        """
+        if self._store is not None:
+            return self._store.size()
+
+        return sum(K.nbytes for K in self._memory.values())
+
+    def summary(self):
+        """
+        Prints the hits, misses and evictions since the initialization.
+        """
+        where = 'memory' if self.cache_dir is None else self.cache_dir
+        printc(f'Kernel cache: {self.hits} hits, {self.misses} misses, '
+               f'{self.evictions} evictions, {self.bypasses} bypasses, '
+               f'{self.size()/2**20:.1f} MiB in {where}.', 'CYAN')
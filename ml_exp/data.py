@@ -160,3 +160,10 @@ POSSIBLE_BONDS = {cc_bond: (1.19, 1.54, 1.0),
                   co_bond: (1.43, 2.15, 0.8),
                   cn_bond: (1.47, 2.19, 1.0),
                   cs_bond: (1.81, 2.55, 0.7)}
+
+"""
+NOTE: Names of the properties stored in the comment line of each qm9
+    compound, in the same order as 'Compound.qm9prop'.
+"""
+QM9_PROPERTIES = ['A', 'B', 'C', 'mu', 'alpha', 'homo', 'lumo', 'gap', 'r2',
+                  'zpve', 'U0', 'U', 'H', 'G', 'Cv']
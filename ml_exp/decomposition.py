@@ -0,0 +1,191 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import numpy as np
+from scipy import linalg as LA
+
+
+class PCAProjection:
+    def __init__(self,
+                 n_components,
+                 method='randomized',
+                 n_oversamples=10,
+                 n_iter=2,
+                 batch_size=4096,
+                 r_seed=111):
+        """
+        Linear projection of the descriptors onto their principal components.
+        n_components: rank (k) of the projection.
+        method: 'randomized' (randomized svd, Halko et al.) or 'incremental'
+            (updated batch by batch, see partial_fit).
+        n_oversamples: extra random vectors of the randomized svd, and
+            extra components kept between the batches of the incremental
+            method.
+        n_iter: power iterations of the randomized svd.
+        batch_size: number of molecules per chunk. Descriptors are read one
+            chunk at a time, so they can be memory-mapped.
+        r_seed: random seed for the randomized svd.
+        NOTE: 2D descriptors (matrices) are flattened. This doesn't work
+            with tensorflow.
+        """
+        if method not in ['randomized', 'incremental']:
+            raise TypeError(f'{method} method not found.')
+
+        self.n_components = n_components
+        self.method = method
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.batch_size = batch_size
+        self.r_seed = r_seed
+
+        self.mean = None
+        self.components = None
+        self.singular_values = None
+        self.n_samples = 0
+        self._basis = None
+        self._scales = None
+
+    def _chunks(self,
+                size):
+        """
+        Yields the (start, end) of each chunk of molecules.
+        size: number of molecules.
+        """
+        for i in range(0, size, self.batch_size):
+            yield i, min(i + self.batch_size, size)
+
+    def fit(self,
+            descriptors):
+        """
+        Fits the projection.
+        descriptors: array of descriptors.
+        """
+        if self.method == 'incremental':
+            self.mean = None
+            self.components = None
+            self.singular_values = None
+            self.n_samples = 0
+            X = descriptors.reshape(descriptors.shape[0], -1)
+            for i, i_end in self._chunks(X.shape[0]):
+                self.partial_fit(X[i:i_end])
+            return self
+
+        X = descriptors.reshape(descriptors.shape[0], -1)
+        size, n_dims = X.shape
+        k = min(self.n_components + self.n_oversamples, n_dims, size)
+
+        self.mean = np.zeros(n_dims, dtype=np.float64)
+        for i, i_end in self._chunks(size):
+            self.mean += np.sum(X[i:i_end], axis=0)
+        self.mean /= size
+
+        def dot(M):
+            # (X - mean) M, chunk by chunk.
+            out = np.empty((size, M.shape[1]), dtype=np.float64)
+            for i, i_end in self._chunks(size):
+                out[i:i_end] = np.dot(X[i:i_end] - self.mean, M)
+            return out
+
+        def t_dot(M):
+            # (X - mean)^T M, chunk by chunk.
+            out = np.zeros((n_dims, M.shape[1]), dtype=np.float64)
+            for i, i_end in self._chunks(size):
+                out += np.dot((X[i:i_end] - self.mean).T, M[i:i_end])
+            return out
+
+        # Orthonormal basis Q of the range of X - mean, refined with power
+        # iterations, then the small svd of Q^T (X - mean).
+        rng = np.random.default_rng(self.r_seed)
+        Q, _ = LA.qr(dot(rng.standard_normal((n_dims, k))), mode='economic')
+        for _ in range(self.n_iter):
+            Q, _ = LA.qr(t_dot(Q), mode='economic')
+            Q, _ = LA.qr(dot(Q), mode='economic')
+        _, S, Vt = LA.svd(t_dot(Q).T, full_matrices=False)
+
+        self.components = Vt[:self.n_components]
+        self.singular_values = S[:self.n_components]
+        self.n_samples = size
+
+        return self
+
+    def partial_fit(self,
+                    descriptors):
+        """
+        Updates the projection with a new batch of descriptors.
+        descriptors: array of descriptors.
+        NOTE: the svd of the current components (scaled by their singular
+            values), the centered batch and a mean correction row gives the
+            updated components, as in Ross et al. incremental pca.
+        """
+        X = np.asarray(descriptors,
+                       dtype=np.float64).reshape(descriptors.shape[0], -1)
+        size = X.shape[0]
+        batch_mean = np.mean(X, axis=0)
+
+        if self.mean is None:
+            A = X - batch_mean
+            self.mean = batch_mean
+        else:
+            n = self.n_samples
+            correction = np.sqrt(n * size / (n + size)) * \
+                (self.mean - batch_mean)
+            A = np.vstack([self._scales[:, np.newaxis] * self._basis,
+                           X - batch_mean,
+                           correction])
+            self.mean = (n * self.mean + size * batch_mean) / (n + size)
+
+        # n_oversamples extra components are kept between batches, so the
+        # last ones of the rank k projection are accurate.
+        _, S, Vt = LA.svd(A, full_matrices=False)
+        k = self.n_components + self.n_oversamples
+        self._basis = Vt[:k]
+        self._scales = S[:k]
+        self.components = Vt[:self.n_components]
+        self.singular_values = S[:self.n_components]
+        self.n_samples += size
+
+        return self
+
+    def transform(self,
+                  descriptors):
+        """
+        Projects the descriptors onto the principal components.
+        descriptors: array of descriptors.
+        """
+        if self.components is None:
+            raise ValueError('The projection hasn\'t been fitted.')
+
+        X = descriptors.reshape(descriptors.shape[0], -1)
+        Z = np.empty((X.shape[0], self.components.shape[0]),
+                     dtype=np.float64)
+        for i, i_end in self._chunks(X.shape[0]):
+            Z[i:i_end] = np.dot(X[i:i_end] - self.mean, self.components.T)
+
+        return Z
+
+    def fit_transform(self,
+                      descriptors):
+        """
+        Fits the projection and projects the descriptors.
+        descriptors: array of descriptors.
+        """
+        return self.fit(descriptors).transform(descriptors)
@@ -0,0 +1,342 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from ml_exp.misc import printc
+from ml_exp.cache import dataset_fingerprint, descriptor_key
+from ml_exp.representations import coulomb_matrix, lennard_jones_matrix,\
+    get_helping_data, adjacency_matrix, bag_of_bonds
+
+IDENTIFIERS = ['CM', 'LJM', 'AM', 'BOB']
+
+
+def descriptor_params(diag_value=None,
+                      lj_sigma=1.0,
+                      lj_epsilon=1.0,
+                      use_forces=False,
+                      acount={'C':7, 'H':16, 'N':3, 'O':3, 'S':1},
+                      size=23,
+                      sort=False,
+                      flatten=True,
+                      as_eig=True,
+                      bohr_ru=False):
+    """
+    Collects the descriptor parameters (see gen_descriptors) in a dictionary.
+    """
+    return {'diag_value': diag_value,
+            'lj_sigma': lj_sigma,
+            'lj_epsilon': lj_epsilon,
+            'use_forces': use_forces,
+            'acount': acount,
+            'size': size,
+            'sort': sort,
+            'flatten': flatten,
+            'as_eig': as_eig,
+            'bohr_ru': bohr_ru}
+
+
+def compound_descriptors(compound,
+                         identifiers,
+                         params,
+                         tictocs=None):
+    """
+    Calculates the descriptors of one compound, without storing them.
+    compound: Compound object.
+    identifiers: list of names (strings) of descriptors to calculate.
+    params: dictionary of descriptor parameters (see gen_descriptors).
+    tictocs: dictionary where the time spent on each descriptor is added.
+    Returns a dictionary of identifier: descriptor.
+    """
+    p = params
+    out = dict()
+    cm = None
+    for identifier in identifiers:
+        tic = time.perf_counter()
+        if identifier == 'CM':
+            cm = coulomb_matrix(compound.coordinates,
+                                compound.nc,
+                                size=p['size'],
+                                sort=p['sort'],
+                                flatten=p['flatten'],
+                                as_eig=p['as_eig'],
+                                bohr_ru=p['bohr_ru'])
+            out['CM'] = cm
+        elif identifier == 'LJM':
+            out['LJM'] = lennard_jones_matrix(compound.coordinates,
+                                              compound.nc,
+                                              diag_value=p['diag_value'],
+                                              sigma=p['lj_sigma'],
+                                              epsilon=p['lj_epsilon'],
+                                              size=p['size'],
+                                              sort=p['sort'],
+                                              flatten=p['flatten'],
+                                              as_eig=p['as_eig'],
+                                              bohr_ru=p['bohr_ru'])
+        elif identifier == 'AM':
+            _, _, bonds_i, bonds_k, bonds_f = \
+                get_helping_data(compound.coordinates,
+                                 compound.atoms,
+                                 compound.nc,
+                                 size=p['size'],
+                                 bohr_ru=p['bohr_ru'])
+            out['AM'] = adjacency_matrix(bonds_i,
+                                         bonds_k,
+                                         bonds_f,
+                                         use_forces=p['use_forces'],
+                                         size=p['size'],
+                                         sort=p['sort'],
+                                         flatten=p['flatten'])
+        elif identifier == 'BOB':
+            # Like Compound.gen_bob it uses the CM when it was created (and
+            # fails the same way if it's eigenvalues or flattened). Unlike
+            # it, without CM the plain (unsorted) matrix is built instead of
+            # raising.
+            if cm is None:
+                cm = coulomb_matrix(compound.coordinates,
+                                    compound.nc,
+                                    size=p['size'],
+                                    flatten=False,
+                                    as_eig=False,
+                                    bohr_ru=p['bohr_ru'])
+            out['BOB'] = bag_of_bonds(cm,
+                                      compound.atoms,
+                                      sort=p['sort'],
+                                      acount=p['acount'])
+        else:
+            raise TypeError(f'{identifier} descriptor not supported.')
+        if tictocs is not None:
+            tictocs[identifier] = tictocs.get(identifier, 0.0) + \
+                time.perf_counter() - tic
+
+    return out
+
+
+def fill_descriptors(compounds,
+                     start,
+                     identifiers,
+                     params,
+                     outputs):
+    """
+    Writes the descriptors of a chunk of compounds into the output arrays.
+    compounds: list of Compound objects of the chunk.
+    start: row of the output arrays for the first compound.
+    identifiers: list of names (strings) of descriptors to calculate.
+    params: dictionary of descriptor parameters (see gen_descriptors).
+    outputs: dictionary of identifier: array, or identifier: (shared memory
+        name, shape) when called in a worker.
+    Returns the dictionary of time spent on each descriptor.
+    """
+    shms = []
+    arrays = dict()
+    for identifier, out in outputs.items():
+        if isinstance(out, tuple):
+            shm = shared_memory.SharedMemory(name=out[0])
+            shms.append(shm)
+            out = np.ndarray(out[1], dtype=np.float64, buffer=shm.buf)
+        arrays[identifier] = out
+
+    tictocs = dict()
+    try:
+        for i, compound in enumerate(compounds):
+            values = compound_descriptors(compound,
+                                          identifiers,
+                                          params,
+                                          tictocs=tictocs)
+            for identifier, value in values.items():
+                arrays[identifier][start + i] = value
+    finally:
+        del arrays
+        for shm in shms:
+            shm.close()
+
+    return tictocs
+
+
+def gen_descriptors(compounds,
+                    identifiers=['CM'],
+                    diag_value=None,
+                    lj_sigma=1.0,
+                    lj_epsilon=1.0,
+                    use_forces=False,
+                    acount={'C':7, 'H':16, 'N':3, 'O':3, 'S':1},
+                    size=23,
+                    sort=False,
+                    flatten=True,
+                    as_eig=True,
+                    bohr_ru=False,
+                    workers=1,
+                    chunks_per_worker=4,
+                    cache=None,
+                    show_msgs=True):
+    """
+    Calculates the descriptors of all compounds into preallocated arrays.
+    compounds: list of Compound objects.
+    identifiers: list of names (strings) of descriptors to calculate.
+    diag_value: if special diagonal value is to be used.
+    lj_sigma: sigma value.
+    lj_epsilon: epsilon value.
+    use_forces: if the use of forces instead of k_cx should be used.
+    acount: atom count for the compound, defaults to qm7 sizes.
+    size: compound size.
+    sort: if the representation should be sorted row-norm or bag-wise.
+    flatten: if the representation should be 1D.
+    as_eig: if the representation should be as the eigenvalues.
+    bohr_ru: if radius units should be in bohr's radius units.
+    workers: number of processes. With more than one, the arrays are
+        allocated in shared memory and each worker writes its rows there.
+    chunks_per_worker: number of chunks of compounds per worker.
+    cache: DescriptorCache where the descriptors are looked up (by the
+        content of the compounds and the parameters) and stored.
+    show_msgs: if debug messages should be shown.
+    Returns the dictionary of identifier: array of descriptors and the list
+        of shared memory blocks behind them (empty for one worker).
+    NOTE: the shared memory blocks have to be released with
+        release_descriptors once the arrays aren't needed anymore. The
+        Compound objects aren't modified. Cached arrays are memory mapped
+        copy-on-write. BOB uses the CM when it is also asked for; without
+        it, BOB now works on its own (the baseline multi_krr raised) by
+        building the plain, unsorted CM it needs.
+    """
+    if type(identifiers) != list:
+        raise TypeError('\'identifiers\' is not a list.')
+
+    tic = time.perf_counter()
+    data_size = len(compounds)
+    params = descriptor_params(diag_value=diag_value,
+                               lj_sigma=lj_sigma,
+                               lj_epsilon=lj_epsilon,
+                               use_forces=use_forces,
+                               acount=acount,
+                               size=size,
+                               sort=sort,
+                               flatten=flatten,
+                               as_eig=as_eig,
+                               bohr_ru=bohr_ru)
+
+    cached = dict()
+    keys = dict()
+    if cache is not None:
+        fingerprint = dataset_fingerprint(compounds)
+        for identifier in identifiers:
+            keys[identifier] = descriptor_key(fingerprint,
+                                              identifier,
+                                              params,
+                                              with_cm='CM' in identifiers)
+            array = cache.get(keys[identifier])
+            if array is not None:
+                cached[identifier] = array
+
+    # Only the missing descriptors are calculated, BOB still needs the CM.
+    todo = [identifier for identifier in identifiers
+            if identifier not in cached]
+    if 'BOB' in todo and 'CM' in identifiers and 'CM' not in todo:
+        todo.insert(0, 'CM')
+
+    descriptors = dict()
+    shms = []
+    results = []
+    if todo:
+        # The first compound gives the shape of each descriptor.
+        first = compound_descriptors(compounds[0], todo, params)
+        shapes = {identifier: (data_size,) + np.shape(value)
+                  for identifier, value in first.items()}
+
+    if todo and workers > 1:
+        refs = dict()
+        for identifier, shape in shapes.items():
+            shm = shared_memory.SharedMemory(create=True,
+                                             size=int(np.prod(shape))*8)
+            shms.append(shm)
+            descriptors[identifier] = np.ndarray(shape,
+                                                 dtype=np.float64,
+                                                 buffer=shm.buf)
+            refs[identifier] = (shm.name, shape)
+
+        bounds = np.linspace(0, data_size, workers*chunks_per_worker + 1,
+                             dtype=np.int64)
+        bounds = np.unique(bounds)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(fill_descriptors,
+                                           compounds[start:stop],
+                                           start,
+                                           todo,
+                                           params,
+                                           refs)
+                           for start, stop in zip(bounds[:-1], bounds[1:])]
+                results = [future.result() for future in futures]
+        except BaseException:
+            release_descriptors(descriptors, shms)
+            raise
+    elif todo:
+        for identifier, shape in shapes.items():
+            descriptors[identifier] = np.empty(shape, dtype=np.float64)
+        results = [fill_descriptors(compounds,
+                                    0,
+                                    todo,
+                                    params,
+                                    descriptors)]
+
+    if cache is not None:
+        for identifier in identifiers:
+            if identifier in cached:
+                descriptors[identifier] = cached[identifier]
+            else:
+                cache.put(keys[identifier], descriptors[identifier])
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'Descriptors of {data_size} compounds took {tictoc:.4f} '
+               f'seconds ({data_size/tictoc:.1f} compounds/s, {workers} '
+               'workers).', 'CYAN')
+        for identifier in identifiers:
+            if identifier in cached:
+                printc(f'\t{identifier}: cached.', 'CYAN')
+                continue
+            busy = sum(r.get(identifier, 0.0) for r in results)
+            rate = data_size/busy if busy > 0.0 else float('inf')
+            printc(f'\t{identifier}: {busy:.4f} worker seconds, {rate:.1f} '
+                   'compounds/s per worker.', 'CYAN')
+        if cache is not None:
+            cache.summary()
+
+    return descriptors, shms
+
+
+def release_descriptors(descriptors,
+                        shms):
+    """
+    Frees the shared memory behind the arrays made by gen_descriptors.
+    descriptors: dictionary of identifier: array of descriptors. It is
+        emptied, since its arrays aren't valid anymore.
+    shms: list of shared memory blocks.
+    NOTE: any other reference to the arrays has to be deleted before.
+    """
+    descriptors.clear()
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+    shms.clear()
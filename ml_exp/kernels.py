@@ -20,7 +20,9 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from scipy.spatial.distance import cdist
 from scipy.stats import wasserstein_distance as was_dist
 try:
     import tensorflow as tf
@@ -29,24 +31,30 @@ except ImportError:
     print('Tensorflow couldn\'t be imported. Maybe it is not installed.')
     TF_AV = False
 
+# Default tile size (rows and columns) for the distance computations.
+BLOCK_SIZE = 256
+
 
 def gaussian_kernel(X1,
                     X2,
                     sigma,
-                    use_tf=True):
+                    use_tf=True,
+                    block_size=BLOCK_SIZE,
+                    n_jobs=1):
     """
     Calculates the Gaussian Kernel.
     X1: first representations.
     X2: second representations.
     sigma: kernel width.
     use_tf: if tensorflow should be used.
+    block_size: tile size for the distance computation (no tf).
+    n_jobs: number of threads for the distance computation (no tf).
     """
     # If tf is to be used but couldn't be imported, don't try to use it.
     if use_tf and not TF_AV:
         use_tf = False
 
     X1_size = X1.shape[0]
-    X2_size = X2.shape[0]
     i_sigma = -0.5 / (sigma**2)
 
     if use_tf:
@@ -76,13 +84,12 @@ def gaussian_kernel(X1,
         else:
             raise TypeError('No GPU found, could not create Tensor objects.')
     else:
-        K = np.zeros((X1_size, X2_size), dtype=np.float64)
-        for i in range(X1_size):
-            if X2.ndim == 3:
-                norm = np.linalg.norm(X2 - X1[i], axis=(1, 2))
-            else:
-                norm = np.linalg.norm(X2 - X1[i], axis=-1)
-            K[i, :] = np.exp(i_sigma * np.square(norm))
+        K = distance_matrix(X1,
+                            X2,
+                            squared=True,
+                            block_size=block_size,
+                            n_jobs=n_jobs)
+        kernel_from_distance(K, sigma, kernel='gaussian', out=K)
 
     return K
 
@@ -90,20 +97,28 @@ def gaussian_kernel(X1,
 def laplacian_kernel(X1,
                      X2,
                      sigma,
-                     use_tf=True):
+                     use_tf=True,
+                     metric='l2',
+                     block_size=BLOCK_SIZE,
+                     n_jobs=1):
     """
     Calculates the Laplacian Kernel.
     X1: first representations.
     X2: second representations.
     sigma: kernel width.
     use_tf: if tensorflow should be used.
+    metric: norm to use, 'l2' (euclidean) or 'l1' (manhattan).
+    block_size: tile size for the distance computation (no tf).
+    n_jobs: number of threads for the distance computation (no tf).
     """
     # If tf is to be used but couldn't be imported, don't try to use it.
     if use_tf and not TF_AV:
         use_tf = False
 
+    if metric not in ['l1', 'l2']:
+        raise TypeError(f'{metric} metric not found.')
+
     X1_size = X1.shape[0]
-    X2_size = X2.shape[0]
     i_sigma = -0.5 / sigma
 
     if use_tf:
@@ -117,7 +132,14 @@ def laplacian_kernel(X1,
                     return tf.less(i, X1_size)
 
                 def body(i, K):
-                    if X2r == 3:
+                    if metric == 'l1':
+                        if X2r == 3:
+                            norm = tf.reduce_sum(tf.abs(X2 - X1[i]),
+                                                 axis=(1, 2))
+                        else:
+                            norm = tf.reduce_sum(tf.abs(X2 - X1[i]),
+                                                 axis=-1)
+                    elif X2r == 3:
                         norm = tf.norm(X2 - X1[i], axis=(1, 2))
                     else:
                         norm = tf.norm(X2 - X1[i], axis=-1)
@@ -133,13 +155,12 @@ def laplacian_kernel(X1,
         else:
             raise TypeError('No GPU found, could not create Tensor objects.')
     else:
-        K = np.zeros((X1_size, X2_size), dtype=np.float64)
-        for i in range(X1_size):
-            if X2.ndim == 3:
-                norm = np.linalg.norm(X2 - X1[i], axis=(1, 2))
-            else:
-                norm = np.linalg.norm(X2 - X1[i], axis=-1)
-            K[i, :] = np.exp(i_sigma * norm)
+        K = distance_matrix(X1,
+                            X2,
+                            metric=metric,
+                            block_size=block_size,
+                            n_jobs=n_jobs)
+        kernel_from_distance(K, sigma, kernel='laplacian', out=K)
 
     return K
 
@@ -168,3 +189,296 @@ def wasserstein_kernel(X1,
         K[i, :] = np.exp(- alpha * norm)
 
     return K
+
+
+def squared_norms(X):
+    """
+    Calculates the squared euclidean norm of each (flattened) representation.
+    X: representations.
+    """
+    X = X.reshape(X.shape[0], -1)
+
+    return np.einsum('ij,ij->i', X, X)
+
+
+def distance_matrix(X1,
+                    X2,
+                    metric='l2',
+                    squared=False,
+                    block_size=BLOCK_SIZE,
+                    n_jobs=1,
+                    X2_sq=None,
+                    dtype=np.float64):
+    """
+    Calculates the distance matrix between representations, tile by tile.
+    X1: first representations.
+    X2: second representations.
+    metric: norm to use, 'l2' (euclidean) or 'l1' (manhattan).
+    squared: if the squared distances should be returned.
+    block_size: number of rows and columns of each tile.
+    n_jobs: number of threads used to compute the row tiles.
+    X2_sq: precomputed squared norms of X2 (l2 only), see squared_norms.
+    dtype: type of the returned matrix. Tiles are computed in float64 and
+        cast when stored, so a float32 matrix never needs a float64 copy.
+    NOTE: 2D representations (matrices) are compared element-wise, as if
+        they were flattened. This doesn't work with tensorflow.
+    """
+    if metric not in ['l1', 'l2']:
+        raise TypeError(f'{metric} metric not found.')
+
+    X1 = np.asarray(X1, dtype=np.float64)
+    X2 = np.asarray(X2, dtype=np.float64)
+    X1 = X1.reshape(X1.shape[0], -1)
+    X2 = X2.reshape(X2.shape[0], -1)
+    X1_size = X1.shape[0]
+    X2_size = X2.shape[0]
+
+    # Squared norms for |a - b|^2 = |a|^2 + |b|^2 - 2ab, so each l2 tile
+    # is a matrix product instead of a (rows, cols, features) difference.
+    if metric == 'l2':
+        X1_sq = squared_norms(X1)
+        if X2_sq is None:
+            X2_sq = squared_norms(X2)
+
+    D = np.empty((X1_size, X2_size), dtype=dtype)
+
+    def row_tile(i):
+        i_end = min(i + block_size, X1_size)
+        for j in range(0, X2_size, block_size):
+            j_end = min(j + block_size, X2_size)
+            if metric == 'l2':
+                tile = np.dot(X1[i:i_end], X2[j:j_end].T)
+                tile *= -2.0
+                norms = X1_sq[i:i_end, np.newaxis] + X2_sq[np.newaxis, j:j_end]
+                tile += norms
+                # The expansion loses the distances much smaller than the
+                # norms (self distances are ~1e-4 instead of 0 after the
+                # sqrt), so those few pairs are computed from the differences.
+                close = np.nonzero(tile <= 1e-8*norms)
+                if close[0].size:
+                    diff = X1[i + close[0]] - X2[j + close[1]]
+                    tile[close] = np.einsum('ij,ij->i', diff, diff)
+                if not squared:
+                    np.sqrt(tile, out=tile)
+            else:
+                tile = cdist(X1[i:i_end], X2[j:j_end], metric='cityblock')
+                if squared:
+                    np.square(tile, out=tile)
+            D[i:i_end, j:j_end] = tile
+
+    row_tiles = range(0, X1_size, block_size)
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(row_tile, row_tiles))
+    else:
+        for i in row_tiles:
+            row_tile(i)
+
+    return D
+
+
+def kernel_from_distance(D,
+                         sigma,
+                         kernel='gaussian',
+                         out=None):
+    """
+    Calculates a kernel from a precomputed distance matrix, in-place.
+    D: distance matrix, squared distances for the gaussian kernel.
+    sigma: kernel width.
+    kernel: which kernel to use, 'gaussian' or 'laplacian'.
+    out: array where the kernel is written. If None, a new one is created.
+        It can be D itself if the distances aren't needed anymore.
+    NOTE: this doesn't work with tensorflow.
+    """
+    if kernel == 'gaussian':
+        i_sigma = -0.5 / (sigma**2)
+    elif kernel == 'laplacian':
+        i_sigma = -0.5 / sigma
+    else:
+        raise TypeError(f'{kernel} kernel not found.')
+
+    if out is None:
+        out = np.empty_like(D)
+
+    np.multiply(D, i_sigma, out=out)
+    np.exp(out, out=out)
+
+    return out
+
+
+def multi_sigma_kernels(D,
+                        sigmas,
+                        kernel='gaussian',
+                        out=None):
+    """
+    Yields (sigma, kernel) for several sigmas sharing one distance matrix.
+    D: distance matrix, squared distances for the gaussian kernel.
+    sigmas: list of kernel widths.
+    kernel: which kernel to use, 'gaussian' or 'laplacian'.
+    out: array where the kernels are written. If None, a new one is created.
+    NOTE: the same array is yielded for every sigma and it is overwritten
+        on the next iteration, copy it if it is needed afterwards.
+    """
+    if out is None:
+        out = np.empty_like(D)
+
+    for sigma in sigmas:
+        yield sigma, kernel_from_distance(D,
+                                          sigma,
+                                          kernel=kernel,
+                                          out=out)
+
+
+def kernel_matrix(X1,
+                  X2,
+                  sigma,
+                  kernel='gaussian',
+                  metric='l2',
+                  use_tf=False,
+                  block_size=BLOCK_SIZE,
+                  n_jobs=1):
+    """
+    Calculates the kernel matrix with the kernel given by name.
+    X1: first representations.
+    X2: second representations.
+    sigma: kernel width (alpha for the wasserstein kernel).
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    use_tf: if tensorflow should be used.
+    block_size: tile size for the distance computation (no tf).
+    n_jobs: number of threads for the distance computation (no tf).
+    """
+    if kernel == 'gaussian':
+        return gaussian_kernel(X1,
+                               X2,
+                               sigma,
+                               use_tf=use_tf,
+                               block_size=block_size,
+                               n_jobs=n_jobs)
+    elif kernel == 'laplacian':
+        return laplacian_kernel(X1,
+                                X2,
+                                sigma,
+                                use_tf=use_tf,
+                                metric=metric,
+                                block_size=block_size,
+                                n_jobs=n_jobs)
+    elif kernel == 'wasserstein':
+        return wasserstein_kernel(X1,
+                                  X2,
+                                  sigma)
+    else:
+        raise TypeError(f'{kernel} kernel not found.')
+
+
+def kernel_memmap(X1,
+                  X2,
+                  sigma,
+                  filename,
+                  kernel='gaussian',
+                  metric='l2',
+                  block_size=4096,
+                  lower_only=False):
+    """
+    Calculates the kernel matrix tile by tile into a memory-mapped .npy file.
+    X1: first representations.
+    X2: second representations.
+    sigma: kernel width (alpha for the wasserstein kernel).
+    filename: path of the .npy file to create.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    block_size: number of rows and columns of each tile.
+    lower_only: if only the lower triangle tiles should be computed,
+        for symmetric kernels that are going to be factorized.
+    NOTE: only one tile is held in memory at a time. This doesn't work
+        with tensorflow.
+    """
+    X1_size = X1.shape[0]
+    X2_size = X2.shape[0]
+
+    K = np.lib.format.open_memmap(filename,
+                                  mode='w+',
+                                  dtype=np.float64,
+                                  shape=(X1_size, X2_size))
+    for i in range(0, X1_size, block_size):
+        i_end = min(i + block_size, X1_size)
+        for j in range(0, X2_size, block_size):
+            if lower_only and j > i:
+                break
+            j_end = min(j + block_size, X2_size)
+            K[i:i_end, j:j_end] = kernel_matrix(X1[i:i_end],
+                                                X2[j:j_end],
+                                                sigma,
+                                                kernel=kernel,
+                                                metric=metric)
+    K.flush()
+
+    return K
+
+
+def kernel_tile(X1,
+                X2,
+                sigma,
+                kernel='gaussian',
+                metric='l2',
+                X2_sq=None):
+    """
+    Calculates a kernel block, reusing the precomputed norms of X2.
+    X1: first representations.
+    X2: second representations.
+    sigma: kernel width (alpha for the wasserstein kernel).
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    X2_sq: precomputed squared norms of X2, see squared_norms.
+    NOTE: this doesn't work with tensorflow.
+    """
+    if kernel in ['gaussian', 'laplacian']:
+        if kernel == 'gaussian':
+            metric = 'l2'
+        K = distance_matrix(X1,
+                            X2,
+                            metric=metric,
+                            squared=kernel == 'gaussian',
+                            X2_sq=X2_sq)
+        return kernel_from_distance(K, sigma, kernel=kernel, out=K)
+
+    return kernel_matrix(X1, X2, sigma, kernel=kernel, metric=metric)
+
+
+def kernel_matvec(X1,
+                  X2,
+                  v,
+                  sigma,
+                  kernel='gaussian',
+                  metric='l2',
+                  block_size=1024,
+                  X2_sq=None):
+    """
+    Calculates K(X1, X2)v without storing the kernel, by row tiles.
+    X1: first representations.
+    X2: second representations.
+    v: vector or matrix to multiply.
+    sigma: kernel width (alpha for the wasserstein kernel).
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    block_size: number of rows of X1 per tile.
+    X2_sq: precomputed squared norms of X2, see squared_norms.
+    NOTE: memory is O(block_size * X2 size). This doesn't work with
+        tensorflow.
+    """
+    X1_size = X1.shape[0]
+    if X2_sq is None and (kernel == 'gaussian' or metric == 'l2'):
+        X2_sq = squared_norms(X2)
+
+    Kv = np.empty((X1_size,) + v.shape[1:], dtype=np.float64)
+    for i in range(0, X1_size, block_size):
+        i_end = min(i + block_size, X1_size)
+        Kv[i:i_end] = np.dot(kernel_tile(X1[i:i_end],
+                                         X2,
+                                         sigma,
+                                         kernel=kernel,
+                                         metric=metric,
+                                         X2_sq=X2_sq),
+                             v)
+
+    return Kv
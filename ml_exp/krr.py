@@ -20,7 +20,17 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
+import os
+import queue
+import random
+import shutil
+import tempfile
+import threading
 import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
 import numpy as np
 from scipy import linalg as LA
 try:
@@ -31,8 +41,103 @@ except ImportError:
     TF_AV = False
 from ml_exp.misc import printc
 from ml_exp.kernels import gaussian_kernel, laplacian_kernel,\
-    wasserstein_kernel
-from ml_exp.readdb import qm7db
+    wasserstein_kernel, distance_matrix, kernel_from_distance,\
+    kernel_memmap, kernel_matrix, kernel_matvec, kernel_tile, squared_norms
+from ml_exp.linalg import ooc_cholesky, ooc_cho_solve, ooc_dot,\
+    cho_loo_residuals, cho_extend, pcg
+from ml_exp.approx import kmeans, select_landmarks, sample_fourier_weights,\
+    random_fourier_features
+from ml_exp.neighbors import NeighborIndex
+from ml_exp.preprocessing import collapse_duplicates
+from ml_exp.decomposition import PCAProjection
+from ml_exp.compound import Compound
+from ml_exp.descriptors import gen_descriptors, release_descriptors,\
+    descriptor_params, compound_descriptors, fill_descriptors
+from ml_exp.cache import DescriptorCache
+from ml_exp.readdb import qm7db, qm9db
+from ml_exp.data import QM9_PROPERTIES
+
+
+def _check_sizes(data_size,
+                 labels_size,
+                 training_size,
+                 test_size):
+    """
+    Checks the data sizes and returns the test size to use.
+    data_size: number of descriptors.
+    labels_size: number of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used (up to 1500).
+    """
+    if not data_size == labels_size:
+        raise ValueError('Labels size is different than descriptors size.')
+
+    if training_size >= data_size:
+        raise ValueError('Training size is greater or equal to the data size.')
+
+    # If test_size is not set, it is set to a maximum size of 1500.
+    # Also, no overlapping with training data is achieved.
+    if not test_size:
+        test_size = data_size - training_size
+        if test_size > 1500:
+            test_size = 1500
+
+    return test_size
+
+
+def _training_order(data_size,
+                    training_indices,
+                    test_size=None):
+    """
+    Order of the molecules that puts the selected training set first.
+    data_size: number of molecules.
+    training_indices: indices of the training molecules.
+    test_size: size of the test set (the last molecules). If no size is
+        given, all the molecules not in the training set are used.
+    Returns the order, the training size and the test size.
+    """
+    training_indices = np.asarray(training_indices, dtype=np.int64)
+    training_size = training_indices.shape[0]
+    if np.unique(training_indices).shape[0] != training_size:
+        raise ValueError('Training indices are repeated.')
+
+    if test_size is None:
+        test_indices = np.setdiff1d(np.arange(data_size), training_indices)
+    else:
+        test_indices = np.arange(data_size - test_size, data_size)
+        if np.intersect1d(training_indices, test_indices).shape[0] > 0:
+            raise ValueError('Training indices overlap the test set.')
+
+    order = np.concatenate([training_indices, test_indices])
+
+    return order, training_size, test_indices.shape[0]
+
+
+def _mae(Y_pr,
+         Y_te):
+    """
+    Mean absolute error, one value per target for 2D labels.
+    Y_pr: predicted labels.
+    Y_te: actual labels.
+    """
+    return np.mean(np.abs(Y_pr - Y_te), axis=0)
+
+
+def _print_mae(identifier,
+               mae):
+    """
+    Prints the mae, or the mae of each target for multi-target labels.
+    identifier: string with the name of the descriptor used.
+    mae: mae value or array of maes.
+    """
+    mae = np.asarray(mae)
+    if mae.ndim == 0:
+        printc(f'\tMAE for {identifier}: {mae:.4f}', 'GREEN')
+    else:
+        for i, target_mae in enumerate(mae):
+            printc(f'\tMAE for {identifier} (target {i}): {target_mae:.4f}',
+                   'GREEN')
 
 
 def krr(descriptors,
@@ -43,12 +148,38 @@ def krr(descriptors,
         opt=True,
         identifier=None,
         kernel='gaussian',
+        metric='l2',
         use_tf=True,
-        show_msgs=True):
+        show_msgs=True,
+        out_of_core=False,
+        tmp_dir=None,
+        block_size=4096,
+        method='exact',
+        n_landmarks=500,
+        landmark_method='uniform',
+        r_seed=111,
+        n_features=2000,
+        batch_size=1000,
+        solver='cholesky',
+        reg=1e-8,
+        cg_tol=1e-6,
+        preconditioner='nystrom',
+        n_neighbors=100,
+        n_partitions=4,
+        partition='random',
+        combine='average',
+        workers=1,
+        training_indices=None,
+        collapse_eps=None,
+        pca_rank=None,
+        pca_method='randomized',
+        kernel_cache=None):
     """
     Basic krr methodology for a single descriptor type.
     descriptors: array of descriptors.
-    labels: array of labels.
+    labels: array of labels, or (data size, targets) matrix of labels. All
+        targets share the kernel and factorization, and the mae is returned
+        per target.
     training_size: size of the training set to use.
     test_size: size of the test set to use. If no size is given,
         the last remaining molecules are used.
@@ -56,12 +187,241 @@ def krr(descriptors,
     opt: if the optimized algorithm should be used. For benchmarking purposes.
     identifier: string with the name of the descriptor used.
     kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
     use_tf: if tensorflow should be used.
     show_msgs: if debug messages should be shown.
+    out_of_core: if the kernels should be stored in memory-mapped files and
+        factorized out-of-core, see ooc_krr. Doesn't work with tensorflow.
+    tmp_dir: directory for the out-of-core kernel files.
+    block_size: tile size for the out-of-core mode.
+    method: 'exact', 'nystrom' (low-rank approximation, see nystrom_krr),
+        'rff' (random fourier features, see rff_krr), 'local' (krr on the
+        nearest neighbors of each test molecule, see local_krr) or 'dc'
+        (ensemble of krr on partitions of the training set, see dc_krr).
+        The approximations don't work with tensorflow.
+    n_landmarks: number of landmarks for the nystrom method.
+    landmark_method: landmark selection for the nystrom method.
+    r_seed: random seed for the nystrom and rff methods.
+    n_features: number of random features for the rff method.
+    batch_size: mini-batch size for the rff method.
+    solver: 'cholesky', 'cg' (matrix-free conjugate gradient, see cg_krr)
+        or 'mixed' (float32 factorization with float64 refinement, about a
+        quarter of the memory, see mixed_krr) for the exact method. CG and
+        mixed don't work with tensorflow.
+    reg: value added to the kernel diagonal (regularization). The nystrom
+        and rff methods add it to the diagonal of their feature system.
+    cg_tol: relative residual tolerance for the cg and mixed solvers.
+    preconditioner: preconditioner for the cg solver, 'nystrom' (with
+        n_landmarks landmarks), 'jacobi' or None.
+    n_neighbors: number of nearest neighbors for the local method.
+    n_partitions: number of partitions for the dc method.
+    partition: 'random' or 'kmeans' partitions for the dc method.
+    combine: 'average' or 'route' predictions for the dc method.
+    workers: number of processes for the dc method.
+    training_indices: indices of the training molecules, for example from
+        farthest_point_sampling or cur_selection. The training set is then
+        descriptors[training_indices] instead of the first training_size
+        molecules, and the test set (if no size is given) all the others.
+    collapse_eps: if given, duplicated training descriptors (up to this
+        tolerance, see collapse_duplicates) are merged before building the
+        kernel. Each merged molecule has the mean label and reg/weight on
+        the diagonal, the same solution as keeping the copies. Only for the
+        exact method with the cholesky solver.
+    pca_rank: if given, the descriptors are projected onto this number of
+        principal components (fitted with the training set only, see
+        PCAProjection) before anything else. Flattened matrices are mostly
+        padding zeros, so every distance gets cheaper.
+    pca_method: 'randomized' or 'incremental' fit of the projection.
+    kernel_cache: KernelCache where the kernel of all the descriptors is
+        stored, the training and test kernels are then sliced from it. Reruns
+        with other training_indices, reg or labels don't build it again.
+        Only for the exact method with the cholesky solver, without
+        tensorflow, pca_rank or collapse_eps.
     NOTE: identifier is just a string and is only for identification purposes.
     Also, training is done with the first part of the data and
         testing with the ending part of the data.
     """
+    if kernel_cache is not None:
+        if use_tf and TF_AV:
+            raise ValueError('The kernel cache doesn\'t work with tensorflow.')
+        if out_of_core or method != 'exact' or solver != 'cholesky' \
+                or pca_rank is not None or collapse_eps is not None:
+            raise ValueError('The kernel cache only works with the exact '
+                             'method and the cholesky solver, without '
+                             'pca_rank or collapse_eps.')
+        # Blocks are sliced from the kernel of the original descriptors.
+        cache_X = descriptors
+        if training_indices is None:
+            cache_test_size = _check_sizes(descriptors.shape[0],
+                                           labels.shape[0],
+                                           training_size,
+                                           test_size)
+            cache_tr = slice(0, training_size)
+            cache_te = slice(descriptors.shape[0] - cache_test_size,
+                             descriptors.shape[0])
+
+    if training_indices is not None:
+        order, training_size, test_size = _training_order(
+            descriptors.shape[0], training_indices, test_size)
+        if kernel_cache is not None:
+            cache_tr = order[:training_size]
+            cache_te = order[-test_size:]
+        if use_tf and TF_AV and not isinstance(descriptors, np.ndarray):
+            descriptors = tf.gather(descriptors, order)
+            labels = tf.gather(labels, order)
+        else:
+            descriptors = descriptors[order]
+            labels = labels[order]
+
+    if pca_rank is not None:
+        pca_test_size = _check_sizes(descriptors.shape[0],
+                                     labels.shape[0],
+                                     training_size,
+                                     test_size)
+        X_tr = np.asarray(descriptors[:training_size])
+        X_te = np.asarray(descriptors[-pca_test_size:])
+        projection = PCAProjection(pca_rank, method=pca_method)
+        projection.fit(X_tr)
+        descriptors = np.concatenate([projection.transform(X_tr),
+                                      projection.transform(X_te)])
+        labels = np.concatenate([np.asarray(labels[:training_size]),
+                                 np.asarray(labels[-pca_test_size:])])
+        test_size = pca_test_size
+        if show_msgs:
+            printc(f'\tPCA projection: {X_tr[0].size} -> {pca_rank}',
+                   'CYAN')
+        if use_tf and TF_AV:
+            descriptors = tf.convert_to_tensor(descriptors)
+            labels = tf.convert_to_tensor(labels)
+
+    weights = None
+    if collapse_eps is not None:
+        if out_of_core or method != 'exact' or solver != 'cholesky':
+            raise ValueError('Duplicate collapsing only works with the exact '
+                             'method and the cholesky solver.')
+        test_size = _check_sizes(descriptors.shape[0],
+                                 labels.shape[0],
+                                 training_size,
+                                 test_size)
+        X_te = np.asarray(descriptors[-test_size:])
+        Y_te = np.asarray(labels[-test_size:])
+        X_tr, Y_tr, weights, _ = collapse_duplicates(
+            np.asarray(descriptors[:training_size]),
+            np.asarray(labels[:training_size]),
+            eps=collapse_eps)
+        if show_msgs:
+            printc(f'\tCollapsed training size: {training_size} -> '
+                   f'{X_tr.shape[0]}', 'CYAN')
+        training_size = X_tr.shape[0]
+        descriptors = np.concatenate([X_tr, X_te])
+        labels = np.concatenate([Y_tr, Y_te])
+        if use_tf and TF_AV:
+            descriptors = tf.convert_to_tensor(descriptors)
+            labels = tf.convert_to_tensor(labels)
+
+    if out_of_core:
+        return ooc_krr(descriptors,
+                       labels,
+                       training_size=training_size,
+                       test_size=test_size,
+                       sigma=sigma,
+                       identifier=identifier,
+                       kernel=kernel,
+                       metric=metric,
+                       tmp_dir=tmp_dir,
+                       block_size=block_size,
+                       reg=reg,
+                       show_msgs=show_msgs)
+
+    if method == 'nystrom':
+        return nystrom_krr(descriptors,
+                           labels,
+                           training_size=training_size,
+                           test_size=test_size,
+                           sigma=sigma,
+                           identifier=identifier,
+                           kernel=kernel,
+                           metric=metric,
+                           n_landmarks=n_landmarks,
+                           landmark_method=landmark_method,
+                           r_seed=r_seed,
+                           reg=reg,
+                           show_msgs=show_msgs)
+    elif method == 'rff':
+        return rff_krr(descriptors,
+                       labels,
+                       training_size=training_size,
+                       test_size=test_size,
+                       sigma=sigma,
+                       identifier=identifier,
+                       kernel=kernel,
+                       metric=metric,
+                       n_features=n_features,
+                       batch_size=batch_size,
+                       r_seed=r_seed,
+                       reg=reg,
+                       show_msgs=show_msgs)
+    elif method == 'local':
+        return local_krr(descriptors,
+                         labels,
+                         training_size=training_size,
+                         test_size=test_size,
+                         sigma=sigma,
+                         identifier=identifier,
+                         kernel=kernel,
+                         metric=metric,
+                         n_neighbors=n_neighbors,
+                         reg=reg,
+                         show_msgs=show_msgs)
+    elif method == 'dc':
+        return dc_krr(descriptors,
+                      labels,
+                      training_size=training_size,
+                      test_size=test_size,
+                      sigma=sigma,
+                      identifier=identifier,
+                      kernel=kernel,
+                      metric=metric,
+                      n_partitions=n_partitions,
+                      partition=partition,
+                      combine=combine,
+                      reg=reg,
+                      workers=workers,
+                      r_seed=r_seed,
+                      show_msgs=show_msgs)
+    elif method != 'exact':
+        raise TypeError(f'{method} method not found.')
+
+    if solver == 'cg':
+        return cg_krr(descriptors,
+                      labels,
+                      training_size=training_size,
+                      test_size=test_size,
+                      sigma=sigma,
+                      identifier=identifier,
+                      kernel=kernel,
+                      metric=metric,
+                      reg=reg,
+                      preconditioner=preconditioner,
+                      n_landmarks=n_landmarks,
+                      tol=cg_tol,
+                      r_seed=r_seed,
+                      show_msgs=show_msgs)
+    elif solver == 'mixed':
+        return mixed_krr(descriptors,
+                         labels,
+                         training_size=training_size,
+                         test_size=test_size,
+                         sigma=sigma,
+                         identifier=identifier,
+                         kernel=kernel,
+                         metric=metric,
+                         reg=reg,
+                         tol=cg_tol,
+                         show_msgs=show_msgs)
+    elif solver != 'cholesky':
+        raise TypeError(f'{solver} solver not found.')
+
     tic = time.perf_counter()
     # Initial calculations for later use.
     data_size = descriptors.shape[0]
@@ -69,31 +429,29 @@ def krr(descriptors,
     if not identifier:
         identifier = 'NOT SPECIFIED'
 
-    if not data_size == labels.shape[0]:
-        raise ValueError('Labels size is different than descriptors size.')
-
-    if training_size >= data_size:
-        raise ValueError('Training size is greater or equal to the data size.')
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
 
     # If tf is to be used but couldn't be imported, don't try to use it.
     if use_tf and not TF_AV:
         use_tf = False
 
-    # If test_size is not set, it is set to a maximum size of 1500.
-    # Also, no overlapping with training data is achieved.
-    if not test_size:
-        test_size = data_size - training_size
-        if test_size > 1500:
-            test_size = 1500
-
     if show_msgs:
         printc(f'{identifier} ML started.', 'GREEN')
         printc(f'\tTraining size: {training_size}', 'CYAN')
         printc(f'\tTest size: {test_size}', 'CYAN')
         printc(f'\tSigma: {sigma}', 'CYAN')
         printc(f'\tKernel: {kernel}', 'CYAN')
+        if kernel == 'laplacian':
+            printc(f'\tMetric: {metric}', 'CYAN')
         printc(f'\tUse tf: {use_tf}', 'CYAN')
 
+    # Labels can be a (data size, targets) matrix, all targets are solved
+    # with the same kernel and factorization.
+    multi_target = len(labels.shape) == 2
+
     if use_tf:
         if tf.config.experimental.list_physical_devices('GPU'):
             with tf.device('GPU:0'):
@@ -109,6 +467,7 @@ def krr(descriptors,
                     K_tr = laplacian_kernel(X_tr,
                                             X_tr,
                                             sigma,
+                                            metric=metric,
                                             use_tf=use_tf)
 
                 elif kernel == 'wasserstein':
@@ -121,11 +480,15 @@ def krr(descriptors,
                     raise TypeError(f'{kernel} kernel not found.')
 
                 # Adding a small value on the diagonal for cho_solve.
-                dv = tf.linalg.tensor_diag(tf.constant(1e-8,
-                                                       shape=(training_size),
-                                                       dtype=tf.float64))
+                if weights is None:
+                    dv = tf.linalg.tensor_diag(tf.constant(
+                        reg, shape=(training_size), dtype=tf.float64))
+                else:
+                    dv = tf.linalg.tensor_diag(tf.constant(reg / weights,
+                                                           dtype=tf.float64))
                 K_tr += dv
-                Y_tr = tf.expand_dims(Y_tr, 1)
+                if not multi_target:
+                    Y_tr = tf.expand_dims(Y_tr, 1)
                 alpha = tf.linalg.cholesky_solve(tf.linalg.cholesky(K_tr),
                                                  Y_tr)
 
@@ -141,6 +504,7 @@ def krr(descriptors,
                     K_te = laplacian_kernel(X_te,
                                             X_tr,
                                             sigma,
+                                            metric=metric,
                                             use_tf=use_tf)
 
                 elif kernel == 'wasserstein':
@@ -152,16 +516,27 @@ def krr(descriptors,
                 else:
                     raise TypeError(f'{kernel} kernel not found.')
 
-                Y_te = tf.expand_dims(Y_te, 1)
                 Y_pr = tf.tensordot(K_te, alpha, 1)
 
-                mae = tf.reduce_mean(tf.abs(Y_pr - Y_te))
+                if multi_target:
+                    mae = tf.reduce_mean(tf.abs(Y_pr - Y_te), axis=0)
+                else:
+                    Y_te = tf.expand_dims(Y_te, 1)
+                    mae = tf.reduce_mean(tf.abs(Y_pr - Y_te))
         else:
             raise TypeError('No GPU found, could not create Tensor objects.')
     else:
         X_tr = descriptors[:training_size]
         Y_tr = labels[:training_size]
-        if kernel == 'gaussian':
+        if kernel_cache is not None:
+            K_tr, K_te = kernel_cache.blocks(cache_X,
+                                             [(cache_tr, cache_tr),
+                                              (cache_te, cache_tr)],
+                                             sigma,
+                                             kernel=kernel,
+                                             metric=metric)
+
+        elif kernel == 'gaussian':
             K_tr = gaussian_kernel(X_tr,
                                    X_tr,
                                    sigma,
@@ -171,6 +546,7 @@ def krr(descriptors,
             K_tr = laplacian_kernel(X_tr,
                                     X_tr,
                                     sigma,
+                                    metric=metric,
                                     use_tf=use_tf)
 
         elif kernel == 'wasserstein':
@@ -183,13 +559,20 @@ def krr(descriptors,
             raise TypeError(f'{kernel} kernel not found.')
 
         # Adding a small value on the diagonal for cho_solve.
-        K_tr[np.diag_indices_from(K_tr)] += 1e-8
+        if weights is None:
+            K_tr[np.diag_indices_from(K_tr)] += reg
+        else:
+            K_tr[np.diag_indices_from(K_tr)] += reg / weights
         alpha = LA.cho_solve(LA.cho_factor(K_tr),
                              Y_tr)
 
         X_te = descriptors[-test_size:]
         Y_te = labels[-test_size:]
-        if kernel == 'gaussian':
+        if kernel_cache is not None:
+            # Already sliced with the training kernel.
+            pass
+
+        elif kernel == 'gaussian':
             K_te = gaussian_kernel(X_te,
                                    X_tr,
                                    sigma,
@@ -199,6 +582,7 @@ def krr(descriptors,
             K_te = laplacian_kernel(X_te,
                                     X_tr,
                                     sigma,
+                                    metric=metric,
                                     use_tf=use_tf)
 
         elif kernel == 'wasserstein':
@@ -211,180 +595,1960 @@ def krr(descriptors,
             raise TypeError(f'{kernel} kernel not found.')
         Y_pr = np.dot(K_te, alpha)
 
-        mae = np.mean(np.abs(Y_pr - Y_te))
+        mae = _mae(Y_pr, Y_te)
 
     toc = time.perf_counter()
     tictoc = toc - tic
     if show_msgs:
-        printc(f'\tMAE for {identifier}: {mae:.4f}', 'GREEN')
+        _print_mae(identifier, mae)
         printc(f'\t{identifier} ML took {tictoc:.4f} seconds.', 'GREEN')
 
     return mae, tictoc
 
 
-def multi_krr(db_path='data',
-              is_shuffled=True,
-              r_seed=111,
-              diag_value=None,
-              lj_sigma=1.0,
-              lj_epsilon=1.0,
-              use_forces=False,
-              acount={'C':7, 'H':16, 'N':3, 'O':3, 'S':1},
-              size=23,
-              sort=False,
-              flatten=True,
-              as_eig=True,
-              bohr_ru=False,
-              training_size=1500,
-              test_size=None,
-              sigma=1000.0,
-              identifiers=['CM'],
-              use_tf=True,
-              show_msgs=True):
+def multi_sigma_krr(descriptors,
+                    labels,
+                    sigmas,
+                    training_size=1500,
+                    test_size=None,
+                    identifier=None,
+                    kernel='gaussian',
+                    metric='l2',
+                    loo=False,
+                    reg=1e-8,
+                    show_msgs=True):
     """
-    Does multiple KRR for several descriptors.
-    db_path: path to the database directory.
-    is_shuffled: if the resulting list of compounds should be shuffled.
-    r_seed: random seed to use for the shuffling.
-    diag_value: if special diagonal value is to be used.
-    lj_sigma: sigma value.
-    lj_epsilon: epsilon value.
-    use_forces: if the use of forces instead of k_cx should be used.
-    acount: atom count for the compound, defaults to qm7 sizes.
-    size: compound size.
-    sort: if the representation should be sorted row-norm or bag-wise.
-    flatten: if the representation should be 1D.
-    as_eig: if the representation should be as the eigenvalues.
-    bohr_ru: if radius units should be in bohr's radius units.
+    KRR for several kernel widths, computing the distance matrices only once.
+    descriptors: array of descriptors.
+    labels: array of labels.
+    sigmas: list of kernel widths to use.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use, 'gaussian' or 'laplacian'.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    loo: if the leave-one-out mae over the training set should also be
+        computed for each sigma, see cho_loo_residuals.
+    reg: value added to the kernel diagonal (regularization).
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow.
+    Returns the array of maes (one per sigma) and the total time (and the
+        array of leave-one-out maes).
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if show_msgs:
+        printc(f'{identifier} multi sigma ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigmas: {sigmas}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+
+    X_tr = descriptors[:training_size]
+    Y_tr = labels[:training_size]
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    # The gaussian kernel only needs the squared euclidean distances.
+    if kernel == 'gaussian':
+        metric = 'l2'
+    squared = kernel == 'gaussian'
+    D_tr = distance_matrix(X_tr, X_tr, metric=metric, squared=squared)
+    D_te = distance_matrix(X_te, X_tr, metric=metric, squared=squared)
+
+    # Buffers reused for every sigma, so no other full-size arrays are made.
+    K_tr = np.empty_like(D_tr)
+    K_te = np.empty_like(D_te)
+    diag = np.diag_indices_from(K_tr)
+
+    maes = np.zeros(len(sigmas), dtype=np.float64)
+    loo_maes = np.zeros(len(sigmas), dtype=np.float64)
+    for i, sigma in enumerate(sigmas):
+        kernel_from_distance(D_tr, sigma, kernel=kernel, out=K_tr)
+        # Adding a small value on the diagonal for cho_solve.
+        K_tr[diag] += reg
+        c_and_lower = LA.cho_factor(K_tr,
+                                    overwrite_a=True,
+                                    check_finite=False)
+        alpha = LA.cho_solve(c_and_lower, Y_tr)
+        if loo:
+            loo_maes[i] = np.mean(np.abs(cho_loo_residuals(c_and_lower,
+                                                           alpha)))
+
+        kernel_from_distance(D_te, sigma, kernel=kernel, out=K_te)
+        Y_pr = np.dot(K_te, alpha)
+
+        maes[i] = np.mean(np.abs(Y_pr - Y_te))
+        if show_msgs:
+            printc(f'\tMAE for {identifier} (sigma={sigma}): {maes[i]:.4f}',
+                   'GREEN')
+            if loo:
+                printc(f'\tLOO MAE for {identifier} (sigma={sigma}): '
+                       f'{loo_maes[i]:.4f}', 'GREEN')
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'\t{identifier} multi sigma ML took {tictoc:.4f} seconds.',
+               'GREEN')
+
+    if loo:
+        return maes, tictoc, loo_maes
+
+    return maes, tictoc
+
+
+def regularization_path_krr(descriptors,
+                            labels,
+                            regs,
+                            training_size=1500,
+                            test_size=None,
+                            sigma=1000.0,
+                            identifier=None,
+                            kernel='gaussian',
+                            metric='l2',
+                            return_alphas=False,
+                            loo=False,
+                            show_msgs=True):
+    """
+    KRR for several regularization values from one eigendecomposition.
+    descriptors: array of descriptors.
+    labels: array of labels, or (data size, targets) matrix of labels.
+    regs: list of regularization values (added to the kernel diagonal).
     training_size: size of the training set to use.
     test_size: size of the test set to use. If no size is given,
         the last remaining molecules are used.
     sigma: depth of the kernel.
-    identifiers: list of names (strings) of descriptors to use.
-    use_tf: if tensorflow should be used.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    return_alphas: if the (training_size, [targets,] len(regs)) alphas
+        should also be returned.
+    loo: if the leave-one-out mae over the training set should also be
+        computed for each regularization value.
     show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. With K_tr = QLQ^T, each
+        regularization value costs O(N^2) instead of a new factorization.
+    Returns the array of maes (one per regularization value, and per target
+        for 2D labels) and the total time (and the alphas, and the array of
+        leave-one-out maes).
     """
-    if type(identifiers) != list:
-        raise TypeError('\'identifiers\' is not a list.')
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
 
-    # If tf is to be used but couldn't be imported, don't try to use it.
-    if use_tf and not TF_AV:
-        use_tf = False
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
 
-    init_time = time.perf_counter()
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
 
-    # Data reading.
+    if show_msgs:
+        printc(f'{identifier} regularization path ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tRegularization values: {len(regs)}', 'CYAN')
+
+    X_tr = descriptors[:training_size]
+    Y_tr = labels[:training_size]
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    K_tr = kernel_matrix(X_tr, X_tr, sigma, kernel=kernel, metric=metric)
+    eig_vals, Q = LA.eigh(K_tr, overwrite_a=True, check_finite=False)
+    del K_tr
+    Qt_Y = np.dot(Q.T, Y_tr)
+
+    # Test predictions are K_te Q (Q^T Y / (L + reg)).
+    K_te_Q = np.dot(kernel_matrix(X_te, X_tr, sigma,
+                                  kernel=kernel, metric=metric), Q)
+
+    # diag((K_tr + reg)^-1) = (Q*Q) (1 / (L + reg)), for the LOO residuals.
+    if loo:
+        Q_sq = np.square(Q)
+
+    # For 2D labels, the eigenvalues broadcast over the targets (columns).
+    targets = Qt_Y.shape[1:]
+    eig_vals = eig_vals.reshape((-1,) + (1,)*len(targets))
+    maes = np.zeros((len(regs),) + targets, dtype=np.float64)
+    loo_maes = np.zeros((len(regs),) + targets, dtype=np.float64)
+    if return_alphas:
+        alphas = np.zeros((training_size,) + targets + (len(regs),),
+                          dtype=np.float64)
+    for i, reg in enumerate(regs):
+        coef = Qt_Y / (eig_vals + reg)
+        Y_pr = np.dot(K_te_Q, coef)
+        maes[i] = _mae(Y_pr, Y_te)
+        if return_alphas or loo:
+            alpha = np.dot(Q, coef)
+        if return_alphas:
+            alphas[..., i] = alpha
+        if loo:
+            K_inv_diag = np.dot(Q_sq, 1.0 / (eig_vals + reg))
+            loo_maes[i] = _mae(alpha / K_inv_diag, 0.0)
+        if show_msgs:
+            _print_mae(f'{identifier} (reg={reg:.2e})', maes[i])
+            if loo:
+                _print_mae(f'{identifier} (reg={reg:.2e}, LOO)', loo_maes[i])
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'\t{identifier} regularization path ML took {tictoc:.4f} '
+               'seconds.', 'GREEN')
+
+    results = (maes, tictoc)
+    if return_alphas:
+        results += (alphas,)
+    if loo:
+        results += (loo_maes,)
+
+    return results
+
+
+def loo_krr(descriptors,
+            labels,
+            sigma=1000.0,
+            identifier=None,
+            kernel='gaussian',
+            metric='l2',
+            reg=1e-8,
+            show_msgs=True):
+    """
+    Closed-form leave-one-out cross validation of krr over all the data.
+    descriptors: array of descriptors.
+    labels: array of labels.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    reg: value added to the kernel diagonal (regularization).
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. No refits are done, the cost is
+        about that of one fit, see cho_loo_residuals.
+    Returns the leave-one-out mae and the total time.
+    """
     tic = time.perf_counter()
-    compounds, energy_pbe0, energy_delta = qm7db(db_path=db_path,
-                                                 is_shuffled=is_shuffled,
-                                                 r_seed=r_seed,
-                                                 use_tf=use_tf)
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    if not data_size == labels.shape[0]:
+        raise ValueError('Labels size is different than descriptors size.')
+
+    if show_msgs:
+        printc(f'{identifier} leave-one-out ML started.', 'GREEN')
+        printc(f'\tData size: {data_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+
+    K = kernel_matrix(descriptors, descriptors, sigma,
+                      kernel=kernel, metric=metric)
+    K[np.diag_indices_from(K)] += reg
+    c_and_lower = LA.cho_factor(K, overwrite_a=True, check_finite=False)
+    alpha = LA.cho_solve(c_and_lower, labels)
+    loo_mae = np.mean(np.abs(cho_loo_residuals(c_and_lower, alpha)))
+
     toc = time.perf_counter()
     tictoc = toc - tic
     if show_msgs:
-        printc(f'Data reading took {tictoc:.4f} seconds.', 'CYAN')
+        printc(f'\tLOO MAE for {identifier}: {loo_mae:.4f}', 'GREEN')
+        printc(f'\t{identifier} leave-one-out ML took {tictoc:.4f} seconds.',
+               'GREEN')
 
-    # Matrices calculation.
+    return loo_mae, tictoc
+
+
+def _cv_fold(K,
+             labels,
+             tr_idx,
+             va_idx,
+             reg):
+    """
+    Fits and validates one fold from the full kernel matrix.
+    K: full kernel matrix (or shared memory name and shape, see krr_cv).
+    labels: array of labels.
+    tr_idx: training indices of the fold.
+    va_idx: validation indices of the fold.
+    reg: value added to the kernel diagonal (regularization).
+    Returns the fold mae and time.
+    """
     tic = time.perf_counter()
-    for compound in compounds:
-        if 'CM' in identifiers:
-            compound.gen_cm(size=size,
-                            sort=sort,
-                            flatten=flatten,
-                            as_eig=as_eig,
-                            bohr_ru=bohr_ru)
-        if 'LJM' in identifiers:
-            compound.gen_ljm(diag_value=diag_value,
-                             sigma=lj_sigma,
-                             epsilon=lj_epsilon,
-                             size=size,
-                             sort=sort,
-                             flatten=flatten,
-                             as_eig=as_eig,
-                             bohr_ru=bohr_ru)
-        if 'AM' in identifiers:
-            compound.gen_hd(size=size,
-                            bohr_ru=bohr_ru)
-            compound.gen_am(use_forces=use_forces,
-                            size=size,
-                            sort=sort,
-                            flatten=flatten)
-        if 'BOB' in identifiers:
-            compound.gen_bob(sort=sort,
-                             acount=acount)
-
-    # Create a numpy array (or tensorflow tensor) for the descriptors.
-    if 'CM' in identifiers:
-        cm_data = np.array([comp.cm for comp in compounds], dtype=np.float64)
-    if 'LJM' in identifiers:
-        ljm_data = np.array([comp.ljm for comp in compounds], dtype=np.float64)
-    if 'AM' in identifiers:
-        am_data = np.array([comp.am for comp in compounds], dtype=np.float64)
-    if 'BOB' in identifiers:
-        bob_data = np.array([comp.bob for comp in compounds], dtype=np.float64)
+    shm = None
+    if isinstance(K, tuple):
+        shm = shared_memory.SharedMemory(name=K[0])
+        K = np.ndarray(K[1], dtype=np.float64, buffer=shm.buf)
 
-    if use_tf:
-        if tf.config.experimental.list_physical_devices('GPU'):
-            with tf.device('GPU:0'):
-                if 'CM' in identifiers:
-                    cm_data = tf.convert_to_tensor(cm_data)
-                if 'LJM' in identifiers:
-                    ljm_data = tf.convert_to_tensor(ljm_data)
-                if 'AM' in identifiers:
-                    am_data = tf.convert_to_tensor(am_data)
-                if 'BOB' in identifiers:
-                    bob_data = tf.convert_to_tensor(bob_data)
-        else:
-            raise TypeError('No GPU found, could not create Tensor objects.')
+    K_tr = K[np.ix_(tr_idx, tr_idx)]
+    K_va = K[np.ix_(va_idx, tr_idx)]
+    if shm is not None:
+        del K
+        shm.close()
+
+    K_tr[np.diag_indices_from(K_tr)] += reg
+    alpha = LA.cho_solve(LA.cho_factor(K_tr,
+                                       overwrite_a=True,
+                                       check_finite=False),
+                         labels[tr_idx])
+    mae = np.mean(np.abs(np.dot(K_va, alpha) - labels[va_idx]))
+
+    return mae, time.perf_counter() - tic
+
+
+def krr_cv(descriptors,
+           labels,
+           k=5,
+           sigma=1000.0,
+           identifier=None,
+           kernel='gaussian',
+           metric='l2',
+           reg=1e-8,
+           workers=1,
+           show_msgs=True):
+    """
+    K-fold cross validation of krr sharing one kernel matrix for all folds.
+    descriptors: array of descriptors (the whole training pool).
+    labels: array of labels.
+    k: number of folds.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    reg: value added to the kernel diagonal (regularization).
+    workers: number of processes for the folds. The kernel is shared with
+        them through shared memory, not copied.
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. The folds are contiguous, so
+        the data should be shuffled already (as done by qm7db).
+    Returns the array of fold maes, the array of fold times and the mean mae.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    if not data_size == labels.shape[0]:
+        raise ValueError('Labels size is different than descriptors size.')
+
+    if k < 2 or k > data_size:
+        raise ValueError('Number of folds must be between 2 and data size.')
+
+    if show_msgs:
+        printc(f'{identifier} {k}-fold CV ML started.', 'GREEN')
+        printc(f'\tData size: {data_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tWorkers: {workers}', 'CYAN')
+
+    labels = np.asarray(labels, dtype=np.float64)
+    folds = np.array_split(np.arange(data_size), k)
+    splits = [(np.concatenate(folds[:i] + folds[i + 1:]), folds[i])
+              for i in range(k)]
+
+    if workers > 1:
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=data_size**2 * 8)
+        try:
+            K = np.ndarray((data_size, data_size),
+                           dtype=np.float64,
+                           buffer=shm.buf)
+            K[:] = kernel_matrix(descriptors, descriptors, sigma,
+                                 kernel=kernel, metric=metric)
+            del K
+            K_ref = (shm.name, (data_size, data_size))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_cv_fold,
+                                            [K_ref]*k,
+                                            [labels]*k,
+                                            [tr for tr, _ in splits],
+                                            [va for _, va in splits],
+                                            [reg]*k))
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        K = kernel_matrix(descriptors, descriptors, sigma,
+                          kernel=kernel, metric=metric)
+        results = [_cv_fold(K, labels, tr, va, reg) for tr, va in splits]
+
+    maes = np.array([mae for mae, _ in results], dtype=np.float64)
+    tictocs = np.array([tictoc for _, tictoc in results], dtype=np.float64)
+    mean_mae = np.mean(maes)
 
     toc = time.perf_counter()
     tictoc = toc - tic
     if show_msgs:
-        printc(f'Matrices calculation took {tictoc:.4f} seconds.', 'CYAN')
-
-    # ML calculation.
-    if 'CM' in identifiers:
-        cm_mae, cm_tictoc = krr(cm_data,
-                                energy_pbe0,
-                                training_size=training_size,
-                                test_size=test_size,
-                                sigma=sigma,
-                                identifier='CM',
-                                kernel='gaussian',
-                                use_tf=use_tf,
-                                show_msgs=show_msgs)
-    if 'LJM' in identifiers:
-        ljm_mae, ljm_tictoc = krr(ljm_data,
-                                  energy_pbe0,
-                                  training_size=training_size,
-                                  test_size=test_size,
-                                  sigma=sigma,
-                                  identifier='LJM',
-                                  kernel='gaussian',
-                                  use_tf=use_tf,
-                                  show_msgs=show_msgs)
-    if 'AM' in identifiers:
-        am_mae, am_tictoc = krr(am_data,
-                                energy_pbe0,
-                                training_size=training_size,
-                                test_size=test_size,
-                                sigma=sigma,
-                                identifier='AM',
-                                kernel='gaussian',
-                                use_tf=use_tf,
-                                show_msgs=show_msgs)
-    if 'BOB' in identifiers:
-        bob_mae, bob_tictoc = krr(bob_data,
-                                  energy_pbe0,
-                                  training_size=training_size,
-                                  test_size=test_size,
-                                  sigma=sigma,
-                                  identifier='BOB',
-                                  kernel='laplacian',
-                                  use_tf=use_tf,
-                                  show_msgs=show_msgs)
+        for i in range(k):
+            printc(f'\tFold {i}: MAE {maes[i]:.4f}, {tictocs[i]:.4f} seconds.',
+                   'CYAN')
+        printc(f'\tMean MAE for {identifier}: {mean_mae:.4f}', 'GREEN')
+        printc(f'\t{identifier} {k}-fold CV ML took {tictoc:.4f} seconds.',
+               'GREEN')
 
-    # End of program
-    end_time = time.perf_counter()
-    totaltime = end_time - init_time
-    printc(f'Program took {totaltime:.4f} seconds.', 'CYAN')
+    return maes, tictocs, mean_mae
+
+
+def learning_curve_krr(descriptors,
+                       labels,
+                       training_sizes,
+                       test_size=None,
+                       sigma=1000.0,
+                       identifier=None,
+                       kernel='gaussian',
+                       metric='l2',
+                       reg=1e-8,
+                       show_msgs=True):
+    """
+    Learning curve of krr for nested training sets, with one kernel build.
+    descriptors: array of descriptors.
+    labels: array of labels.
+    training_sizes: list of training sizes, training sets are nested
+        (the first molecules of the data).
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules (after the biggest training set) are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    reg: value added to the kernel diagonal (regularization).
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. The kernel for the biggest
+        training set is built once and the cholesky factor is extended block
+        by block (see cho_extend), so the total cost is about that of the
+        biggest fit. The same test set is used for every size.
+    Returns the array of maes (one per training size, sorted) and the
+        total time.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+    training_sizes = sorted(training_sizes)
+    max_size = training_sizes[-1]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             max_size,
+                             test_size)
+
+    if show_msgs:
+        printc(f'{identifier} learning curve ML started.', 'GREEN')
+        printc(f'\tTraining sizes: {training_sizes}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+
+    X_tr = descriptors[:max_size]
+    Y_tr = labels[:max_size]
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    # The lower triangle of K is replaced by the factor as it grows.
+    K = kernel_matrix(X_tr, X_tr, sigma, kernel=kernel, metric=metric)
+    K_te = kernel_matrix(X_te, X_tr, sigma, kernel=kernel, metric=metric)
+
+    maes = np.zeros(len(training_sizes), dtype=np.float64)
+    n0 = 0
+    for i, n1 in enumerate(training_sizes):
+        # Adding a small value on the diagonal for cho_solve.
+        cho_extend(K, n0, n1, reg=reg)
+        alpha = LA.cho_solve((K[:n1, :n1], True), Y_tr[:n1])
+        Y_pr = np.dot(K_te[:, :n1], alpha)
+        maes[i] = np.mean(np.abs(Y_pr - Y_te))
+        n0 = n1
+        if show_msgs:
+            printc(f'\tMAE for {identifier} (training size={n1}): '
+                   f'{maes[i]:.4f}', 'GREEN')
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'\t{identifier} learning curve ML took {tictoc:.4f} seconds.',
+               'GREEN')
+
+    return maes, tictoc
+
+
+def ooc_krr(descriptors,
+            labels,
+            training_size=1500,
+            test_size=None,
+            sigma=1000.0,
+            identifier=None,
+            kernel='gaussian',
+            metric='l2',
+            tmp_dir=None,
+            block_size=4096,
+            reg=1e-8,
+            show_msgs=True):
+    """
+    Out-of-core krr, the kernels are stored in memory-mapped files.
+    descriptors: array of descriptors.
+    labels: array of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    tmp_dir: directory where the kernel files are written. If None,
+        the default temporary directory is used.
+    block_size: number of rows and columns of each tile. Peak memory is
+        about three tiles, so it should be as big as memory allows.
+    reg: value added to the kernel diagonal (regularization).
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. The kernel files are deleted
+        at the end.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if show_msgs:
+        printc(f'{identifier} out-of-core ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tBlock size: {block_size}', 'CYAN')
+
+    X_tr = descriptors[:training_size]
+    Y_tr = labels[:training_size]
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    work_dir = tempfile.mkdtemp(prefix='ml_exp_', dir=tmp_dir)
+    try:
+        K_tr = kernel_memmap(X_tr,
+                             X_tr,
+                             sigma,
+                             os.path.join(work_dir, 'K_tr.npy'),
+                             kernel=kernel,
+                             metric=metric,
+                             block_size=block_size,
+                             lower_only=True)
+
+        # Adding a small value on the diagonal for the cholesky solve.
+        diag = np.arange(training_size)
+        K_tr[diag, diag] += reg
+        ooc_cholesky(K_tr, block_size=block_size)
+        alpha = ooc_cho_solve(K_tr, Y_tr, block_size=block_size)
+        del K_tr
+
+        K_te = kernel_memmap(X_te,
+                             X_tr,
+                             sigma,
+                             os.path.join(work_dir, 'K_te.npy'),
+                             kernel=kernel,
+                             metric=metric,
+                             block_size=block_size)
+        Y_pr = ooc_dot(K_te, alpha, block_size=block_size)
+        del K_te
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    mae = _mae(Y_pr, Y_te)
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        _print_mae(identifier, mae)
+        printc(f'\t{identifier} out-of-core ML took {tictoc:.4f} seconds.',
+               'GREEN')
+
+    return mae, tictoc
+
+
+def nystrom_krr(descriptors,
+                labels,
+                training_size=1500,
+                test_size=None,
+                sigma=1000.0,
+                identifier=None,
+                kernel='gaussian',
+                metric='l2',
+                n_landmarks=500,
+                landmark_method='uniform',
+                r_seed=111,
+                reg=1e-8,
+                show_msgs=True):
+    """
+    Nystrom low-rank krr, only the NxM and MxM kernel blocks are built.
+    descriptors: array of descriptors.
+    labels: array of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_landmarks: number of landmark molecules (M).
+    landmark_method: 'uniform', 'kmeans' or 'leverage', see select_landmarks.
+    r_seed: random seed for the landmark selection.
+    reg: value added to the diagonal of the feature system
+        (regularization).
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. The cost is O(NM^2) time and
+        O(NM) memory instead of O(N^3) and O(N^2).
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if show_msgs:
+        printc(f'{identifier} Nystrom ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tLandmarks: {n_landmarks} ({landmark_method})', 'CYAN')
+
+    X_tr = descriptors[:training_size]
+    Y_tr = labels[:training_size]
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    idx = select_landmarks(X_tr,
+                           n_landmarks,
+                           method=landmark_method,
+                           sigma=sigma,
+                           kernel=kernel,
+                           metric=metric,
+                           r_seed=r_seed)
+    X_lm = X_tr[idx]
+
+    # Adding a small value on the diagonal for the cholesky factorization.
+    K_mm = kernel_matrix(X_lm, X_lm, sigma, kernel=kernel, metric=metric)
+    K_mm[np.diag_indices_from(K_mm)] += 1e-8
+    L_mm = LA.cholesky(K_mm, lower=True)
+
+    # Nystrom features, K ~ phi phi^T with phi = K_nm L_mm^-T.
+    phi = LA.solve_triangular(L_mm,
+                              kernel_matrix(X_lm, X_tr, sigma,
+                                            kernel=kernel, metric=metric),
+                              lower=True).T
+    A = np.dot(phi.T, phi)
+    A[np.diag_indices_from(A)] += reg
+    w = LA.cho_solve(LA.cho_factor(A), np.dot(phi.T, Y_tr))
+
+    # Landmark weights, so predictions only need K(X_te, X_lm).
+    alpha = LA.solve_triangular(L_mm, w, trans='T', lower=True)
+    Y_pr = np.dot(kernel_matrix(X_te, X_lm, sigma,
+                                kernel=kernel, metric=metric), alpha)
+
+    mae = _mae(Y_pr, Y_te)
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        _print_mae(identifier, mae)
+        printc(f'\t{identifier} Nystrom ML took {tictoc:.4f} seconds.',
+               'GREEN')
+
+    return mae, tictoc
+
+
+def rff_krr(descriptors,
+            labels,
+            training_size=1500,
+            test_size=None,
+            sigma=1000.0,
+            identifier=None,
+            kernel='gaussian',
+            metric='l2',
+            n_features=2000,
+            batch_size=1000,
+            r_seed=111,
+            reg=1e-8,
+            show_msgs=True):
+    """
+    Random Fourier features krr, a D-dimensional linear ridge regression.
+    descriptors: array of descriptors.
+    labels: array of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use, 'gaussian' or 'laplacian'.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_features: number of random features (D).
+    batch_size: number of molecules per mini-batch.
+    r_seed: random seed for the random features.
+    reg: value added to the diagonal of the feature system
+        (regularization).
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. Training streams mini-batches
+        and is O(ND^2), prediction is O(D) per molecule.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if show_msgs:
+        printc(f'{identifier} random features ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tFeatures: {n_features}', 'CYAN')
+
+    n_dims = np.prod(descriptors.shape[1:])
+    W, b = sample_fourier_weights(n_dims,
+                                  n_features,
+                                  sigma,
+                                  kernel=kernel,
+                                  metric=metric,
+                                  r_seed=r_seed)
+
+    # Normal equations accumulated over the training mini-batches.
+    A = np.zeros((n_features, n_features), dtype=np.float64)
+    c = np.zeros((n_features,) + labels.shape[1:], dtype=np.float64)
+    for i in range(0, training_size, batch_size):
+        i_end = min(i + batch_size, training_size)
+        Z = random_fourier_features(descriptors[i:i_end], W, b)
+        A += np.dot(Z.T, Z)
+        c += np.dot(Z.T, labels[i:i_end])
+
+    # Adding a small value on the diagonal for cho_solve.
+    A[np.diag_indices_from(A)] += reg
+    w = LA.cho_solve(LA.cho_factor(A, overwrite_a=True), c)
+
+    Y_te = labels[-test_size:]
+    Y_pr = np.empty((test_size,) + labels.shape[1:], dtype=np.float64)
+    for i in range(0, test_size, batch_size):
+        i_end = min(i + batch_size, test_size)
+        Z = random_fourier_features(descriptors[data_size - test_size + i:
+                                                data_size - test_size + i_end],
+                                    W, b)
+        Y_pr[i:i_end] = np.dot(Z, w)
+
+    mae = _mae(Y_pr, Y_te)
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        _print_mae(identifier, mae)
+        printc(f'\t{identifier} random features ML took {tictoc:.4f} '
+               'seconds.', 'GREEN')
+
+    return mae, tictoc
+
+
+def cg_krr(descriptors,
+           labels,
+           training_size=1500,
+           test_size=None,
+           sigma=1000.0,
+           identifier=None,
+           kernel='gaussian',
+           metric='l2',
+           reg=1e-8,
+           preconditioner='nystrom',
+           n_landmarks=500,
+           tol=1e-6,
+           maxiter=None,
+           block_size=1024,
+           r_seed=111,
+           return_iters=False,
+           show_msgs=True):
+    """
+    Matrix-free krr solved with preconditioned conjugate gradient.
+    descriptors: array of descriptors.
+    labels: array of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    reg: value added to the kernel diagonal (regularization). The number of
+        iterations grows with the condition number, values of about 1e-6 or
+        bigger are recommended.
+    preconditioner: 'nystrom' (low-rank plus diagonal, with n_landmarks
+        uniform landmarks), 'jacobi' (block-jacobi, blocks of block_size)
+        or None. The nystrom one needs reg > 0 (it divides by reg, Woodbury
+        identity) and its iterations grow like sqrt(1 + lambda / reg), with
+        lambda the biggest eigenvalue of the part of the kernel the
+        landmarks miss. So reg shouldn't be much smaller than lambda: on
+        qm7 CM (1500 molecules, 500 landmarks) lambda is about 1e-5 for
+        sigma=1000, where reg=1e-8 takes 14 iterations, but about 5e-2 for
+        sigma=50, where reg=1e-8 doesn't converge.
+    n_landmarks: number of landmarks for the nystrom preconditioner.
+    tol: tolerance on the relative residual.
+    maxiter: maximum number of iterations, defaults to training_size.
+    block_size: number of rows per kernel tile.
+    r_seed: random seed for the landmark selection.
+    return_iters: if the number of iterations should also be returned.
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. K_tr is never stored, each
+        iteration recomputes it by tiles, so memory is O(N*d + N*M). If the
+        relative residual doesn't reach tol in maxiter iterations a
+        RuntimeWarning is issued, the mae is then of an unconverged model.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if show_msgs:
+        printc(f'{identifier} CG ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tPreconditioner: {preconditioner}', 'CYAN')
+
+    X_tr = descriptors[:training_size]
+    Y_tr = np.asarray(labels[:training_size], dtype=np.float64)
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    X_tr_sq = None
+    if kernel == 'gaussian' or (kernel == 'laplacian' and metric == 'l2'):
+        X_tr_sq = squared_norms(X_tr)
+
+    def matvec(v):
+        Kv = kernel_matvec(X_tr, X_tr, v, sigma,
+                           kernel=kernel,
+                           metric=metric,
+                           block_size=block_size,
+                           X2_sq=X_tr_sq)
+        Kv += reg * v
+        return Kv
+
+    if preconditioner == 'nystrom':
+        if reg <= 0.0:
+            raise ValueError('The nystrom preconditioner needs reg > 0.')
+        # P = phi phi^T + reg I, inverted with the Woodbury identity.
+        idx = select_landmarks(X_tr, n_landmarks, r_seed=r_seed)
+        K_mm = kernel_matrix(X_tr[idx], X_tr[idx], sigma,
+                             kernel=kernel, metric=metric)
+        K_mm[np.diag_indices_from(K_mm)] += 1e-8
+        phi = LA.solve_triangular(LA.cholesky(K_mm, lower=True),
+                                  kernel_matrix(X_tr[idx], X_tr, sigma,
+                                                kernel=kernel, metric=metric),
+                                  lower=True).T
+        A = np.dot(phi.T, phi)
+        A[np.diag_indices_from(A)] += reg
+        A_cho = LA.cho_factor(A, overwrite_a=True)
+
+        def precond(r):
+            return (r - np.dot(phi, LA.cho_solve(A_cho,
+                                                 np.dot(phi.T, r)))) / reg
+
+    elif preconditioner == 'jacobi':
+        blocks = []
+        for i in range(0, training_size, block_size):
+            i_end = min(i + block_size, training_size)
+            K_bb = kernel_matrix(X_tr[i:i_end], X_tr[i:i_end], sigma,
+                                 kernel=kernel, metric=metric)
+            K_bb[np.diag_indices_from(K_bb)] += reg
+            blocks.append((i, i_end, LA.cho_factor(K_bb, overwrite_a=True)))
+
+        def precond(r):
+            z = np.empty_like(r)
+            for i, i_end, K_cho in blocks:
+                z[i:i_end] = LA.cho_solve(K_cho, r[i:i_end])
+            return z
+
+    elif preconditioner is None:
+        precond = None
+
+    else:
+        raise TypeError(f'{preconditioner} preconditioner not found.')
+
+    alpha, n_iter, converged = pcg(matvec, Y_tr, precond=precond, tol=tol,
+                                   maxiter=maxiter)
+    if not converged:
+        warnings.warn(f'CG didn\'t reach tol={tol:.0e} in {n_iter} '
+                      f'iterations (reg={reg:.0e}, preconditioner='
+                      f'{preconditioner}), the model is not converged. Use '
+                      'a bigger reg or maxiter, or another preconditioner.',
+                      RuntimeWarning)
+
+    Y_pr = kernel_matvec(X_te, X_tr, alpha, sigma,
+                         kernel=kernel,
+                         metric=metric,
+                         block_size=block_size,
+                         X2_sq=X_tr_sq)
+    mae = _mae(Y_pr, Y_te)
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'\tCG iterations: {n_iter} (converged: {converged})', 'CYAN')
+        _print_mae(identifier, mae)
+        printc(f'\t{identifier} CG ML took {tictoc:.4f} seconds.', 'GREEN')
+
+    if return_iters:
+        return mae, tictoc, n_iter
+
+    return mae, tictoc
+
+
+def mixed_krr(descriptors,
+              labels,
+              training_size=1500,
+              test_size=None,
+              sigma=1000.0,
+              identifier=None,
+              kernel='gaussian',
+              metric='l2',
+              reg=1e-8,
+              shift=None,
+              tol=1e-6,
+              maxiter=100,
+              block_size=256,
+              return_iters=False,
+              show_msgs=True):
+    """
+    Memory-lean krr with a float32 factorization and float64 refinement.
+    descriptors: array of descriptors.
+    labels: array of labels, or (data size, targets) matrix of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    reg: value added to the kernel diagonal (regularization) of the float64
+        system that is actually solved. The number of refinement steps grows
+        as reg gets smaller than shift, values of about 1e-6 or bigger are
+        recommended.
+    shift: value added to the diagonal of the float32 kernel before
+        factorizing it. Rounding the kernel to float32 perturbs it by about
+        training_size * eps, so a smaller diagonal breaks the factorization.
+        Defaults to max(reg, training_size * eps) (eps of float32).
+    tol: tolerance on the relative float64 residual.
+    maxiter: maximum number of refinement steps. If tol isn't reached by
+        then a RuntimeWarning is issued, the mae is then of an unconverged
+        model.
+    block_size: number of rows per kernel tile for the residuals and
+        the predictions.
+    return_iters: if the number of refinement steps should also be returned.
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. Only one (training size)^2
+        float32 matrix is stored: the kernel is built in it, its diagonal is
+        shifted in-place and it's overwritten by its lower cholesky factor.
+        The refinement is conjugate gradient on the float64 system (with
+        the residuals computed by tiles, see kernel_matvec) preconditioned
+        by the float32 factor, so with shift == reg the first step is the
+        plain float32 solve. K_te is never stored.
+    NOTE: the gain is memory, a quarter of the float64 cholesky. Time-wise
+        the float32 factorization saves about half of the O(N^3) one, but
+        every refinement step rebuilds the whole kernel by tiles, O(N^2 d)
+        plus N^2 exponentials. So it is only faster for big training sets
+        and reg close to shift (a few steps). On qm7 CM with 1500 training
+        molecules (sigma=1000) it took 10 steps for reg=1e-4 (0.34 s
+        against 0.10 s for the float64 cholesky), 84 for reg=1e-6 (2.2 s)
+        and 549 for reg=1e-8 (18.7 s), so for small reg use it only when
+        the float64 kernel doesn't fit in memory.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if shift is None:
+        shift = max(reg, training_size * np.finfo(np.float32).eps)
+
+    if show_msgs:
+        printc(f'{identifier} mixed precision ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tFloat32 diagonal shift: {shift:.2e}', 'CYAN')
+
+    X_tr = descriptors[:training_size]
+    Y_tr = np.asarray(labels[:training_size], dtype=np.float64)
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    X_tr_sq = None
+    if kernel in ['gaussian', 'laplacian']:
+        if kernel == 'gaussian':
+            metric = 'l2'
+        if metric == 'l2':
+            X_tr_sq = squared_norms(X_tr)
+        K_tr = distance_matrix(X_tr,
+                               X_tr,
+                               metric=metric,
+                               squared=kernel == 'gaussian',
+                               X2_sq=X_tr_sq,
+                               dtype=np.float32)
+        kernel_from_distance(K_tr, sigma, kernel=kernel, out=K_tr)
+    elif kernel == 'wasserstein':
+        K_tr = kernel_matrix(X_tr, X_tr, sigma,
+                             kernel=kernel).astype(np.float32)
+    else:
+        raise TypeError(f'{kernel} kernel not found.')
+
+    K_tr[np.diag_indices_from(K_tr)] += shift
+    # LAPACK works in fortran order, the transposed view of the (symmetric)
+    # kernel is factorized as upper triangular so it isn't copied. In memory
+    # this is the lower triangle of K_tr.
+    try:
+        K_cho = LA.cho_factor(K_tr.T, lower=False, overwrite_a=True,
+                              check_finite=False)
+    except LA.LinAlgError:
+        raise ValueError('The float32 kernel is not positive definite with '
+                         f'a diagonal shift of {shift:.2e}. Use a bigger '
+                         'shift.')
+
+    def matvec(v):
+        Kv = kernel_matvec(X_tr, X_tr, v, sigma,
+                           kernel=kernel,
+                           metric=metric,
+                           block_size=block_size,
+                           X2_sq=X_tr_sq)
+        Kv += reg * v
+        return Kv
+
+    def precond(r):
+        return LA.cho_solve(K_cho, r.astype(np.float32),
+                            check_finite=False).astype(np.float64)
+
+    alpha, n_iter, converged = pcg(matvec, Y_tr, precond=precond, tol=tol,
+                                   maxiter=maxiter)
+    if not converged:
+        warnings.warn(f'Mixed precision refinement didn\'t reach tol='
+                      f'{tol:.0e} in {n_iter} steps (reg={reg:.0e}, shift='
+                      f'{shift:.0e}), the model is not converged. Use a '
+                      'bigger reg or maxiter, or the float64 cholesky.',
+                      RuntimeWarning)
+
+    Y_pr = kernel_matvec(X_te, X_tr, alpha, sigma,
+                         kernel=kernel,
+                         metric=metric,
+                         block_size=block_size,
+                         X2_sq=X_tr_sq)
+    mae = _mae(Y_pr, Y_te)
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'\tRefinement steps: {n_iter} (converged: {converged})',
+               'CYAN')
+        _print_mae(identifier, mae)
+        printc(f'\t{identifier} mixed precision ML took {tictoc:.4f} '
+               'seconds.', 'GREEN')
+
+    if return_iters:
+        return mae, tictoc, n_iter
+
+    return mae, tictoc
+
+
+def local_krr(descriptors,
+              labels,
+              training_size=1500,
+              test_size=None,
+              sigma=1000.0,
+              identifier=None,
+              kernel='gaussian',
+              metric='l2',
+              n_neighbors=100,
+              reg=1e-8,
+              return_times=False,
+              show_msgs=True):
+    """
+    Local krr, each test molecule is predicted by a krr on its neighbors.
+    descriptors: array of descriptors.
+    labels: array of labels, or (data size, targets) matrix of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_neighbors: number of nearest training molecules (k) of each local krr.
+    reg: value added to the local kernel diagonals (regularization).
+    return_times: if the index building and the prediction times should
+        also be returned.
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. The neighbors are found with a
+        kd-tree (gaussian and laplacian kernels) or a vantage-point tree
+        (wasserstein kernel), see NeighborIndex. There is no global
+        training, each prediction costs a tree query plus O(k^3), which
+        doesn't depend on the training size.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if n_neighbors > training_size:
+        raise ValueError('Number of neighbors is greater than the training '
+                         'size.')
+
+    if kernel == 'gaussian':
+        index_metric = 'l2'
+    elif kernel == 'laplacian':
+        index_metric = metric
+    elif kernel == 'wasserstein':
+        index_metric = 'wasserstein'
+    else:
+        raise TypeError(f'{kernel} kernel not found.')
+
+    if show_msgs:
+        printc(f'{identifier} local ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tNeighbors: {n_neighbors}', 'CYAN')
+
+    X_tr = descriptors[:training_size]
+    Y_tr = np.asarray(labels[:training_size], dtype=np.float64)
+    X_te = descriptors[-test_size:]
+    Y_te = labels[-test_size:]
+
+    index = NeighborIndex(X_tr, metric=index_metric)
+    index_time = time.perf_counter() - tic
+
+    tic_pr = time.perf_counter()
+    _, nn = index.query(X_te, k=n_neighbors)
+    Y_pr = np.empty((test_size,) + Y_tr.shape[1:], dtype=np.float64)
+    for i in range(test_size):
+        X_nn = X_tr[nn[i]]
+        K_nn = kernel_matrix(X_nn, X_nn, sigma, kernel=kernel, metric=metric)
+        K_nn[np.diag_indices_from(K_nn)] += reg
+        alpha = LA.cho_solve(LA.cho_factor(K_nn, overwrite_a=True),
+                             Y_tr[nn[i]])
+        Y_pr[i] = np.dot(kernel_matrix(X_te[i:i + 1], X_nn, sigma,
+                                       kernel=kernel, metric=metric)[0],
+                         alpha)
+    predict_time = time.perf_counter() - tic_pr
+
+    mae = _mae(Y_pr, Y_te)
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'\tIndex building took {index_time:.4f} seconds.', 'CYAN')
+        printc(f'\tPrediction took {predict_time:.4f} seconds '
+               f'({1e3*predict_time/test_size:.4f} ms per molecule).', 'CYAN')
+        _print_mae(identifier, mae)
+        printc(f'\t{identifier} local ML took {tictoc:.4f} seconds.',
+               'GREEN')
+
+    if return_times:
+        return mae, tictoc, (index_time, predict_time)
+
+    return mae, tictoc
+
+
+def _dc_fit(X_tr,
+            Y_tr,
+            X_te,
+            sigma,
+            kernel,
+            metric,
+            reg):
+    """
+    Fits the krr of one partition and predicts the test molecules given.
+    X_tr: training descriptors of the partition.
+    Y_tr: training labels of the partition.
+    X_te: test descriptors to predict.
+    sigma: depth of the kernel.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    reg: value added to the kernel diagonal (regularization).
+    Returns the predictions and the time taken.
+    """
+    tic = time.perf_counter()
+    K_tr = kernel_matrix(X_tr, X_tr, sigma, kernel=kernel, metric=metric)
+    K_tr[np.diag_indices_from(K_tr)] += reg
+    alpha = LA.cho_solve(LA.cho_factor(K_tr,
+                                       overwrite_a=True,
+                                       check_finite=False),
+                         Y_tr)
+    Y_pr = np.dot(kernel_matrix(X_te, X_tr, sigma,
+                                kernel=kernel, metric=metric), alpha)
+
+    return Y_pr, time.perf_counter() - tic
+
+
+def dc_krr(descriptors,
+           labels,
+           training_size=1500,
+           test_size=None,
+           sigma=1000.0,
+           identifier=None,
+           kernel='gaussian',
+           metric='l2',
+           n_partitions=4,
+           partition='random',
+           combine='average',
+           reg=1e-8,
+           workers=1,
+           r_seed=111,
+           show_msgs=True):
+    """
+    Divide-and-conquer krr, an ensemble of independent krr on partitions.
+    descriptors: array of descriptors.
+    labels: array of labels, or (data size, targets) matrix of labels.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    identifier: string with the name of the descriptor used.
+    kernel: which kernel to use.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_partitions: number of partitions (P) of the training set.
+    partition: 'random' (equal sizes) or 'kmeans' (clusters of the
+        descriptors, see kmeans).
+    combine: 'average' (mean of the predictions of all partitions) or
+        'route' (each test molecule is predicted by the partition of its
+        nearest centroid, kmeans partitions only). Averaging kmeans
+        partitions gives bad predictions, each model only knows its own
+        region and predicts about 0 far from it.
+    reg: value added to the kernel diagonals (regularization).
+    workers: number of processes, each one fits a partition.
+    r_seed: random seed for the partitions.
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. Each partition costs
+        O((N/P)^3), about P^2 less in total than the exact krr.
+    """
+    tic = time.perf_counter()
+    data_size = descriptors.shape[0]
+
+    if not identifier:
+        identifier = 'NOT SPECIFIED'
+
+    test_size = _check_sizes(data_size,
+                             labels.shape[0],
+                             training_size,
+                             test_size)
+
+    if combine not in ['average', 'route']:
+        raise TypeError(f'{combine} combination not found.')
+
+    if show_msgs:
+        printc(f'{identifier} divide-and-conquer ML started.', 'GREEN')
+        printc(f'\tTraining size: {training_size}', 'CYAN')
+        printc(f'\tTest size: {test_size}', 'CYAN')
+        printc(f'\tSigma: {sigma}', 'CYAN')
+        printc(f'\tKernel: {kernel}', 'CYAN')
+        printc(f'\tPartitions: {n_partitions} ({partition}, {combine})',
+               'CYAN')
+        printc(f'\tWorkers: {workers}', 'CYAN')
+
+    X_tr = np.asarray(descriptors[:training_size], dtype=np.float64)
+    Y_tr = np.asarray(labels[:training_size], dtype=np.float64)
+    X_te = np.asarray(descriptors[-test_size:], dtype=np.float64)
+    Y_te = labels[-test_size:]
+
+    if partition == 'random':
+        if combine == 'route':
+            raise ValueError('Routing needs kmeans partitions.')
+        rng = np.random.default_rng(r_seed)
+        parts = np.array_split(rng.permutation(training_size), n_partitions)
+    elif partition == 'kmeans':
+        centroids, assign = kmeans(X_tr.reshape(training_size, -1),
+                                   n_partitions,
+                                   r_seed=r_seed)
+        parts = [np.flatnonzero(assign == p) for p in range(n_partitions)]
+    else:
+        raise TypeError(f'{partition} partition not found.')
+
+    if combine == 'route':
+        te_assign = np.argmin(distance_matrix(X_te, centroids,
+                                              squared=True), axis=1)
+        te_parts = [np.flatnonzero(te_assign == p)
+                    for p in range(n_partitions)]
+    else:
+        te_parts = [np.arange(test_size)]*n_partitions
+
+    # Empty clusters can't be fitted, their test molecules (if routed) are
+    # left to the other partitions.
+    jobs = [p for p in range(n_partitions)
+            if parts[p].shape[0] > 0 and te_parts[p].shape[0] > 0]
+    args = ([X_tr[parts[p]] for p in jobs],
+            [Y_tr[parts[p]] for p in jobs],
+            [X_te[te_parts[p]] for p in jobs],
+            [sigma]*len(jobs),
+            [kernel]*len(jobs),
+            [metric]*len(jobs),
+            [reg]*len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_dc_fit, *args))
+    else:
+        results = list(map(_dc_fit, *args))
+
+    Y_pr = np.zeros((test_size,) + Y_tr.shape[1:], dtype=np.float64)
+    counts = np.zeros(test_size, dtype=np.float64)
+    for p, (Y_p, _) in zip(jobs, results):
+        Y_pr[te_parts[p]] += Y_p
+        counts[te_parts[p]] += 1.0
+    if np.any(counts == 0.0):
+        raise ValueError('Some test molecules weren\'t routed to a fitted '
+                         'partition.')
+    Y_pr /= counts.reshape((test_size,) + (1,)*(Y_pr.ndim - 1))
+
+    mae = _mae(Y_pr, Y_te)
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        for p, (_, p_tictoc) in zip(jobs, results):
+            printc(f'\tPartition {p}: {parts[p].shape[0]} molecules, '
+                   f'{p_tictoc:.4f} seconds.', 'CYAN')
+        _print_mae(identifier, mae)
+        printc(f'\t{identifier} divide-and-conquer ML took {tictoc:.4f} '
+               'seconds.', 'GREEN')
+
+    return mae, tictoc
+
+
+def multi_krr(db_path='data',
+              db='qm7',
+              targets=None,
+              is_shuffled=True,
+              r_seed=111,
+              diag_value=None,
+              lj_sigma=1.0,
+              lj_epsilon=1.0,
+              use_forces=False,
+              acount={'C':7, 'H':16, 'N':3, 'O':3, 'S':1},
+              size=23,
+              sort=False,
+              flatten=True,
+              as_eig=True,
+              bohr_ru=False,
+              training_size=1500,
+              test_size=None,
+              sigma=1000.0,
+              bob_metric='l2',
+              identifiers=['CM'],
+              use_tf=True,
+              workers=1,
+              cache_dir=None,
+              cache_bytes=2**30,
+              pipelined=False,
+              concurrent_fits=False,
+              show_msgs=True):
+    """
+    Does multiple KRR for several descriptors.
+    db_path: path to the database directory.
+    db: database to use, 'qm7' or 'qm9'.
+    targets: list of names of the properties to fit. For qm7 these are
+        'pbe0' and 'delta' (defaults to ['pbe0']) and for qm9 any of
+        QM9_PROPERTIES (defaults to all of them). All targets are fitted
+        with the same kernel and factorization.
+    is_shuffled: if the resulting list of compounds should be shuffled.
+    r_seed: random seed to use for the shuffling.
+    diag_value: if special diagonal value is to be used.
+    lj_sigma: sigma value.
+    lj_epsilon: epsilon value.
+    use_forces: if the use of forces instead of k_cx should be used.
+    acount: atom count for the compound, defaults to qm7 sizes.
+    size: compound size.
+    sort: if the representation should be sorted row-norm or bag-wise.
+    flatten: if the representation should be 1D.
+    as_eig: if the representation should be as the eigenvalues.
+    bohr_ru: if radius units should be in bohr's radius units.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    bob_metric: norm used by the BOB laplacian kernel, 'l2' or 'l1'.
+    identifiers: list of names (strings) of descriptors to use.
+    use_tf: if tensorflow should be used.
+    workers: number of processes for the descriptors calculation (see
+        gen_descriptors).
+    cache_dir: directory of the descriptor cache (see DescriptorCache). If
+        None, the descriptors are always calculated.
+    cache_bytes: size limit of the descriptor cache.
+    pipelined: if reading, descriptors and kernels should overlap, see
+        pipelined_multi_krr. It doesn't use tensorflow or the cache, and
+        with more than one worker the calling script needs the
+        if __name__ == '__main__' guard.
+    concurrent_fits: if the descriptors are fitted concurrently, only for
+        the pipelined mode.
+    show_msgs: if debug messages should be shown.
+    Returns a dictionary of identifier: (mae, time) of each krr.
+    """
+    if type(identifiers) != list:
+        raise TypeError('\'identifiers\' is not a list.')
+
+    if pipelined:
+        if cache_dir is not None:
+            raise ValueError('The descriptor cache doesn\'t work with the '
+                             'pipelined mode.')
+        return pipelined_multi_krr(db_path=db_path,
+                                   db=db,
+                                   targets=targets,
+                                   is_shuffled=is_shuffled,
+                                   r_seed=r_seed,
+                                   diag_value=diag_value,
+                                   lj_sigma=lj_sigma,
+                                   lj_epsilon=lj_epsilon,
+                                   use_forces=use_forces,
+                                   acount=acount,
+                                   size=size,
+                                   sort=sort,
+                                   flatten=flatten,
+                                   as_eig=as_eig,
+                                   bohr_ru=bohr_ru,
+                                   training_size=training_size,
+                                   test_size=test_size,
+                                   sigma=sigma,
+                                   bob_metric=bob_metric,
+                                   identifiers=identifiers,
+                                   workers=workers,
+                                   concurrent_fits=concurrent_fits,
+                                   show_msgs=show_msgs)
+
+    # If tf is to be used but couldn't be imported, don't try to use it.
+    if use_tf and not TF_AV:
+        use_tf = False
+
+    init_time = time.perf_counter()
+
+    # Data reading.
+    tic = time.perf_counter()
+    if db == 'qm7':
+        if targets is None:
+            targets = ['pbe0']
+        compounds, energy_pbe0, energy_delta = qm7db(db_path=db_path,
+                                                     is_shuffled=is_shuffled,
+                                                     r_seed=r_seed,
+                                                     use_tf=use_tf)
+        qm7_labels = {'pbe0': energy_pbe0, 'delta': energy_delta}
+        for target in targets:
+            if target not in qm7_labels:
+                raise ValueError(f'{target} target not found for qm7.')
+        if len(targets) == 1:
+            labels = qm7_labels[targets[0]]
+        elif use_tf:
+            labels = tf.stack([qm7_labels[t] for t in targets], axis=1)
+        else:
+            labels = np.column_stack([qm7_labels[t] for t in targets])
+    elif db == 'qm9':
+        if targets is None:
+            targets = QM9_PROPERTIES
+        for target in targets:
+            if target not in QM9_PROPERTIES:
+                raise ValueError(f'{target} target not found for qm9.')
+        compounds = qm9db(db_path=db_path,
+                          is_shuffled=is_shuffled,
+                          r_seed=r_seed,
+                          use_tf=use_tf)
+        indices = [QM9_PROPERTIES.index(t) for t in targets]
+        labels = np.array([comp.qm9prop for comp in compounds],
+                          dtype=np.float64)[:, indices]
+        if len(targets) == 1:
+            labels = labels[:, 0]
+        if use_tf:
+            labels = tf.convert_to_tensor(labels)
+    else:
+        raise ValueError(f'{db} database not found.')
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'Data reading took {tictoc:.4f} seconds.', 'CYAN')
+
+    # Matrices calculation.
+    tic = time.perf_counter()
+    if cache_dir is None:
+        cache = None
+    else:
+        cache = DescriptorCache(cache_dir, max_bytes=cache_bytes)
+    descriptors, shms = gen_descriptors(compounds,
+                                        identifiers=identifiers,
+                                        diag_value=diag_value,
+                                        lj_sigma=lj_sigma,
+                                        lj_epsilon=lj_epsilon,
+                                        use_forces=use_forces,
+                                        acount=acount,
+                                        size=size,
+                                        sort=sort,
+                                        flatten=flatten,
+                                        as_eig=as_eig,
+                                        bohr_ru=bohr_ru,
+                                        workers=workers,
+                                        cache=cache,
+                                        show_msgs=show_msgs)
+
+    try:
+        if use_tf:
+            if tf.config.experimental.list_physical_devices('GPU'):
+                with tf.device('GPU:0'):
+                    for identifier in identifiers:
+                        descriptors[identifier] = \
+                            tf.convert_to_tensor(descriptors[identifier])
+            else:
+                raise TypeError('No GPU found, could not create Tensor '
+                                'objects.')
+
+        toc = time.perf_counter()
+        tictoc = toc - tic
+        if show_msgs:
+            printc(f'Matrices calculation took {tictoc:.4f} seconds.', 'CYAN')
+
+        # ML calculation.
+        results = dict()
+        for identifier in identifiers:
+            if identifier == 'BOB':
+                kernel = 'laplacian'
+                metric = bob_metric
+            else:
+                kernel = 'gaussian'
+                metric = 'l2'
+            results[identifier] = krr(descriptors[identifier],
+                                      labels,
+                                      training_size=training_size,
+                                      test_size=test_size,
+                                      sigma=sigma,
+                                      identifier=identifier,
+                                      kernel=kernel,
+                                      metric=metric,
+                                      use_tf=use_tf,
+                                      show_msgs=show_msgs)
+    finally:
+        release_descriptors(descriptors, shms)
+
+    # End of program
+    end_time = time.perf_counter()
+    totaltime = end_time - init_time
+    printc(f'Program took {totaltime:.4f} seconds.', 'CYAN')
+
+    return results
+
+
+def _put(q,
+         item,
+         stop):
+    """
+    Puts an item in a bounded queue, giving up if the pipeline stopped.
+    q: queue.
+    item: item to put.
+    stop: threading event set when any stage fails.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _get(q,
+         stop):
+    """
+    Gets an item from a queue, None if the pipeline stopped.
+    q: queue.
+    stop: threading event set when any stage fails.
+    """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+    return None
+
+
+def _pipeline_stage(body,
+                    stop,
+                    errors,
+                    out_queues,
+                    *args):
+    """
+    Runs a pipeline stage, stopping the pipeline if it fails.
+    body: function of the stage.
+    stop: threading event set when any stage fails.
+    errors: list where the exception is added.
+    out_queues: queues of the next stages, which get None at the end.
+    args: arguments of body.
+    """
+    try:
+        body(*args)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        for q in out_queues:
+            _put(q, None, stop)
+
+
+def pipelined_multi_krr(db_path='data',
+                        db='qm7',
+                        targets=None,
+                        is_shuffled=True,
+                        r_seed=111,
+                        diag_value=None,
+                        lj_sigma=1.0,
+                        lj_epsilon=1.0,
+                        use_forces=False,
+                        acount={'C':7, 'H':16, 'N':3, 'O':3, 'S':1},
+                        size=23,
+                        sort=False,
+                        flatten=True,
+                        as_eig=True,
+                        bohr_ru=False,
+                        training_size=1500,
+                        test_size=None,
+                        sigma=1000.0,
+                        bob_metric='l2',
+                        identifiers=['CM'],
+                        reg=1e-8,
+                        workers=1,
+                        concurrent_fits=False,
+                        batch_size=512,
+                        queue_size=4,
+                        show_msgs=True):
+    """
+    Does multiple KRR for several descriptors, overlapping the stages.
+    db_path: path to the database directory.
+    db: database to use, 'qm7' or 'qm9'.
+    targets: list of names of the properties to fit, see multi_krr.
+    is_shuffled: if the resulting list of compounds should be shuffled.
+    r_seed: random seed to use for the shuffling.
+    diag_value: if special diagonal value is to be used.
+    lj_sigma: sigma value.
+    lj_epsilon: epsilon value.
+    use_forces: if the use of forces instead of k_cx should be used.
+    acount: atom count for the compound, defaults to qm7 sizes.
+    size: compound size.
+    sort: if the representation should be sorted row-norm or bag-wise.
+    flatten: if the representation should be 1D.
+    as_eig: if the representation should be as the eigenvalues.
+    bohr_ru: if radius units should be in bohr's radius units.
+    training_size: size of the training set to use.
+    test_size: size of the test set to use. If no size is given,
+        the last remaining molecules are used.
+    sigma: depth of the kernel.
+    bob_metric: norm used by the BOB laplacian kernel, 'l2' or 'l1'.
+    identifiers: list of names (strings) of descriptors to use.
+    reg: value added to the kernel diagonal (regularization).
+    workers: number of processes for the descriptors. With more than one
+        they write into shared memory, see gen_descriptors. The processes
+        are spawned, not forked (unlike gen_descriptors), since the other
+        stages are threads already running, so a calling script needs the
+        if __name__ == '__main__' guard, otherwise the pool fails with
+        BrokenProcessPool.
+    concurrent_fits: if each descriptor has its own kernel and solve thread,
+        instead of one thread doing them in turn.
+    batch_size: number of molecules per batch.
+    queue_size: maximum number of batches waiting between two stages.
+    show_msgs: if debug messages should be shown.
+    Returns a dictionary of identifier: (mae, time) of each krr, the time
+        being its kernel tiles plus the solve.
+    NOTE: a reader thread parses the molecules in batches (in the shuffled
+        order, and only the training and test ones), the descriptor stage
+        fills the rows of each batch and the fit threads compute the kernel
+        tiles of each new batch against the rows before it. The queues are
+        bounded, so a slow stage holds back the ones before it. This doesn't
+        work with tensorflow.
+    """
+    if type(identifiers) != list:
+        raise TypeError('\'identifiers\' is not a list.')
+
+    init_time = time.perf_counter()
+
+    # The list of molecules (and the qm7 labels) doesn't need parsing.
+    if db == 'qm7':
+        if targets is None:
+            targets = ['pbe0']
+        for target in targets:
+            if target not in ['pbe0', 'delta']:
+                raise ValueError(f'{target} target not found for qm7.')
+        with open(f'{db_path}/hof_qm7.txt', 'r') as f:
+            lines = [line.split() for line in f.readlines()]
+        names = [line[0] for line in lines]
+        qm7_labels = {'pbe0': np.array([line[1] for line in lines],
+                                       dtype=np.float64)}
+        qm7_labels['delta'] = qm7_labels['pbe0'] - \
+            np.array([line[2] for line in lines], dtype=np.float64)
+        all_labels = np.column_stack([qm7_labels[t] for t in targets])
+    elif db == 'qm9':
+        if targets is None:
+            targets = QM9_PROPERTIES
+        for target in targets:
+            if target not in QM9_PROPERTIES:
+                raise ValueError(f'{target} target not found for qm9.')
+        with open(f'{db_path}/xyz_qm9.txt', 'r') as f:
+            names = [line.strip() for line in f.readlines()]
+        all_labels = None
+        indices = [QM9_PROPERTIES.index(t) for t in targets]
+    else:
+        raise ValueError(f'{db} database not found.')
+
+    # Same order as qm7db and qm9db, shuffling the same number of items.
+    data_size = len(names)
+    order = list(range(data_size))
+    if is_shuffled:
+        random.seed(r_seed)
+        random.shuffle(order)
+    test_size = _check_sizes(data_size, data_size, training_size, test_size)
+    rows = order[:training_size] + order[-test_size:]
+    n_rows = len(rows)
+
+    params = descriptor_params(diag_value=diag_value,
+                               lj_sigma=lj_sigma,
+                               lj_epsilon=lj_epsilon,
+                               use_forces=use_forces,
+                               acount=acount,
+                               size=size,
+                               sort=sort,
+                               flatten=flatten,
+                               as_eig=as_eig,
+                               bohr_ru=bohr_ru)
+
+    if concurrent_fits:
+        groups = [[identifier] for identifier in identifiers]
+    else:
+        groups = [identifiers]
+
+    labels = np.empty((n_rows, len(targets)), dtype=np.float64)
+    descriptors = dict()
+    shms = []
+    busy = {'reading': 0.0, 'descriptors': 0.0}
+    results = dict()
+    stop = threading.Event()
+    errors = []
+    parsed = queue.Queue(maxsize=queue_size)
+    ready = [queue.Queue(maxsize=queue_size) for _ in groups]
+
+    def read_stage():
+        for start in range(0, n_rows, batch_size):
+            tic = time.perf_counter()
+            batch = [rows[i] for i in range(start,
+                                            min(start + batch_size, n_rows))]
+            compounds = [Compound(f'{db_path}/{names[i]}', db=db)
+                         for i in batch]
+            if all_labels is None:
+                labels[start:start + len(batch)] = \
+                    [comp.qm9prop[indices] for comp in compounds]
+            else:
+                labels[start:start + len(batch)] = all_labels[batch]
+            busy['reading'] += time.perf_counter() - tic
+            if not _put(parsed, (start, compounds), stop):
+                return
+
+    # Submitted descriptor batches, in order.
+    pending = deque()
+
+    def descriptor_stage(executor):
+        refs = dict()
+        while True:
+            item = _get(parsed, stop)
+            if item is None:
+                break
+            start, compounds = item
+            if not descriptors:
+                # The first molecule gives the shape of each descriptor.
+                first = compound_descriptors(compounds[0],
+                                             identifiers,
+                                             params)
+                for identifier, value in first.items():
+                    shape = (n_rows,) + np.shape(value)
+                    if executor is None:
+                        descriptors[identifier] = np.empty(shape,
+                                                           dtype=np.float64)
+                        continue
+                    shm = shared_memory.SharedMemory(
+                        create=True, size=int(np.prod(shape))*8)
+                    shms.append(shm)
+                    descriptors[identifier] = np.ndarray(shape,
+                                                         dtype=np.float64,
+                                                         buffer=shm.buf)
+                    refs[identifier] = (shm.name, shape)
+
+            stop_row = start + len(compounds)
+            if executor is None:
+                tictocs = fill_descriptors(compounds, start, identifiers,
+                                           params, descriptors)
+                busy['descriptors'] += sum(tictocs.values())
+                for q in ready:
+                    if not _put(q, (start, stop_row), stop):
+                        return
+                continue
+
+            pending.append((executor.submit(fill_descriptors, compounds,
+                                            start, identifiers, params,
+                                            refs),
+                            start, stop_row))
+            # Batches are passed on in order, keeping a few in flight.
+            while pending and (len(pending) > 2*workers
+                               or pending[0][0].done()):
+                future, a, b = pending.popleft()
+                busy['descriptors'] += sum(future.result().values())
+                for q in ready:
+                    if not _put(q, (a, b), stop):
+                        return
+
+        while pending:
+            future, a, b = pending.popleft()
+            busy['descriptors'] += sum(future.result().values())
+            for q in ready:
+                if not _put(q, (a, b), stop):
+                    return
+
+    def fit_stage(group, in_queue):
+        tictocs = {identifier: 0.0 for identifier in group}
+        K_tr = {identifier: np.empty((training_size, training_size),
+                                     dtype=np.float64)
+                for identifier in group}
+        K_te = {identifier: np.empty((test_size, training_size),
+                                     dtype=np.float64)
+                for identifier in group}
+        kernels = {identifier: ('laplacian', bob_metric) if identifier == 'BOB'
+                   else ('gaussian', 'l2') for identifier in group}
+        while True:
+            item = _get(in_queue, stop)
+            if item is None:
+                break
+            start, stop_row = item
+            for identifier in group:
+                tic = time.perf_counter()
+                X = descriptors[identifier]
+                kernel, metric = kernels[identifier]
+                # New training rows against every training row so far.
+                a, b = start, min(stop_row, training_size)
+                if a < b:
+                    tile = kernel_tile(X[a:b], X[:b], sigma,
+                                       kernel=kernel, metric=metric)
+                    K_tr[identifier][a:b, :b] = tile
+                    K_tr[identifier][:a, a:b] = tile[:, :a].T
+                # Test rows come after all the training rows.
+                a, b = max(start, training_size), stop_row
+                if a < b:
+                    K_te[identifier][a - training_size:b - training_size] = \
+                        kernel_tile(X[a:b], X[:training_size], sigma,
+                                    kernel=kernel, metric=metric)
+                tictocs[identifier] += time.perf_counter() - tic
+
+        if stop.is_set():
+            return
+
+        Y_tr = labels[:training_size]
+        Y_te = labels[training_size:]
+        for identifier in group:
+            tic = time.perf_counter()
+            K = K_tr.pop(identifier)
+            K[np.diag_indices_from(K)] += reg
+            alpha = LA.cho_solve(LA.cho_factor(K, overwrite_a=True), Y_tr)
+            del K
+            mae = _mae(np.dot(K_te.pop(identifier), alpha), Y_te)
+            if len(targets) == 1:
+                mae = mae[0]
+            tictocs[identifier] += time.perf_counter() - tic
+            results[identifier] = (mae, tictocs[identifier])
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=get_context('spawn'))
+    threads = [threading.Thread(target=_pipeline_stage,
+                                args=(read_stage, stop, errors, [parsed])),
+               threading.Thread(target=_pipeline_stage,
+                                args=(descriptor_stage, stop, errors, ready,
+                                      executor))]
+    threads += [threading.Thread(target=_pipeline_stage,
+                                 args=(fit_stage, stop, errors, [], group, q))
+                for group, q in zip(groups, ready)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+        for thread in threads:
+            if thread.is_alive():
+                thread.join()
+        if executor is not None:
+            # Batches left after a failure aren't run (shutdown's
+            # cancel_futures needs python 3.9).
+            for future, _, _ in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+        release_descriptors(descriptors, shms)
+
+    if errors:
+        raise errors[0]
+
+    totaltime = time.perf_counter() - init_time
+    if show_msgs:
+        printc(f'Pipelined ML of {n_rows} molecules ({training_size} '
+               f'training, {test_size} test), {len(groups)} fit threads.',
+               'GREEN')
+        printc(f'\tReading: {busy["reading"]:.4f} s busy.', 'CYAN')
+        printc(f'\tDescriptors: {busy["descriptors"]:.4f} worker seconds '
+               f'({workers} workers).', 'CYAN')
+        for identifier in identifiers:
+            mae, tictoc = results[identifier]
+            _print_mae(identifier, mae)
+            printc(f'\t{identifier} kernel and solve took {tictoc:.4f} '
+                   'seconds.', 'GREEN')
+        printc(f'Program took {totaltime:.4f} seconds.', 'CYAN')
+
+    return results
@@ -0,0 +1,226 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import numpy as np
+from scipy import linalg as LA
+
+
+def ooc_cholesky(A,
+                 block_size=4096):
+    """
+    Blocked, in-place Cholesky factorization for (memory-mapped) matrices.
+    A: symmetric positive definite matrix, only its lower triangle is used.
+        It is overwritten by the lower triangular factor L (A = LL^T).
+    block_size: number of rows and columns of each tile.
+    NOTE: only three tiles are held in memory at a time, so for matrices
+        stored with np.memmap the size is limited by disk and not by RAM.
+        The upper triangle (above the diagonal tiles) is left untouched.
+    """
+    n = A.shape[0]
+    starts = list(range(0, n, block_size))
+
+    for kk, k in enumerate(starts):
+        k_end = min(k + block_size, n)
+
+        # Diagonal tile.
+        L_kk = LA.cholesky(np.array(A[k:k_end, k:k_end]),
+                           lower=True,
+                           check_finite=False)
+        A[k:k_end, k:k_end] = L_kk
+
+        # Panel below the diagonal tile: A_ik = A_ik L_kk^-T.
+        for i in starts[kk + 1:]:
+            i_end = min(i + block_size, n)
+            A[i:i_end, k:k_end] = LA.solve_triangular(L_kk,
+                                                      A[i:i_end, k:k_end].T,
+                                                      lower=True,
+                                                      check_finite=False).T
+
+        # Trailing (lower) submatrix update: A_ij -= L_ik L_jk^T.
+        for jj, j in enumerate(starts[kk + 1:]):
+            j_end = min(j + block_size, n)
+            L_jk = np.array(A[j:j_end, k:k_end])
+            for i in starts[kk + 1 + jj:]:
+                i_end = min(i + block_size, n)
+                A[i:i_end, j:j_end] -= np.dot(A[i:i_end, k:k_end], L_jk.T)
+
+    if isinstance(A, np.memmap):
+        A.flush()
+
+    return A
+
+
+def ooc_cho_solve(L,
+                  b,
+                  block_size=4096):
+    """
+    Solves (LL^T)x = b by tiles, with L as given by ooc_cholesky.
+    L: lower triangular factor, possibly memory-mapped.
+    b: right hand side, vector or matrix (one column per target).
+    block_size: number of rows and columns of each tile.
+    """
+    n = L.shape[0]
+    starts = list(range(0, n, block_size))
+    x = np.array(b, dtype=np.float64)
+
+    # Forward substitution, Ly = b.
+    for ii, i in enumerate(starts):
+        i_end = min(i + block_size, n)
+        for j in starts[:ii]:
+            j_end = min(j + block_size, n)
+            x[i:i_end] -= np.dot(L[i:i_end, j:j_end], x[j:j_end])
+        x[i:i_end] = LA.solve_triangular(L[i:i_end, i:i_end],
+                                         x[i:i_end],
+                                         lower=True,
+                                         check_finite=False)
+
+    # Backward substitution, L^Tx = y.
+    for ii in range(len(starts) - 1, -1, -1):
+        i = starts[ii]
+        i_end = min(i + block_size, n)
+        for j in starts[ii + 1:]:
+            j_end = min(j + block_size, n)
+            x[i:i_end] -= np.dot(L[j:j_end, i:i_end].T, x[j:j_end])
+        x[i:i_end] = LA.solve_triangular(L[i:i_end, i:i_end],
+                                         x[i:i_end],
+                                         trans='T',
+                                         lower=True,
+                                         check_finite=False)
+
+    return x
+
+
+def ooc_dot(A,
+            x,
+            block_size=4096):
+    """
+    Matrix product Ax streaming row tiles of A (possibly memory-mapped).
+    A: matrix.
+    x: vector or matrix.
+    block_size: number of rows of each tile.
+    """
+    n = A.shape[0]
+    y = np.empty((n,) + x.shape[1:], dtype=np.float64)
+    for i in range(0, n, block_size):
+        i_end = min(i + block_size, n)
+        y[i:i_end] = np.dot(A[i:i_end], x)
+
+    return y
+
+
+def cho_loo_residuals(c_and_lower,
+                      alpha):
+    """
+    Exact leave-one-out residuals of krr from the cholesky factor.
+    c_and_lower: factorization of the regularized kernel, as given by
+        scipy.linalg.cho_factor. It is overwritten by the inverse.
+    alpha: krr weights, K^-1 y.
+    NOTE: the residuals are e_i = alpha_i / (K^-1)_ii, the diagonal of the
+        inverse costs about the same as the factorization.
+    """
+    c, lower = c_and_lower
+    K_inv, info = LA.lapack.dpotri(c, lower=lower, overwrite_c=True)
+    if info != 0:
+        raise ValueError('Couldn\'t invert the cholesky factor.')
+
+    return alpha / np.diag(K_inv).reshape((-1,) + (1,)*(alpha.ndim - 1))
+
+
+def cho_extend(A,
+               n0,
+               n1,
+               reg=0.0):
+    """
+    Extends, in place, a lower cholesky factor from size n0 to size n1.
+    A: square array with at least n1 rows. A[:n0, :n0] (lower triangle) holds
+        the current factor, A[:n0, n0:n1] the new kernel columns and
+        A[n0:n1, n0:n1] the new diagonal kernel block.
+    n0: current size of the factor.
+    n1: new size of the factor.
+    reg: value added to the diagonal of the new block (regularization).
+    NOTE: only the new rows of the factor are computed, O(n0^2 (n1 - n0))
+        instead of refactorizing. The upper triangle beyond n1 is untouched,
+        so A can hold the factor (lower) and the kernel (upper) at once.
+    """
+    if n0 > 0:
+        # L_21 = (L_11^-1 K_12)^T.
+        A[n0:n1, :n0] = LA.solve_triangular(A[:n0, :n0],
+                                            A[:n0, n0:n1],
+                                            lower=True,
+                                            check_finite=False).T
+        S = A[n0:n1, n0:n1] - np.dot(A[n0:n1, :n0], A[n0:n1, :n0].T)
+    else:
+        S = np.array(A[n0:n1, n0:n1])
+
+    S[np.diag_indices_from(S)] += reg
+    A[n0:n1, n0:n1] = LA.cholesky(S, lower=True, check_finite=False)
+
+    return A
+
+
+def pcg(matvec,
+        b,
+        precond=None,
+        tol=1e-6,
+        maxiter=None):
+    """
+    Preconditioned conjugate gradient for symmetric positive definite systems.
+    matvec: function returning Ax, so A is never stored.
+    b: right hand side, vector or matrix (columns are solved together).
+    precond: function returning M^-1 r for a preconditioner M ~ A.
+        If None, no preconditioner is used.
+    tol: tolerance on the relative residual |Ax - b| / |b| (every column).
+    maxiter: maximum number of iterations, defaults to the size of b.
+    Returns the solution, the number of iterations done and if the relative
+        residual reached tol. If it didn't (maxiter was hit), the solution is
+        the last, unconverged, iterate.
+    """
+    b = np.asarray(b, dtype=np.float64)
+    if maxiter is None:
+        maxiter = b.shape[0]
+    if precond is None:
+        def precond(r):
+            return r
+
+    x = np.zeros_like(b)
+    r = b.copy()
+    z = precond(r)
+    p = z.copy()
+    rz = np.sum(r*z, axis=0)
+    b_norm = np.atleast_1d(np.linalg.norm(b, axis=0))
+    b_norm[b_norm == 0.0] = 1.0
+
+    n_iter = 0
+    converged = np.all(np.linalg.norm(r, axis=0) / b_norm < tol)
+    while not converged and n_iter < maxiter:
+        Ap = matvec(p)
+        step = rz / np.sum(p*Ap, axis=0)
+        x += step * p
+        r -= step * Ap
+        z = precond(r)
+        rz_new = np.sum(r*z, axis=0)
+        p = z + (rz_new / rz) * p
+        rz = rz_new
+        n_iter += 1
+        converged = np.all(np.linalg.norm(r, axis=0) / b_norm < tol)
+
+    return x, n_iter, bool(converged)
@@ -0,0 +1,337 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import json
+import os
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.kernels import squared_norms, kernel_matrix, kernel_tile,\
+    kernel_matvec
+from ml_exp.linalg import cho_extend
+from ml_exp.decomposition import PCAProjection
+
+
+class KRRModel:
+    def __init__(self,
+                 sigma=1000.0,
+                 kernel='gaussian',
+                 metric='l2',
+                 reg=1e-8,
+                 block_size=1024,
+                 projection=None,
+                 path=None,
+                 mmap=True):
+        """
+        Initialization of the KRR model.
+        sigma: depth of the kernel.
+        kernel: which kernel to use.
+        metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+        reg: value added to the kernel diagonal (regularization).
+        block_size: number of query molecules per prediction tile.
+        projection: PCAProjection applied to every descriptor before the
+            kernel. If it isn't fitted, it is fitted with the training
+            descriptors. It is saved with the model.
+        path: (path to) a saved model directory to load.
+        mmap: if the arrays of a loaded model should be memory-mapped.
+        NOTE: this doesn't work with tensorflow.
+        """
+        # Kernel config.
+        self.sigma = sigma
+        self.kernel = kernel
+        self.metric = metric
+        self.reg = reg
+        self.block_size = block_size
+        self.projection = projection
+
+        # Training data.
+        self.X = None
+        self.X_sq = None
+        self.Y = None
+        self.alpha = None
+
+        # Cholesky factor (lower) in a buffer that can grow, see partial_fit.
+        self.n = 0
+        self.L = None
+
+        if path is not None:
+            self.load(path, mmap=mmap)
+
+    def fit(self,
+            descriptors,
+            labels):
+        """
+        Trains the model.
+        descriptors: array of training descriptors.
+        labels: array of training labels.
+        """
+        if not descriptors.shape[0] == labels.shape[0]:
+            raise ValueError('Labels size is different than descriptors '
+                             'size.')
+
+        if self.projection is not None:
+            if self.projection.components is None:
+                self.projection.fit(descriptors)
+            self.X = self.projection.transform(descriptors)
+        else:
+            self.X = np.array(descriptors, dtype=np.float64)
+        self.Y = np.array(labels, dtype=np.float64)
+        self.n = self.X.shape[0]
+        # Only the l2 distances (from the norms expansion) use the norms.
+        if self.kernel == 'gaussian' or self.metric == 'l2':
+            self.X_sq = squared_norms(self.X)
+        else:
+            self.X_sq = None
+
+        self.L = kernel_matrix(self.X,
+                               self.X,
+                               self.sigma,
+                               kernel=self.kernel,
+                               metric=self.metric)
+        self.L[np.diag_indices_from(self.L)] += self.reg
+        self.L = LA.cholesky(self.L,
+                             lower=True,
+                             overwrite_a=True,
+                             check_finite=False)
+        self.alpha = LA.cho_solve((self.L, True), self.Y)
+
+    def partial_fit(self,
+                    descriptors,
+                    labels):
+        """
+        Adds new training molecules to the model without retraining.
+        descriptors: array of new training descriptors.
+        labels: array of new training labels.
+        NOTE: only the kernel rows of the new molecules are computed and the
+            cholesky factor is extended with a block update (cho_extend),
+            O(N^2 k) for k new molecules instead of O(N^3). An untrained
+            model is just fitted.
+        """
+        if self.L is None:
+            if self.alpha is None:
+                return self.fit(descriptors, labels)
+            raise ValueError('The model was saved without its cholesky '
+                             'factor (with_factor=False), it can\'t be '
+                             'extended.')
+
+        if not descriptors.shape[0] == labels.shape[0]:
+            raise ValueError('Labels size is different than descriptors '
+                             'size.')
+
+        n0 = self.n
+        n1 = n0 + descriptors.shape[0]
+
+        # Grow the factor buffer with some room for the next updates.
+        if self.L.shape[0] < n1:
+            capacity = max(n1, int(1.5*n0))
+            L = np.empty((capacity, capacity), dtype=np.float64)
+            L[:n0, :n0] = self.L[:n0, :n0]
+            self.L = L
+
+        X = self._project(descriptors)
+        self.L[:n0, n0:n1] = self._kernel_tile(X).T
+        self.L[n0:n1, n0:n1] = kernel_matrix(X,
+                                             X,
+                                             self.sigma,
+                                             kernel=self.kernel,
+                                             metric=self.metric)
+        cho_extend(self.L, n0, n1, reg=self.reg)
+
+        self.X = np.concatenate([self.X, X])
+        self.Y = np.concatenate([self.Y, np.asarray(labels,
+                                                    dtype=np.float64)])
+        if self.X_sq is not None:
+            self.X_sq = np.concatenate([self.X_sq, squared_norms(X)])
+        self.n = n1
+        self.alpha = LA.cho_solve((self.L[:n1, :n1], True), self.Y)
+
+    def _project(self,
+                 descriptors):
+        """
+        Applies the projection (if any) to the descriptors.
+        descriptors: array of descriptors.
+        """
+        if self.projection is None:
+            return np.asarray(descriptors, dtype=np.float64)
+
+        return self.projection.transform(descriptors)
+
+    def _kernel_tile(self,
+                     X):
+        """
+        Calculates the kernel between some descriptors and the training ones.
+        X: array of descriptors.
+        """
+        return kernel_tile(X,
+                           self.X,
+                           self.sigma,
+                           kernel=self.kernel,
+                           metric=self.metric,
+                           X2_sq=self.X_sq)
+
+    def predict(self,
+                descriptors,
+                return_std=False):
+        """
+        Predicts the labels of the descriptors given, tile by tile.
+        descriptors: array of descriptors.
+        return_std: if the posterior (gaussian process) standard deviation
+            of each prediction should also be returned. It needs the
+            cholesky factor, so it doesn't work for models saved without it.
+        NOTE: the standard deviation is sqrt(k(x, x) - |L^-1 k|^2), where k
+            are the kernel values against the training set. Each tile of
+            K_te is reused for the prediction and for a batched triangular
+            solve with the stored factor, so no inverse is ever formed.
+        """
+        if self.alpha is None:
+            raise ValueError('The model hasn\'t been trained.')
+
+        descriptors = self._project(descriptors)
+        if not return_std:
+            return kernel_matvec(descriptors,
+                                 self.X,
+                                 self.alpha,
+                                 self.sigma,
+                                 kernel=self.kernel,
+                                 metric=self.metric,
+                                 block_size=self.block_size,
+                                 X2_sq=self.X_sq)
+
+        if self.L is None:
+            raise ValueError('The model has no cholesky factor, it was saved '
+                             'without it.')
+
+        L = self.L[:self.n, :self.n]
+        size = descriptors.shape[0]
+        Y_pr = np.empty((size,) + self.alpha.shape[1:], dtype=np.float64)
+        var = np.empty(size, dtype=np.float64)
+        for i in range(0, size, self.block_size):
+            i_end = min(i + self.block_size, size)
+            K_te = self._kernel_tile(descriptors[i:i_end])
+            Y_pr[i:i_end] = np.dot(K_te, self.alpha)
+            V = LA.solve_triangular(L,
+                                    K_te.T,
+                                    lower=True,
+                                    overwrite_b=True,
+                                    check_finite=False)
+            # k(x, x) = 1 for all of the (exponential) kernels.
+            var[i:i_end] = 1.0 - np.einsum('ij,ij->j', V, V)
+
+        # Round-off can give small negative values.
+        np.maximum(var, 0.0, out=var)
+
+        return Y_pr, np.sqrt(var)
+
+    def save(self,
+             path,
+             with_factor=True):
+        """
+        Saves the model as a directory of .npy files and a json config.
+        path: (path to) the directory, created if it doesn't exist.
+        with_factor: if the cholesky factor (N^2 values) and the labels should
+            be saved, needed for partial_fit after loading.
+        """
+        if self.alpha is None:
+            raise ValueError('The model hasn\'t been trained.')
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'X.npy'), self.X)
+        np.save(os.path.join(path, 'alpha.npy'), self.alpha)
+
+        # Optional files not written are removed, so none of a previous
+        # model saved in the same directory is left behind.
+        optional = {'X_sq.npy': self.X_sq}
+        if with_factor and self.L is not None:
+            optional['L.npy'] = self.L[:self.n, :self.n]
+            optional['Y.npy'] = self.Y
+        else:
+            optional['L.npy'] = None
+            optional['Y.npy'] = None
+        if self.projection is not None:
+            optional['pca_mean.npy'] = self.projection.mean
+            optional['pca_components.npy'] = self.projection.components
+        else:
+            optional['pca_mean.npy'] = None
+            optional['pca_components.npy'] = None
+
+        for fname, array in optional.items():
+            fpath = os.path.join(path, fname)
+            if array is not None:
+                np.save(fpath, array)
+            elif os.path.isfile(fpath):
+                os.remove(fpath)
+
+        config = {'sigma': self.sigma,
+                  'kernel': self.kernel,
+                  'metric': self.metric,
+                  'reg': self.reg,
+                  'block_size': self.block_size}
+        with open(os.path.join(path, 'config.json'), 'w') as f:
+            json.dump(config, f)
+
+    def load(self,
+             path,
+             mmap=True):
+        """
+        Loads a model saved with save.
+        path: (path to) the model directory.
+        mmap: if the arrays should be memory-mapped instead of read.
+        """
+        mmap_mode = 'r' if mmap else None
+
+        with open(os.path.join(path, 'config.json'), 'r') as f:
+            config = json.load(f)
+        self.sigma = config['sigma']
+        self.kernel = config['kernel']
+        self.metric = config['metric']
+        self.reg = config['reg']
+        self.block_size = config['block_size']
+
+        self.X = np.load(os.path.join(path, 'X.npy'), mmap_mode=mmap_mode)
+        self.alpha = np.load(os.path.join(path, 'alpha.npy'),
+                             mmap_mode=mmap_mode)
+        X_sq_file = os.path.join(path, 'X_sq.npy')
+        if os.path.isfile(X_sq_file):
+            self.X_sq = np.load(X_sq_file, mmap_mode=mmap_mode)
+        else:
+            self.X_sq = None
+
+        pca_file = os.path.join(path, 'pca_components.npy')
+        if os.path.isfile(pca_file):
+            components = np.load(pca_file)
+            self.projection = PCAProjection(components.shape[0])
+            self.projection.components = components
+            self.projection.mean = np.load(os.path.join(path,
+                                                        'pca_mean.npy'))
+        else:
+            self.projection = None
+
+        self.n = self.X.shape[0]
+        L_file = os.path.join(path, 'L.npy')
+        if os.path.isfile(L_file):
+            self.L = np.load(L_file, mmap_mode=mmap_mode)
+            self.Y = np.load(os.path.join(path, 'Y.npy'), mmap_mode=mmap_mode)
+            if not self.L.shape[0] == self.n or not self.Y.shape[0] == self.n:
+                raise ValueError('The saved cholesky factor or labels don\'t '
+                                 'match the training descriptors.')
+        else:
+            self.L = None
+            self.Y = None
@@ -0,0 +1,205 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import heapq
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import wasserstein_distance as was_dist
+
+
+def wasserstein_distances(x,
+                          X):
+    """
+    Calculates the wasserstein distance between a representation and others.
+    x: representation.
+    X: array of representations.
+    """
+    return np.array([was_dist(x, X[i]) for i in range(X.shape[0])],
+                    dtype=np.float64)
+
+
+class VPTree:
+    def __init__(self,
+                 X,
+                 distances=wasserstein_distances,
+                 leaf_size=32,
+                 r_seed=111):
+        """
+        Vantage-point tree, nearest neighbors for any metric distance.
+        X: array of representations.
+        distances: function returning the distances between a representation
+            and an array of representations.
+        leaf_size: maximum number of representations per leaf, leaves are
+            searched by brute force.
+        r_seed: random seed for the vantage point selection.
+        NOTE: each node stores a vantage point and the median distance (mu)
+            to it; the inner child has the closer half of the
+            representations (distances up to mu), the outer the rest.
+            A child is skipped when the triangle inequality says it can't
+            have anything closer than the current k-th neighbor.
+        """
+        self.X = X
+        self.distances = distances
+        self.leaf_size = leaf_size
+
+        rng = np.random.default_rng(r_seed)
+        self.root = self._build(np.arange(X.shape[0]), rng)
+
+    def _build(self,
+               idx,
+               rng):
+        """
+        Builds the (sub)tree of the representations given.
+        idx: indices of the representations.
+        rng: random generator.
+        """
+        if idx.shape[0] <= self.leaf_size:
+            return ('leaf', idx)
+
+        vp = rng.integers(idx.shape[0])
+        vp_idx = idx[vp]
+        idx = np.delete(idx, vp)
+        d = self.distances(self.X[vp_idx], self.X[idx])
+        # Cut at the median position, so ties (copies) are split evenly and
+        # the depth stays O(log N).
+        order = np.argsort(d, kind='stable')
+        half = order.shape[0] // 2
+        mu = d[order[half]]
+
+        return ('node', vp_idx, mu,
+                self._build(idx[order[:half]], rng),
+                self._build(idx[order[half:]], rng))
+
+    def query(self,
+              X,
+              k=1):
+        """
+        Finds the k nearest neighbors of each representation.
+        X: array of query representations.
+        k: number of neighbors.
+        Returns the distances and indices of the neighbors, (queries, k)
+            arrays sorted by distance.
+        """
+        dist = np.empty((X.shape[0], k), dtype=np.float64)
+        idx = np.empty((X.shape[0], k), dtype=np.int64)
+        for i in range(X.shape[0]):
+            dist[i], idx[i] = self._query(X[i], k)
+
+        return dist, idx
+
+    def _query(self,
+               x,
+               k):
+        """
+        Finds the k nearest neighbors of a single representation.
+        x: query representation.
+        k: number of neighbors.
+        """
+        # Max-heap (negated distances) of the current k nearest.
+        heap = []
+        tau = np.inf
+
+        def push(d, j):
+            if len(heap) < k:
+                heapq.heappush(heap, (-d, j))
+            elif d < -heap[0][0]:
+                heapq.heapreplace(heap, (-d, j))
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node[0] == 'leaf':
+                if node[1].shape[0] > 0:
+                    d = self.distances(x, self.X[node[1]])
+                    for d_j, j in zip(d, node[1]):
+                        push(d_j, j)
+            else:
+                _, vp_idx, mu, inner, outer = node
+                d = self.distances(x, self.X[vp_idx:vp_idx + 1])[0]
+                push(d, vp_idx)
+                if len(heap) == k:
+                    tau = -heap[0][0]
+                # Search first the side the query falls in (pushed last).
+                if d < mu:
+                    if d + tau >= mu:
+                        stack.append(outer)
+                    if d - tau < mu:
+                        stack.append(inner)
+                else:
+                    if d - tau < mu:
+                        stack.append(inner)
+                    if d + tau >= mu:
+                        stack.append(outer)
+
+        result = sorted((-d, j) for d, j in heap)
+
+        return [d for d, _ in result], [j for _, j in result]
+
+
+class NeighborIndex:
+    def __init__(self,
+                 X,
+                 metric='l2',
+                 leaf_size=32):
+        """
+        Nearest neighbors index over representations.
+        X: array of representations.
+        metric: distance to use, 'l2' or 'l1' (kd-tree) or 'wasserstein'
+            (vantage-point tree).
+        leaf_size: maximum number of representations per leaf.
+        NOTE: 2D representations (matrices) are flattened, as in
+            distance_matrix. This doesn't work with tensorflow.
+        """
+        self.metric = metric
+        X = np.asarray(X, dtype=np.float64)
+        if metric in ['l1', 'l2']:
+            self.p = 1 if metric == 'l1' else 2
+            self.tree = cKDTree(X.reshape(X.shape[0], -1),
+                                leafsize=leaf_size)
+        elif metric == 'wasserstein':
+            if X.ndim != 2:
+                raise TypeError('Representations must be 1D.')
+            self.tree = VPTree(X, leaf_size=leaf_size)
+        else:
+            raise TypeError(f'{metric} metric not found.')
+
+    def query(self,
+              X,
+              k=1):
+        """
+        Finds the k nearest neighbors of each representation.
+        X: array of query representations.
+        k: number of neighbors.
+        Returns the distances and indices of the neighbors, (queries, k)
+            arrays sorted by distance.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if self.metric in ['l1', 'l2']:
+            dist, idx = self.tree.query(X.reshape(X.shape[0], -1),
+                                        k=k,
+                                        p=self.p)
+            if k == 1:
+                dist = dist[:, np.newaxis]
+                idx = idx[:, np.newaxis]
+            return dist, idx
+
+        return self.tree.query(X, k=k)
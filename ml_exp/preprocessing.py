@@ -0,0 +1,91 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+
+def collapse_duplicates(descriptors,
+                        labels,
+                        eps=0.0,
+                        n_tree_dims=8,
+                        block_size=4096):
+    """
+    Merges duplicated (or near-duplicated) descriptors into one molecule.
+    descriptors: array of descriptors.
+    labels: array of labels, or (data size, targets) matrix of labels.
+    eps: tolerance, descriptors whose elements all differ by at most eps
+        (chained, single linkage) are merged. 0 merges only exact copies.
+    n_tree_dims: number of columns used to search the near copies.
+    block_size: number of candidate pairs checked at once.
+    Returns the merged descriptors and labels (means over each group), the
+        weights (size of each group) and the index of the group of each
+        original molecule, so values[inverse] maps back to the molecules.
+    NOTE: exact copies are found by hashing the rows (np.unique), near
+        copies with a kd-tree (max norm) and the connected components of the
+        pairs closer than eps.
+    """
+    data_size = descriptors.shape[0]
+    if not data_size == labels.shape[0]:
+        raise ValueError('Labels size is different than descriptors size.')
+
+    X = np.asarray(descriptors, dtype=np.float64)
+    X_flat = X.reshape(data_size, -1)
+    if eps == 0.0:
+        _, inverse = np.unique(X_flat, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+    else:
+        # Pairs closer than eps in the max norm are also closer than eps in
+        # any subset of the columns, so the candidates come from a kd-tree
+        # on a few high variance columns (kd-trees are slow in high
+        # dimensions) and are checked with the full rows afterwards.
+        cols = np.argsort(np.var(X_flat, axis=0))[-n_tree_dims:]
+        pairs = cKDTree(X_flat[:, cols]).query_pairs(eps, p=np.inf,
+                                                     output_type='ndarray')
+        close = np.empty(pairs.shape[0], dtype=bool)
+        for i in range(0, pairs.shape[0], block_size):
+            p_i = pairs[i:i + block_size]
+            close[i:i + block_size] = np.max(np.abs(X_flat[p_i[:, 0]] -
+                                                    X_flat[p_i[:, 1]]),
+                                             axis=1) <= eps
+        pairs = pairs[close]
+        graph = sparse.coo_matrix((np.ones(pairs.shape[0]),
+                                   (pairs[:, 0], pairs[:, 1])),
+                                  shape=(data_size, data_size))
+        _, inverse = connected_components(graph, directed=False)
+
+    n_groups = inverse.max() + 1
+    # Group sums as a (groups, molecules) indicator matrix product.
+    groups = sparse.csr_matrix((np.ones(data_size),
+                                (inverse, np.arange(data_size))),
+                               shape=(n_groups, data_size))
+    weights = np.asarray(groups.sum(axis=1)).reshape(-1)
+
+    X_merged = (groups @ X_flat) / weights[:, np.newaxis]
+    X_merged = X_merged.reshape((n_groups,) + X.shape[1:])
+    Y = np.asarray(labels, dtype=np.float64)
+    Y_merged = (groups @ Y.reshape(data_size, -1)) / weights[:, np.newaxis]
+    Y_merged = Y_merged.reshape((n_groups,) + Y.shape[1:])
+
+    return X_merged, Y_merged, weights, inverse
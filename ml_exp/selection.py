@@ -0,0 +1,185 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.kernels import squared_norms
+from ml_exp.approx import sample_fourier_weights, random_fourier_features
+
+
+def farthest_point_sampling(X,
+                            n_select,
+                            metric='l2',
+                            start=None,
+                            block_size=1024,
+                            r_seed=111):
+    """
+    Selects molecules by farthest point sampling of the descriptors.
+    X: array of descriptors.
+    n_select: number of molecules to select.
+    metric: distance to use, 'l2' or 'l1'.
+    start: index of the first molecule. If None, a random one is used.
+    block_size: number of molecules per block of the l1 distances.
+    r_seed: random seed for the first molecule.
+    Returns the array of selected indices, in selection order.
+    NOTE: each step picks the molecule farthest from all the selected ones.
+        Only the distances to the last selected molecule are computed, and
+        the distance to the selected set is updated in-place, so each step
+        is O(N*d) and no distance matrix is stored. The l1 differences go
+        through one (block_size, d) buffer, never a (N, d) temporary. Raises
+        ValueError if there are less distinct descriptors than n_select.
+    """
+    if metric not in ['l1', 'l2']:
+        raise TypeError(f'{metric} metric not found.')
+
+    data_size = X.shape[0]
+    if n_select > data_size:
+        raise ValueError('Number of molecules to select is greater than the '
+                         'data size.')
+
+    X = np.asarray(X, dtype=np.float64).reshape(data_size, -1)
+    if metric == 'l2':
+        X_sq = squared_norms(X)
+    else:
+        diff = np.empty((min(block_size, data_size), X.shape[1]),
+                        dtype=np.float64)
+
+    if start is None:
+        start = np.random.default_rng(r_seed).integers(data_size)
+
+    idx = np.empty(n_select, dtype=np.int64)
+    idx[0] = start
+    # Selected molecules are excluded with -inf, so duplicates of them (at
+    # distance 0) aren't picked again.
+    min_dist = np.full(data_size, np.inf)
+    min_dist[start] = -np.inf
+    d = np.empty(data_size, dtype=np.float64)
+    for i in range(1, n_select):
+        x = X[idx[i - 1]]
+        if metric == 'l2':
+            # Squared distances, |a - b|^2 = |a|^2 + |b|^2 - 2ab.
+            np.dot(X, x, out=d)
+            d *= -2.0
+            d += X_sq
+            d += X_sq[idx[i - 1]]
+            # Copies of x differ from 0 by the round-off of the norms.
+            d[d <= 64*np.finfo(np.float64).eps*(X_sq + X_sq[idx[i - 1]])] = 0.0
+        else:
+            for j in range(0, data_size, block_size):
+                j_end = min(j + block_size, data_size)
+                diff_j = diff[:j_end - j]
+                np.subtract(X[j:j_end], x, out=diff_j)
+                np.abs(diff_j, out=diff_j)
+                np.sum(diff_j, axis=1, out=d[j:j_end])
+        np.minimum(min_dist, d, out=min_dist)
+        idx[i] = np.argmax(min_dist)
+        if min_dist[idx[i]] <= 0.0:
+            raise ValueError(f'Only {i} distinct descriptors, less than the '
+                             'number of molecules to select.')
+        min_dist[idx[i]] = -np.inf
+
+    return idx
+
+
+def cur_selection(X,
+                  n_select,
+                  n_components=None,
+                  kernel='gaussian',
+                  sigma=1000.0,
+                  metric='l2',
+                  n_features=500,
+                  deterministic=False,
+                  block_size=8192,
+                  r_seed=111):
+    """
+    Selects molecules by their CUR (rank-k leverage) scores.
+    X: array of descriptors.
+    n_select: number of molecules to select.
+    n_components: rank (k) of the subspace for the leverage scores. Defaults
+        to min(n_select, number of features).
+    kernel: 'gaussian' or 'laplacian' to use the scores of the kernel (with
+        random fourier features), or None to use the descriptors as they are.
+    sigma: kernel width.
+    metric: norm used by the laplacian kernel, 'l2' or 'l1'.
+    n_features: number of random fourier features for the kernel scores.
+    deterministic: if the molecules with the highest scores should be
+        selected, instead of sampling them proportionally to the scores.
+    block_size: number of molecules per block of features.
+    r_seed: random seed for the features and the sampling.
+    Returns the array of selected indices and the leverage scores.
+    NOTE: the leverage score of molecule i is |U_k[i]|^2, with U_k the top k
+        left singular vectors of the feature matrix Z. They come from the
+        eigenvectors of Z^T Z, so Z is built block by block and never stored:
+        O(N*D^2) time and O(block_size*D + D^2) memory.
+    """
+    data_size = X.shape[0]
+    if n_select > data_size:
+        raise ValueError('Number of molecules to select is greater than the '
+                         'data size.')
+
+    X = np.asarray(X, dtype=np.float64).reshape(data_size, -1)
+    if kernel is None:
+        def features(X_b):
+            return X_b
+        n_dims = X.shape[1]
+    else:
+        W, b = sample_fourier_weights(X.shape[1],
+                                      n_features,
+                                      sigma,
+                                      kernel=kernel,
+                                      metric=metric,
+                                      r_seed=r_seed)
+
+        def features(X_b):
+            return random_fourier_features(X_b, W, b)
+        n_dims = n_features
+
+    if n_components is None:
+        n_components = n_select
+    n_components = min(n_components, n_dims)
+
+    blocks = range(0, data_size, block_size)
+    G = np.zeros((n_dims, n_dims), dtype=np.float64)
+    for i in blocks:
+        Z = features(X[i:i + block_size])
+        G += np.dot(Z.T, Z)
+
+    eig_vals, eig_vecs = LA.eigh(G)
+    eig_vals = np.maximum(eig_vals[-n_components:], 1e-12)
+    eig_vecs = eig_vecs[:, -n_components:]
+
+    # U_k = Z V_k S_k^-1, so |U_k[i]|^2 = sum_j (z_i v_j)^2 / s_j^2.
+    scores = np.empty(data_size, dtype=np.float64)
+    for i in blocks:
+        ZV = np.dot(features(X[i:i + block_size]), eig_vecs)
+        scores[i:i + block_size] = np.einsum('ij,ij->i', ZV, ZV / eig_vals)
+
+    if deterministic:
+        idx = np.argsort(scores)[::-1][:n_select]
+    else:
+        rng = np.random.default_rng(r_seed)
+        idx = rng.choice(data_size,
+                         n_select,
+                         replace=False,
+                         p=scores/scores.sum())
+
+    return idx, scores
@@ -0,0 +1,229 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import json
+import time
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.misc import printc
+from ml_exp.kernels import distance_matrix, kernel_from_distance
+
+
+def _grow_distances(D,
+                    X,
+                    n,
+                    metric,
+                    squared):
+    """
+    Extends a distance matrix between the first molecules to the first n.
+    D: distance matrix of the first molecules, or None.
+    X: array of descriptors.
+    n: new number of molecules.
+    metric: norm to use, 'l2' or 'l1'.
+    squared: if the squared distances are used.
+    NOTE: only the distances of the new molecules are computed.
+    """
+    n_old = 0 if D is None else D.shape[0]
+    D_new = np.empty((n, n), dtype=np.float64)
+    if n_old > 0:
+        D_new[:n_old, :n_old] = D
+    D_new[n_old:, :] = distance_matrix(X[n_old:n], X[:n],
+                                       metric=metric,
+                                       squared=squared)
+    D_new[:n_old, n_old:] = D_new[n_old:, :n_old].T
+
+    return D_new
+
+
+def successive_halving(descriptors,
+                       labels,
+                       sigmas,
+                       regs=[1e-8],
+                       kernels=['gaussian'],
+                       metrics=['l2'],
+                       min_size=250,
+                       training_size=None,
+                       validation_size=1000,
+                       eta=2,
+                       log_file=None,
+                       show_msgs=True):
+    """
+    Successive halving search of the kernel, sigma and regularization.
+    descriptors: array of descriptors, or dictionary of arrays (for example
+        LJM with several lj_sigma values) to also select the descriptor.
+    labels: array of labels.
+    sigmas: list of kernel widths to try.
+    regs: list of regularization values to try.
+    kernels: list of kernels to try, 'gaussian' or 'laplacian'.
+    metrics: list of norms to try for the laplacian kernel, 'l2' or 'l1'.
+    min_size: training size of the first round.
+    training_size: training size of the last round. If None, all the
+        molecules that aren't used for validation.
+    validation_size: number of molecules (the last ones) used to score.
+    eta: only the best 1/eta of the candidates go to the next round.
+    log_file: (path to) a json lines file where every evaluation is written.
+    show_msgs: if debug messages should be shown.
+    NOTE: this doesn't work with tensorflow. The candidates are the
+        (descriptor, kernel, metric, sigma) combinations, the best
+        regularization depends on the training size so it is chosen again
+        in every round (from the same distances). The
+        training sizes grow geometrically from min_size to training_size,
+        the rounds train on the first molecules so the distance matrices are
+        extended (only the new rows are computed) and shared by all the
+        candidates with the same descriptor and distance.
+    Returns the best candidate (a dictionary) and the log, a list with a
+        dictionary per evaluation (candidate, regularization and round).
+    """
+    for name, values in [('sigmas', sigmas), ('regs', regs),
+                         ('kernels', kernels), ('metrics', metrics)]:
+        if type(values) != list:
+            raise TypeError(f'\'{name}\' is not a list.')
+        if not values:
+            raise ValueError(f'\'{name}\' is empty.')
+
+    tic = time.perf_counter()
+    if not isinstance(descriptors, dict):
+        descriptors = {'descriptors': descriptors}
+    data_size = labels.shape[0]
+    for name, X in descriptors.items():
+        if not X.shape[0] == data_size:
+            raise ValueError(f'Labels size is different than {name} size.')
+
+    if training_size is None:
+        training_size = data_size - validation_size
+    if training_size + validation_size > data_size:
+        raise ValueError('Training and validation sizes are greater than the '
+                         'data size.')
+    if min_size > training_size:
+        raise ValueError('Minimum size is greater than the training size.')
+
+    candidates = []
+    for name in descriptors.keys():
+        for kernel in kernels:
+            if kernel == 'gaussian':
+                kernel_metrics = ['l2']
+            elif kernel == 'laplacian':
+                kernel_metrics = metrics
+            else:
+                raise TypeError(f'{kernel} kernel not supported.')
+            for metric in kernel_metrics:
+                for sigma in sigmas:
+                    candidates.append({'descriptor': name,
+                                       'kernel': kernel,
+                                       'metric': metric,
+                                       'sigma': sigma})
+
+    n_rounds = int(np.ceil(np.log(len(candidates)) / np.log(eta))) + 1
+    sizes = np.unique(np.geomspace(min_size,
+                                   training_size,
+                                   n_rounds).astype(np.int64))
+    n_rounds = sizes.shape[0]
+
+    if show_msgs:
+        printc('Successive halving started.', 'GREEN')
+        printc(f'\tCandidates: {len(candidates)}', 'CYAN')
+        printc(f'\tTraining sizes: {sizes.tolist()}', 'CYAN')
+        printc(f'\tValidation size: {validation_size}', 'CYAN')
+
+    Y = np.asarray(labels, dtype=np.float64)
+    Y_va = Y[-validation_size:]
+
+    # Distances per (descriptor, distance), grown round by round.
+    D_tr = dict()
+    D_va = dict()
+    log = []
+    for r, n in enumerate(sizes):
+        dist_keys = set((c['descriptor'], c['metric'], c['kernel'] ==
+                         'gaussian') for c in candidates)
+        # Forget the distances nobody needs anymore.
+        for key in list(D_tr.keys()):
+            if key not in dist_keys:
+                del D_tr[key]
+                del D_va[key]
+
+        for key in dist_keys:
+            name, metric, squared = key
+            X = descriptors[name]
+            n_old = 0 if key not in D_tr else D_tr[key].shape[1]
+            D_tr[key] = _grow_distances(D_tr.get(key), X, n, metric,
+                                        squared)
+            D = np.empty((validation_size, n), dtype=np.float64)
+            if n_old > 0:
+                D[:, :n_old] = D_va[key]
+            D[:, n_old:] = distance_matrix(X[-validation_size:], X[n_old:n],
+                                           metric=metric,
+                                           squared=squared)
+            D_va[key] = D
+
+        round_log = []
+        for c in candidates:
+            key = (c['descriptor'], c['metric'], c['kernel'] == 'gaussian')
+            K_va = kernel_from_distance(D_va[key], c['sigma'],
+                                        kernel=c['kernel'])
+            K_tr = np.empty_like(D_tr[key])
+            for reg in regs:
+                c_tic = time.perf_counter()
+                kernel_from_distance(D_tr[key], c['sigma'],
+                                     kernel=c['kernel'],
+                                     out=K_tr)
+                K_tr[np.diag_indices_from(K_tr)] += reg
+                try:
+                    alpha = LA.cho_solve(LA.cho_factor(K_tr,
+                                                       overwrite_a=True,
+                                                       check_finite=False),
+                                         Y[:n])
+                    mae = np.mean(np.abs(np.dot(K_va, alpha) - Y_va))
+                except LA.LinAlgError:
+                    # Not positive definite, the value is too small.
+                    mae = np.inf
+                entry = dict(c, reg=reg, round=r, training_size=int(n),
+                             mae=float(mae),
+                             time=time.perf_counter() - c_tic)
+                log.append(entry)
+                if log_file is not None:
+                    with open(log_file, 'a') as f:
+                        f.write(json.dumps(entry) + '\n')
+            # The candidate is scored with its best regularization value.
+            round_log.append(min(log[-len(regs):], key=lambda e: e['mae']))
+
+        round_log.sort(key=lambda e: e['mae'])
+        if show_msgs:
+            printc(f'\tRound {r} (training size {n}): best MAE '
+                   f'{round_log[0]["mae"]:.4f} of {len(candidates)} '
+                   'candidates.', 'CYAN')
+
+        n_keep = max(1, int(np.ceil(len(candidates) / eta)))
+        candidates = [{k: e[k] for k in ['descriptor', 'kernel', 'metric',
+                                         'sigma']}
+                      for e in round_log[:n_keep]]
+
+    best = {k: round_log[0][k] for k in ['descriptor', 'kernel', 'metric',
+                                         'sigma', 'reg', 'training_size',
+                                         'mae']}
+
+    toc = time.perf_counter()
+    tictoc = toc - tic
+    if show_msgs:
+        printc(f'\tBest: {best}', 'GREEN')
+        printc(f'\tSuccessive halving took {tictoc:.4f} seconds.', 'GREEN')
+
+    return best, log
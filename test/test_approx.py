@@ -0,0 +1,107 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+import numpy as np
+from ml_exp.kernels import kernel_matrix
+from ml_exp.approx import sample_fourier_weights, random_fourier_features
+from ml_exp.krr import krr, nystrom_krr, rff_krr
+
+
+def _data(n=300,
+          d=8,
+          r_seed=0):
+    """
+    Random descriptors and smooth labels (with some noise).
+    """
+    rng = np.random.default_rng(r_seed)
+    X = rng.normal(size=(n, d))
+    Y = np.sin(X[:, 0]) + 0.5*X[:, 1] + 0.1*rng.normal(size=n)
+
+    return X, Y
+
+
+class TestNystrom(unittest.TestCase):
+    def setUp(self):
+        self.X, self.Y = _data()
+        # A reg much bigger than the 1e-8 added to K_mm, so the m = N
+        # approximation is the exact kernel.
+        self.mae, _ = krr(self.X, self.Y, training_size=200, sigma=3.0,
+                          reg=1e-2, use_tf=False, show_msgs=False)
+
+    def test_all_landmarks(self):
+        for landmark_method in ['uniform', 'kmeans', 'leverage']:
+            mae, _ = nystrom_krr(self.X, self.Y, training_size=200,
+                                 sigma=3.0, n_landmarks=200,
+                                 landmark_method=landmark_method, reg=1e-2,
+                                 show_msgs=False)
+            self.assertAlmostEqual(mae, self.mae, places=6)
+
+    def test_more_landmarks(self):
+        for landmark_method in ['uniform', 'kmeans', 'leverage']:
+            gaps = [abs(nystrom_krr(self.X, self.Y, training_size=200,
+                                    sigma=3.0, n_landmarks=n_landmarks,
+                                    landmark_method=landmark_method,
+                                    reg=1e-2, show_msgs=False)[0] - self.mae)
+                    for n_landmarks in [5, 20, 60, 200]]
+            self.assertTrue(np.all(np.diff(gaps) < 0.0), gaps)
+            self.assertLess(gaps[-1], 1e-6)
+
+
+class TestRandomFourierFeatures(unittest.TestCase):
+    def setUp(self):
+        self.X = np.random.default_rng(1).normal(size=(60, 5))
+
+    def test_kernels(self):
+        for kernel, metric in [('gaussian', 'l2'), ('laplacian', 'l1'),
+                               ('laplacian', 'l2')]:
+            K = kernel_matrix(self.X, self.X, 2.0, kernel=kernel,
+                              metric=metric)
+            errors = []
+            for n_features in [100, 1000, 10000, 40000]:
+                W, b = sample_fourier_weights(5, n_features, 2.0,
+                                              kernel=kernel, metric=metric,
+                                              r_seed=1)
+                Z = random_fourier_features(self.X, W, b)
+                self.assertEqual(Z.shape, (60, n_features))
+                errors.append(np.max(np.abs(np.dot(Z, Z.T) - K)))
+            # The error falls like 1/sqrt(D).
+            self.assertTrue(np.all(np.diff(errors) < 0.0), errors)
+            self.assertLess(errors[-1], 0.03)
+
+    def test_rff_krr(self):
+        X, Y = _data()
+        mae, _ = krr(X, Y, training_size=200, sigma=3.0, reg=1e-1,
+                     use_tf=False, show_msgs=False)
+        gaps = [abs(rff_krr(X, Y, training_size=200, sigma=3.0,
+                            n_features=n_features, batch_size=64, reg=1e-1,
+                            show_msgs=False)[0] - mae)
+                for n_features in [10, 100, 2000]]
+        self.assertTrue(np.all(np.diff(gaps) < 0.0), gaps)
+
+    def test_kernel_not_supported(self):
+        with self.assertRaises(TypeError):
+            sample_fourier_weights(5, 10, 2.0, kernel='wasserstein')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+from ml_exp.compound import Compound
+from ml_exp.descriptors import descriptor_params, gen_descriptors
+from ml_exp.kernels import kernel_matrix
+from ml_exp.krr import krr
+from ml_exp.cache import dataset_fingerprint, descriptor_key, ArrayCache,\
+    DescriptorCache, KernelCache
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class TestDescriptorKey(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.compounds = [Compound(os.path.join(DATA, 'qm7', f'{i:04d}.xyz'))
+                         for i in range(1, 11)]
+
+    def test_fingerprint(self):
+        fingerprint = dataset_fingerprint(self.compounds)
+        self.assertEqual(fingerprint, dataset_fingerprint(self.compounds))
+        self.assertNotEqual(fingerprint,
+                            dataset_fingerprint(self.compounds[::-1]))
+        moved = Compound(os.path.join(DATA, 'qm7', '0001.xyz'))
+        moved.coordinates = moved.coordinates + 1e-9
+        self.assertNotEqual(fingerprint,
+                            dataset_fingerprint([moved] +
+                                                self.compounds[1:]))
+
+    def test_params(self):
+        fingerprint = dataset_fingerprint(self.compounds)
+        params = descriptor_params()
+        key = descriptor_key(fingerprint, 'CM', params)
+        self.assertEqual(key, descriptor_key(fingerprint, 'CM',
+                                             descriptor_params()))
+        # Parameters the CM depends on change the key, the others don't.
+        for name, value in [('size', 29), ('sort', True),
+                            ('as_eig', False), ('bohr_ru', True)]:
+            self.assertNotEqual(key, descriptor_key(
+                fingerprint, 'CM', descriptor_params(**{name: value})))
+        self.assertEqual(key, descriptor_key(
+            fingerprint, 'CM', descriptor_params(lj_sigma=2.0)))
+        self.assertNotEqual(key, descriptor_key(fingerprint, 'LJM', params))
+        self.assertNotEqual(
+            descriptor_key(fingerprint, 'LJM', params),
+            descriptor_key(fingerprint, 'LJM',
+                           descriptor_params(lj_sigma=2.0)))
+        self.assertNotEqual(
+            descriptor_key(fingerprint, 'BOB', params),
+            descriptor_key(fingerprint, 'BOB', params, with_cm=True))
+
+
+class TestArrayCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.arrays = [np.full(100, float(i)) for i in range(3)]
+        # Room for two of the arrays (800 bytes plus the .npy header).
+        self.cache = ArrayCache(self.tmp.name, max_bytes=2000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hit(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', self.arrays[0])
+        array = self.cache.get('a')
+        np.testing.assert_array_equal(array, self.arrays[0])
+        self.assertEqual(array.dtype, self.arrays[0].dtype)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # Copy-on-write, changes aren't stored.
+        array[0] = -1.0
+        np.testing.assert_array_equal(self.cache.get('a'), self.arrays[0])
+
+    def test_lru_eviction(self):
+        self.cache.put('a', self.arrays[0])
+        time.sleep(0.01)
+        self.cache.put('b', self.arrays[1])
+        time.sleep(0.01)
+        # Using a makes b the least recently used.
+        self.cache.get('a')
+        time.sleep(0.01)
+        self.cache.put('c', self.arrays[2])
+        self.assertIsNone(self.cache.get('b'))
+        np.testing.assert_array_equal(self.cache.get('a'), self.arrays[0])
+        np.testing.assert_array_equal(self.cache.get('c'), self.arrays[2])
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertLessEqual(self.cache.size(), 2000)
+
+    def test_too_big(self):
+        self.cache.put('big', np.zeros(1000))
+        self.assertIsNone(self.cache.get('big'))
+        self.assertEqual(self.cache.size(), 0)
+
+
+class TestGenDescriptorsCache(unittest.TestCase):
+    def test_hit(self):
+        compounds = [Compound(os.path.join(DATA, 'qm7', f'{i:04d}.xyz'))
+                     for i in range(1, 21)]
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DescriptorCache(tmp)
+            first, _ = gen_descriptors(compounds, ['CM', 'AM'], cache=cache,
+                                       show_msgs=False)
+            self.assertEqual((cache.hits, cache.misses), (0, 2))
+            second, _ = gen_descriptors(compounds, ['CM', 'AM'],
+                                        cache=cache, show_msgs=False)
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+            for identifier in ['CM', 'AM']:
+                np.testing.assert_array_equal(second[identifier],
+                                              first[identifier])
+            # Other parameters are other keys.
+            gen_descriptors(compounds, ['CM'], sort=True, cache=cache,
+                            show_msgs=False)
+            self.assertEqual(cache.misses, 3)
+
+
+class TestKernelCache(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(120, 6))
+        self.Y = np.sin(self.X[:, 0]) + 0.1*rng.normal(size=120)
+        self.K = kernel_matrix(self.X, self.X, 3.0)
+        self.pairs = [(slice(0, 80), slice(0, 80)),
+                      (np.arange(100, 120), np.arange(0, 80)),
+                      (np.array([5, 3, 90]), slice(10, 12))]
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _check_blocks(self,
+                      cache):
+        blocks = cache.blocks(self.X, self.pairs, 3.0)
+        for (rows, cols), block in zip(self.pairs, blocks):
+            rows = np.arange(120)[rows]
+            cols = np.arange(120)[cols]
+            np.testing.assert_array_equal(block, self.K[np.ix_(rows, cols)])
+            self.assertTrue(block.flags.writeable)
+            block[:] = 0.0
+
+    def test_memory(self):
+        cache = KernelCache()
+        for _ in range(3):
+            self._check_blocks(cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual(cache.size(), self.K.nbytes)
+        # Other kernel parameters are other keys.
+        cache.kernel(self.X, 3.0, kernel='laplacian', metric='l1')
+        cache.kernel(self.X, 3.0, kernel='laplacian', metric='l2')
+        cache.kernel(self.X, 4.0)
+        self.assertEqual(cache.misses, 4)
+
+    def test_memory_eviction(self):
+        # Room for two kernels.
+        cache = KernelCache(max_bytes=2*self.K.nbytes)
+        for sigma in [1.0, 2.0, 1.0, 3.0, 2.0]:
+            cache.kernel(self.X, sigma)
+        # 2.0 was the least recently used when 3.0 was added.
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (1, 4, 2))
+
+    def test_disk(self):
+        cache = KernelCache(cache_dir=self.tmp.name)
+        self._check_blocks(cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        # Another process (here another cache) finds it on disk.
+        cache = KernelCache(cache_dir=self.tmp.name)
+        self._check_blocks(cache)
+        self._check_blocks(cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+    def test_bypass(self):
+        cache = KernelCache(max_bytes=self.K.nbytes - 1,
+                            cache_dir=self.tmp.name)
+        self._check_blocks(cache)
+        self.assertEqual((cache.bypasses, cache.misses), (1, 0))
+        self.assertEqual(cache.size(), 0)
+
+    def test_krr(self):
+        cache = KernelCache()
+        rng = np.random.default_rng(1)
+        for _ in range(2):
+            for training_indices in [None, rng.permutation(120)[:80]]:
+                for reg in [1e-6, 1e-2]:
+                    kwargs = {'training_size': 80, 'test_size': None,
+                              'sigma': 3.0, 'reg': reg, 'use_tf': False,
+                              'training_indices': training_indices,
+                              'show_msgs': False}
+                    mae, _ = krr(self.X, self.Y, kernel_cache=cache,
+                                 **kwargs)
+                    self.assertAlmostEqual(mae, krr(self.X, self.Y,
+                                                    **kwargs)[0],
+                                           places=10)
+        self.assertEqual((cache.hits, cache.misses), (7, 1))
+
+    def test_krr_options(self):
+        with self.assertRaises(ValueError):
+            krr(self.X, self.Y, training_size=80, use_tf=False,
+                method='nystrom', kernel_cache=KernelCache(),
+                show_msgs=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.decomposition import PCAProjection
+
+
+class TestPCAProjection(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Decaying spectrum, with a clear gap after the 5th component.
+        scales = np.concatenate([[20.0, 15.0, 10.0, 8.0, 6.0],
+                                 0.1*np.ones(25)])
+        basis, _ = LA.qr(rng.normal(size=(30, 30)))
+        self.X = 3.0 + np.dot(rng.normal(size=(600, 30)) * scales, basis.T)
+        self.mean = np.mean(self.X, axis=0)
+        _, self.S, self.Vt = LA.svd(self.X - self.mean, full_matrices=False)
+
+    def _check(self,
+               projection,
+               k,
+               atol):
+        np.testing.assert_allclose(projection.mean, self.mean, atol=1e-12)
+        V = projection.components
+        self.assertEqual(V.shape, (k, 30))
+        np.testing.assert_allclose(np.dot(V, V.T), np.eye(k), atol=1e-10)
+        # Same subspace: the same orthogonal projector.
+        np.testing.assert_allclose(np.dot(V.T, V),
+                                   np.dot(self.Vt[:k].T, self.Vt[:k]),
+                                   atol=atol)
+        np.testing.assert_allclose(projection.singular_values, self.S[:k],
+                                   rtol=atol)
+
+    def test_randomized(self):
+        projection = PCAProjection(5, batch_size=64).fit(self.X)
+        self._check(projection, 5, 1e-6)
+
+    def test_incremental(self):
+        projection = PCAProjection(5, method='incremental', n_oversamples=2,
+                                   batch_size=64).fit(self.X)
+        self._check(projection, 5, 1e-3)
+
+    def test_full_rank(self):
+        Z_svd = np.dot(self.X - self.mean, self.Vt.T)
+        for method in ['randomized', 'incremental']:
+            projection = PCAProjection(30, method=method,
+                                       batch_size=64).fit(self.X)
+            self._check(projection, 30, 1e-8)
+            # The projection is a rotation, distances are kept.
+            Z = projection.transform(self.X)
+            np.testing.assert_allclose(np.abs(Z), np.abs(Z_svd), atol=1e-8)
+            np.testing.assert_allclose(np.dot(Z, Z.T),
+                                       np.dot(self.X - self.mean,
+                                              (self.X - self.mean).T),
+                                       atol=1e-8)
+
+    def test_not_fitted(self):
+        with self.assertRaises(ValueError):
+            PCAProjection(5).transform(self.X)
+        with self.assertRaises(TypeError):
+            PCAProjection(5, method='exact')
+
+
+if __name__ == '__main__':
+    unittest.main()
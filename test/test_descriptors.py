@@ -0,0 +1,90 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import unittest
+from multiprocessing import shared_memory
+import numpy as np
+from ml_exp.compound import Compound
+from ml_exp.descriptors import gen_descriptors, release_descriptors
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class TestGenDescriptors(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.compounds = [Compound(os.path.join(DATA, 'qm7', f'{i:04d}.xyz'))
+                         for i in range(1, 61)]
+
+    def _check_workers(self,
+                       identifiers,
+                       **kwargs):
+        serial, shms = gen_descriptors(self.compounds, identifiers,
+                                       show_msgs=False, **kwargs)
+        self.assertEqual(shms, [])
+        parallel, shms = gen_descriptors(self.compounds, identifiers,
+                                         workers=2, chunks_per_worker=3,
+                                         show_msgs=False, **kwargs)
+        self.assertEqual(len(shms), len(parallel))
+        names = [shm.name for shm in shms]
+        try:
+            self.assertEqual(set(parallel.keys()), set(serial.keys()))
+            for identifier, array in serial.items():
+                self.assertEqual(array.shape[0], len(self.compounds))
+                np.testing.assert_array_equal(parallel[identifier], array)
+        finally:
+            release_descriptors(parallel, shms)
+
+        self.assertEqual(parallel, dict())
+        self.assertEqual(shms, [])
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+
+        return serial
+
+    def test_workers(self):
+        self._check_workers(['CM', 'LJM', 'AM'])
+
+    def test_bob(self):
+        with_cm = self._check_workers(['CM', 'BOB'], as_eig=False,
+                                      flatten=False)
+        # Without the CM, BOB builds the same plain matrix itself.
+        without_cm = self._check_workers(['BOB'])
+        np.testing.assert_array_equal(without_cm['BOB'], with_cm['BOB'])
+
+    def test_compounds_not_modified(self):
+        descriptors, shms = gen_descriptors(self.compounds[:5], ['CM'],
+                                            workers=2, show_msgs=False)
+        release_descriptors(descriptors, shms)
+        self.assertTrue(all(c.cm is None for c in self.compounds))
+
+    def test_identifiers(self):
+        with self.assertRaises(TypeError):
+            gen_descriptors(self.compounds, 'CM', show_msgs=False)
+        with self.assertRaises(TypeError):
+            gen_descriptors(self.compounds, ['XYZ'], show_msgs=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
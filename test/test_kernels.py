@@ -0,0 +1,104 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+import numpy as np
+from scipy.spatial.distance import cdist
+from ml_exp.kernels import gaussian_kernel, laplacian_kernel,\
+    distance_matrix, squared_norms
+
+
+class TestDistanceMatrix(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Big norms and a copied row, as with coulomb matrices.
+        self.X1 = 100.0 + rng.normal(size=(70, 12))
+        self.X2 = np.concatenate([rng.normal(size=(45, 12)), self.X1[:5]])
+
+    def test_cdist(self):
+        for metric, name in [('l2', 'euclidean'), ('l1', 'cityblock')]:
+            D = cdist(self.X1, self.X2, metric=name)
+            for block_size in [1, 16, 33, 256]:
+                for n_jobs in [1, 3]:
+                    np.testing.assert_allclose(
+                        distance_matrix(self.X1, self.X2, metric=metric,
+                                        block_size=block_size,
+                                        n_jobs=n_jobs),
+                        D, rtol=1e-10, atol=1e-12)
+            np.testing.assert_allclose(
+                distance_matrix(self.X1, self.X2, metric=metric,
+                                squared=True, block_size=16),
+                D**2, rtol=1e-10, atol=1e-12)
+
+    def test_self_distances(self):
+        D = distance_matrix(self.X1, self.X1, block_size=16)
+        np.testing.assert_array_equal(np.diag(D), 0.0)
+        np.testing.assert_array_equal(
+            distance_matrix(self.X1, self.X2)[np.arange(5), 45 + np.arange(5)],
+            0.0)
+
+    def test_options(self):
+        D = cdist(self.X1, self.X2)
+        np.testing.assert_allclose(
+            distance_matrix(self.X1, self.X2,
+                            X2_sq=squared_norms(self.X2)),
+            D, rtol=1e-10, atol=1e-12)
+        D_32 = distance_matrix(self.X1, self.X2, dtype=np.float32)
+        self.assertEqual(D_32.dtype, np.float32)
+        np.testing.assert_allclose(D_32, D, rtol=1e-6, atol=1e-6)
+        # Matrices are compared element-wise.
+        np.testing.assert_allclose(
+            distance_matrix(self.X1.reshape(70, 3, 4),
+                            self.X2.reshape(50, 3, 4)),
+            D, rtol=1e-10, atol=1e-12)
+
+    def test_metric_not_found(self):
+        with self.assertRaises(TypeError):
+            distance_matrix(self.X1, self.X2, metric='l3')
+
+
+class TestKernels(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.X1 = rng.normal(size=(40, 10))
+        self.X2 = rng.normal(size=(30, 10))
+
+    def test_laplacian(self):
+        for metric, name in [('l2', 'euclidean'), ('l1', 'cityblock')]:
+            np.testing.assert_allclose(
+                laplacian_kernel(self.X1, self.X2, 3.0, use_tf=False,
+                                 metric=metric, block_size=7, n_jobs=2),
+                np.exp(-cdist(self.X1, self.X2, metric=name) / 6.0),
+                rtol=1e-12)
+        K = laplacian_kernel(self.X1, self.X1, 1000.0, use_tf=False)
+        np.testing.assert_array_equal(np.diag(K), 1.0)
+
+    def test_gaussian(self):
+        np.testing.assert_allclose(
+            gaussian_kernel(self.X1, self.X2, 3.0, use_tf=False,
+                            block_size=7, n_jobs=2),
+            np.exp(-cdist(self.X1, self.X2, metric='sqeuclidean') / 18.0),
+            rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
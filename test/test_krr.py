@@ -0,0 +1,260 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import unittest
+import warnings
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.kernels import gaussian_kernel, kernel_matrix, distance_matrix,\
+    multi_sigma_kernels
+from ml_exp.linalg import cho_loo_residuals
+from ml_exp.krr import krr, cg_krr, mixed_krr, regularization_path_krr,\
+    multi_sigma_krr, krr_cv, ooc_krr, dc_krr, multi_krr, pipelined_multi_krr
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def _data(n=300,
+          d=8,
+          targets=None,
+          r_seed=0):
+    """
+    Random descriptors and smooth labels (with some noise).
+    """
+    rng = np.random.default_rng(r_seed)
+    X = rng.normal(size=(n, d))
+    Y = np.sin(X[:, 0]) + 0.5*X[:, 1] + 0.1*rng.normal(size=n)
+    if targets is not None:
+        Y = np.stack([Y*(t + 1) + t for t in range(targets)], axis=1)
+
+    return X, Y
+
+
+class TestMultiTarget(unittest.TestCase):
+    def setUp(self):
+        self.X, self.Y = _data(targets=3)
+
+    def _check(self,
+               solve):
+        maes = solve(self.Y)
+        self.assertEqual(maes.shape, (3,))
+        for t in range(3):
+            self.assertAlmostEqual(maes[t], solve(self.Y[:, t]), places=10)
+
+    def test_krr(self):
+        self._check(lambda Y: krr(self.X, Y, training_size=200, sigma=3.0,
+                                  reg=1e-4, use_tf=False,
+                                  show_msgs=False)[0])
+
+    def test_ooc_krr(self):
+        self._check(lambda Y: ooc_krr(self.X, Y, training_size=200,
+                                      sigma=3.0, reg=1e-4, block_size=64,
+                                      show_msgs=False)[0])
+
+
+class TestCGKRR(unittest.TestCase):
+    def setUp(self):
+        self.X, self.Y = _data()
+
+    def test_matches_cholesky(self):
+        mae, _ = krr(self.X, self.Y, training_size=200, sigma=3.0,
+                     reg=1e-1, use_tf=False, show_msgs=False)
+        for preconditioner in ['nystrom', 'jacobi', None]:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                mae_cg, _ = cg_krr(self.X, self.Y, training_size=200,
+                                   sigma=3.0, reg=1e-1,
+                                   preconditioner=preconditioner,
+                                   n_landmarks=50, tol=1e-8,
+                                   block_size=64, show_msgs=False)
+            self.assertAlmostEqual(mae_cg, mae, places=6)
+
+    def test_not_converged(self):
+        with self.assertWarns(RuntimeWarning):
+            _, _, n_iter = cg_krr(self.X, self.Y, training_size=200,
+                                  sigma=3.0, reg=1e-8,
+                                  preconditioner=None, maxiter=5,
+                                  return_iters=True, show_msgs=False)
+        self.assertEqual(n_iter, 5)
+
+    def test_nystrom_needs_reg(self):
+        with self.assertRaises(ValueError):
+            cg_krr(self.X, self.Y, training_size=200, sigma=3.0, reg=0.0,
+                   preconditioner='nystrom', n_landmarks=50,
+                   show_msgs=False)
+
+
+class TestMixedKRR(unittest.TestCase):
+    def setUp(self):
+        self.X, self.Y = _data()
+
+    def test_matches_cholesky(self):
+        for targets in [None, 2]:
+            X, Y = _data(targets=targets)
+            mae, _ = krr(X, Y, training_size=200, sigma=3.0, reg=1e-3,
+                         use_tf=False, show_msgs=False)
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                mae_mixed, _, n_iter = mixed_krr(X, Y, training_size=200,
+                                                 sigma=3.0, reg=1e-3,
+                                                 tol=1e-10,
+                                                 return_iters=True,
+                                                 show_msgs=False)
+            np.testing.assert_allclose(mae_mixed, mae, rtol=1e-7)
+            self.assertLess(n_iter, 10)
+
+    def test_not_converged(self):
+        with self.assertWarns(RuntimeWarning):
+            _, _, n_iter = mixed_krr(self.X, self.Y, training_size=200,
+                                     sigma=3.0, reg=1e-8, shift=1e-2,
+                                     maxiter=3, return_iters=True,
+                                     show_msgs=False)
+        self.assertEqual(n_iter, 3)
+
+
+class TestMultiSigma(unittest.TestCase):
+    def setUp(self):
+        self.X, self.Y = _data()
+        self.sigmas = [1.0, 3.0, 10.0]
+
+    def test_kernels(self):
+        for kernel, metric in [('gaussian', 'l2'), ('laplacian', 'l2'),
+                               ('laplacian', 'l1')]:
+            D = distance_matrix(self.X, self.X[:50], metric=metric,
+                                squared=kernel == 'gaussian')
+            for sigma, K in multi_sigma_kernels(D, self.sigmas,
+                                                kernel=kernel):
+                np.testing.assert_allclose(
+                    K,
+                    kernel_matrix(self.X, self.X[:50], sigma, kernel=kernel,
+                                  metric=metric),
+                    rtol=1e-12)
+
+    def test_matches_krr(self):
+        for kernel, metric in [('gaussian', 'l2'), ('laplacian', 'l1')]:
+            maes, _ = multi_sigma_krr(self.X, self.Y, self.sigmas,
+                                      training_size=200, kernel=kernel,
+                                      metric=metric, reg=1e-4,
+                                      show_msgs=False)
+            self.assertEqual(maes.shape, (len(self.sigmas),))
+            for sigma, mae in zip(self.sigmas, maes):
+                mae_krr, _ = krr(self.X, self.Y, training_size=200,
+                                 sigma=sigma, kernel=kernel, metric=metric,
+                                 reg=1e-4, use_tf=False, show_msgs=False)
+                self.assertAlmostEqual(mae, mae_krr, places=8)
+
+
+class TestRegularizationPath(unittest.TestCase):
+    def test_matches_cholesky(self):
+        regs = [1e-6, 1e-3, 1e-1]
+        for targets in [None, 3]:
+            X, Y = _data(targets=targets)
+            maes, _, alphas, loo_maes = regularization_path_krr(
+                X, Y, regs, training_size=200, sigma=3.0,
+                return_alphas=True, loo=True, show_msgs=False)
+            self.assertEqual(alphas.shape, Y[:200].shape + (len(regs),))
+
+            K = gaussian_kernel(X[:200], X[:200], 3.0, use_tf=False)
+            K[np.diag_indices_from(K)] += regs[1]
+            c_and_lower = LA.cho_factor(K)
+            alpha = LA.cho_solve(c_and_lower, Y[:200])
+            np.testing.assert_allclose(alphas[..., 1], alpha,
+                                       rtol=1e-6, atol=1e-6)
+            mae, _ = krr(X, Y, training_size=200, sigma=3.0, reg=regs[1],
+                         use_tf=False, show_msgs=False)
+            np.testing.assert_allclose(maes[1], mae, rtol=1e-6)
+            np.testing.assert_allclose(
+                loo_maes[1],
+                np.mean(np.abs(cho_loo_residuals(c_and_lower, alpha)),
+                        axis=0),
+                rtol=1e-6)
+
+
+class TestKRRCV(unittest.TestCase):
+    def test_folds(self):
+        X, Y = _data(n=203)
+        maes, _, mean_mae = krr_cv(X, Y, k=4, sigma=3.0, reg=1e-4,
+                                   show_msgs=False)
+        maes_2, _, _ = krr_cv(X, Y, k=4, sigma=3.0, reg=1e-4, workers=2,
+                              show_msgs=False)
+        np.testing.assert_allclose(maes_2, maes, rtol=1e-12)
+        self.assertAlmostEqual(mean_mae, np.mean(maes))
+
+        folds = np.array_split(np.arange(203), 4)
+        for i, va in enumerate(folds):
+            tr = np.concatenate(folds[:i] + folds[i + 1:])
+            order = np.concatenate([tr, va])
+            mae, _ = krr(X[order], Y[order], training_size=tr.shape[0],
+                         test_size=va.shape[0], sigma=3.0, reg=1e-4,
+                         use_tf=False, show_msgs=False)
+            self.assertAlmostEqual(maes[i], mae, places=8)
+
+    def test_bad_k(self):
+        X, Y = _data(n=20)
+        for k in [1, 21]:
+            with self.assertRaises(ValueError):
+                krr_cv(X, Y, k=k, show_msgs=False)
+
+
+class TestDCKRR(unittest.TestCase):
+    def setUp(self):
+        self.X, self.Y = _data()
+
+    def test_one_partition(self):
+        mae, _ = krr(self.X, self.Y, training_size=200, sigma=3.0,
+                     reg=1e-4, use_tf=False, show_msgs=False)
+        for partition, combine in [('random', 'average'),
+                                   ('kmeans', 'average'),
+                                   ('kmeans', 'route')]:
+            mae_dc, _ = dc_krr(self.X, self.Y, training_size=200, sigma=3.0,
+                               reg=1e-4, n_partitions=1, partition=partition,
+                               combine=combine, show_msgs=False)
+            self.assertAlmostEqual(mae_dc, mae, places=8)
+
+    def test_workers(self):
+        for partition, combine in [('random', 'average'),
+                                   ('kmeans', 'route')]:
+            maes = [dc_krr(self.X, self.Y, training_size=200, sigma=3.0,
+                           reg=1e-4, n_partitions=3, partition=partition,
+                           combine=combine, workers=workers,
+                           show_msgs=False)[0]
+                    for workers in [1, 2]]
+            self.assertAlmostEqual(maes[0], maes[1], places=12)
+
+
+class TestPipelinedMultiKRR(unittest.TestCase):
+    def test_matches_multi_krr(self):
+        kwargs = {'db_path': DATA, 'training_size': 300, 'test_size': 100,
+                  'identifiers': ['CM', 'LJM'], 'show_msgs': False}
+        serial = multi_krr(use_tf=False, **kwargs)
+        for extra in [{}, {'workers': 2, 'concurrent_fits': True,
+                           'batch_size': 64}]:
+            pipelined = pipelined_multi_krr(**kwargs, **extra)
+            self.assertEqual(set(pipelined.keys()), {'CM', 'LJM'})
+            for identifier, (mae, _) in serial.items():
+                self.assertAlmostEqual(pipelined[identifier][0], mae,
+                                       places=8)
+
+
+if __name__ == '__main__':
+    unittest.main()
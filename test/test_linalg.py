@@ -0,0 +1,165 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.kernels import gaussian_kernel
+from ml_exp.linalg import ooc_cholesky, ooc_cho_solve, cho_loo_residuals,\
+    cho_extend, pcg
+
+
+def _spd_kernel(n,
+                reg=1e-6,
+                r_seed=0):
+    """
+    Gaussian kernel of random descriptors, and the same plus reg*I.
+    """
+    rng = np.random.default_rng(r_seed)
+    X = rng.normal(size=(n, 8))
+    K = gaussian_kernel(X, X, 2.0, use_tf=False)
+
+    return K, K + reg*np.eye(n)
+
+
+class TestOutOfCore(unittest.TestCase):
+    def test_block_not_dividing(self):
+        K, K_reg = _spd_kernel(103, reg=1e-6)
+        b = np.random.default_rng(2).normal(size=(103, 2))
+        c_and_lower = LA.cho_factor(K_reg, lower=True)
+        for block_size in [10, 37, 103, 200]:
+            L = ooc_cholesky(np.array(K_reg), block_size=block_size)
+            np.testing.assert_allclose(np.tril(L),
+                                       np.tril(c_and_lower[0]),
+                                       rtol=0, atol=1e-8)
+            np.testing.assert_allclose(
+                ooc_cho_solve(L, b, block_size=block_size),
+                LA.cho_solve(c_and_lower, b),
+                rtol=1e-6, atol=1e-6)
+
+    def test_memmap(self):
+        K, K_reg = _spd_kernel(60, reg=1e-4)
+        b = np.random.default_rng(3).normal(size=60)
+        with tempfile.TemporaryDirectory() as tmp:
+            A = np.lib.format.open_memmap(os.path.join(tmp, 'K.npy'),
+                                          mode='w+',
+                                          dtype=np.float64,
+                                          shape=K_reg.shape)
+            A[:] = K_reg
+            ooc_cholesky(A, block_size=16)
+            x = ooc_cho_solve(A, b, block_size=16)
+            del A
+        np.testing.assert_allclose(x,
+                                   LA.cho_solve(LA.cho_factor(K_reg), b),
+                                   rtol=1e-8, atol=1e-8)
+
+
+class TestLOO(unittest.TestCase):
+    def test_explicit_refits(self):
+        n = 60
+        K, K_reg = _spd_kernel(n, reg=1e-3)
+        Y = np.random.default_rng(4).normal(size=(n, 2))
+        c_and_lower = LA.cho_factor(K_reg)
+        alpha = LA.cho_solve(c_and_lower, Y)
+        residuals = cho_loo_residuals(c_and_lower, alpha)
+
+        for i in range(n):
+            keep = np.arange(n) != i
+            alpha_i = LA.cho_solve(LA.cho_factor(K_reg[np.ix_(keep, keep)]),
+                                   Y[keep])
+            np.testing.assert_allclose(residuals[i],
+                                       Y[i] - np.dot(K[i, keep], alpha_i),
+                                       rtol=1e-6, atol=1e-8)
+
+    def test_vector_labels(self):
+        K, K_reg = _spd_kernel(30, reg=1e-3)
+        y = np.random.default_rng(5).normal(size=30)
+        alpha = LA.cho_solve(LA.cho_factor(K_reg), y)
+        residuals = cho_loo_residuals(LA.cho_factor(K_reg), alpha)
+        self.assertEqual(residuals.shape, (30,))
+        keep = np.arange(30) != 0
+        alpha_0 = LA.cho_solve(LA.cho_factor(K_reg[np.ix_(keep, keep)]),
+                               y[keep])
+        self.assertAlmostEqual(residuals[0],
+                               y[0] - np.dot(K[0, keep], alpha_0))
+
+
+class TestChoExtend(unittest.TestCase):
+    def test_uneven_blocks(self):
+        reg = 1e-6
+        K, K_reg = _spd_kernel(170, reg=reg)
+        L_full = LA.cholesky(K_reg, lower=True)
+
+        A = np.array(K)
+        A[:50, :50] = LA.cholesky(K_reg[:50, :50], lower=True)
+        for n0, n1 in [(50, 57), (57, 130), (130, 170)]:
+            cho_extend(A, n0, n1, reg=reg)
+            np.testing.assert_allclose(np.tril(A[:n1, :n1]),
+                                       L_full[:n1, :n1],
+                                       rtol=0, atol=1e-8)
+
+    def test_from_empty(self):
+        reg = 1e-6
+        K, K_reg = _spd_kernel(40, reg=reg)
+        A = np.array(K)
+        cho_extend(A, 0, 40, reg=reg)
+        np.testing.assert_allclose(np.tril(A),
+                                   LA.cholesky(K_reg, lower=True),
+                                   rtol=0, atol=1e-10)
+
+
+class TestPCG(unittest.TestCase):
+    def setUp(self):
+        # A well conditioned system, so the tolerance bounds the error.
+        K, self.A = _spd_kernel(150, reg=1e-2)
+        rng = np.random.default_rng(1)
+        self.b = rng.normal(size=(150, 2))
+        self.x = LA.cho_solve(LA.cho_factor(self.A), self.b)
+
+    def test_plain(self):
+        x, n_iter, converged = pcg(lambda v: np.dot(self.A, v), self.b,
+                                   tol=1e-9)
+        np.testing.assert_allclose(x, self.x, rtol=1e-6, atol=1e-6)
+        self.assertLessEqual(n_iter, 150)
+        self.assertTrue(converged)
+
+    def test_jacobi(self):
+        d = np.diag(self.A)[:, np.newaxis]
+        x, _, _ = pcg(lambda v: np.dot(self.A, v), self.b,
+                      precond=lambda r: r/d, tol=1e-10)
+        np.testing.assert_allclose(x, self.x, rtol=1e-7, atol=1e-7)
+
+    def test_vector(self):
+        x, _, _ = pcg(lambda v: np.dot(self.A, v), self.b[:, 0], tol=1e-10)
+        np.testing.assert_allclose(x, self.x[:, 0], rtol=1e-7, atol=1e-7)
+
+    def test_not_converged(self):
+        x, n_iter, converged = pcg(lambda v: np.dot(self.A, v), self.b,
+                                   tol=1e-10, maxiter=3)
+        self.assertEqual(n_iter, 3)
+        self.assertFalse(converged)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.kernels import gaussian_kernel, laplacian_kernel
+from ml_exp.model import KRRModel
+
+
+class TestKRRModelSaveLoad(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(500, 10))
+        self.Y = rng.normal(size=500)
+        self.X_te = rng.normal(size=(50, 10))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'model')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        model = KRRModel(sigma=2.0, reg=1e-6)
+        model.fit(self.X, self.Y)
+        model.save(self.path)
+
+        loaded = KRRModel(path=self.path, mmap=False)
+        np.testing.assert_allclose(loaded.predict(self.X_te),
+                                   model.predict(self.X_te),
+                                   rtol=0, atol=1e-12)
+        np.testing.assert_allclose(loaded.L, model.L[:model.n, :model.n])
+
+    def test_no_stale_files(self):
+        big = KRRModel(sigma=2.0, reg=1e-6)
+        big.fit(self.X, self.Y)
+        big.save(self.path)
+
+        small = KRRModel(sigma=2.0, reg=1e-6)
+        small.fit(self.X[:200], self.Y[:200])
+        small.save(self.path, with_factor=False)
+        for fname in ['L.npy', 'Y.npy']:
+            self.assertFalse(os.path.isfile(os.path.join(self.path, fname)))
+
+        loaded = KRRModel(path=self.path, mmap=False)
+        self.assertEqual(loaded.n, 200)
+        self.assertIsNone(loaded.L)
+        np.testing.assert_allclose(loaded.predict(self.X_te),
+                                   small.predict(self.X_te),
+                                   rtol=0, atol=1e-12)
+
+    def test_mismatched_factor(self):
+        model = KRRModel(sigma=2.0, reg=1e-6)
+        model.fit(self.X[:200], self.Y[:200])
+        model.save(self.path)
+        np.save(os.path.join(self.path, 'L.npy'), np.eye(500))
+        with self.assertRaises(ValueError):
+            KRRModel(path=self.path)
+
+
+class TestKRRModelPartialFit(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.X = rng.normal(size=(200, 10))
+        self.Y = rng.normal(size=200)
+        self.X_te = rng.normal(size=(30, 10))
+
+    def test_matches_fit(self):
+        full = KRRModel(sigma=2.0, reg=1e-6)
+        full.fit(self.X, self.Y)
+
+        model = KRRModel(sigma=2.0, reg=1e-6)
+        for a, b in [(0, 90), (90, 101), (101, 200)]:
+            model.partial_fit(self.X[a:b], self.Y[a:b])
+        self.assertEqual(model.n, 200)
+        np.testing.assert_allclose(np.tril(model.L[:200, :200]),
+                                   full.L,
+                                   rtol=0, atol=1e-8)
+        np.testing.assert_allclose(model.predict(self.X_te),
+                                   full.predict(self.X_te),
+                                   rtol=0, atol=1e-6)
+
+    def test_loaded_without_factor(self):
+        model = KRRModel(sigma=2.0, reg=1e-6)
+        model.fit(self.X[:190], self.Y[:190])
+        with tempfile.TemporaryDirectory() as tmp:
+            model.save(tmp, with_factor=False)
+            loaded = KRRModel(path=tmp, mmap=False)
+        with self.assertRaises(ValueError):
+            loaded.partial_fit(self.X[190:], self.Y[190:])
+        self.assertEqual(loaded.n, 190)
+
+
+class TestKRRModelPredictStd(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.X = rng.normal(size=(150, 6))
+        self.Y = rng.normal(size=150)
+        # Some test molecules are training ones, with almost no variance.
+        self.X_te = np.concatenate([rng.normal(size=(40, 6)), self.X[:10]])
+
+    def _check(self,
+               model,
+               K_tr,
+               K_te):
+        K_tr[np.diag_indices_from(K_tr)] += model.reg
+        K_inv = LA.inv(K_tr)
+        var = 1.0 - np.einsum('ij,jk,ik->i', K_te, K_inv, K_te)
+        std = np.sqrt(np.maximum(var, 0.0))
+
+        Y_pr, model_std = model.predict(self.X_te, return_std=True)
+        np.testing.assert_allclose(Y_pr,
+                                   model.predict(self.X_te),
+                                   rtol=0, atol=1e-12)
+        np.testing.assert_allclose(Y_pr,
+                                   np.dot(K_te, np.dot(K_inv, self.Y)),
+                                   rtol=0, atol=1e-6)
+        np.testing.assert_allclose(model_std, std, rtol=0, atol=2e-6)
+
+    def test_gaussian(self):
+        model = KRRModel(sigma=2.0, reg=1e-4, block_size=16)
+        model.fit(self.X, self.Y)
+        self._check(model,
+                    gaussian_kernel(self.X, self.X, 2.0, use_tf=False),
+                    gaussian_kernel(self.X_te, self.X, 2.0, use_tf=False))
+
+    def test_laplacian(self):
+        model = KRRModel(sigma=4.0, kernel='laplacian', reg=1e-4)
+        model.fit(self.X, self.Y)
+        self._check(model,
+                    laplacian_kernel(self.X, self.X, 4.0, use_tf=False),
+                    laplacian_kernel(self.X_te, self.X, 4.0, use_tf=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
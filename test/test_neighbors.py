@@ -0,0 +1,65 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+import numpy as np
+from ml_exp.neighbors import VPTree, wasserstein_distances
+
+
+def _l2_distances(x,
+                  X):
+    """
+    Euclidean distances between a representation and others.
+    """
+    return np.linalg.norm(X - x, axis=1)
+
+
+class TestVPTree(unittest.TestCase):
+    def test_brute_force(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(400, 5))
+        Q = rng.normal(size=(20, 5))
+        tree = VPTree(X, distances=_l2_distances, leaf_size=8)
+        dist, idx = tree.query(Q, k=5)
+        for i in range(Q.shape[0]):
+            d = _l2_distances(Q[i], X)
+            np.testing.assert_allclose(dist[i], np.sort(d)[:5])
+
+    def test_wasserstein_duplicates(self):
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(10, 6))[rng.integers(10, size=150)]
+        tree = VPTree(X, leaf_size=4)
+        dist, _ = tree.query(X[:10], k=3)
+        for i in range(10):
+            d = wasserstein_distances(X[i], X)
+            np.testing.assert_allclose(dist[i], np.sort(d)[:3])
+
+    def test_identical_rows(self):
+        X = np.ones((3000, 4))
+        tree = VPTree(X, distances=_l2_distances)
+        dist, idx = tree.query(X[:2], k=10)
+        np.testing.assert_array_equal(dist, 0.0)
+        self.assertEqual(np.unique(idx[0]).shape[0], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
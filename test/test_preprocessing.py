@@ -0,0 +1,82 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+import numpy as np
+from scipy import linalg as LA
+from ml_exp.kernels import gaussian_kernel
+from ml_exp.preprocessing import collapse_duplicates
+from ml_exp.krr import krr
+
+
+class TestCollapseDuplicates(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(40, 6))
+        # Uneven copies (1 to 4 of each row), each with its own label.
+        copies = rng.integers(1, 5, size=40)
+        self.X = rng.permutation(np.repeat(X, copies, axis=0))
+        self.Y = rng.normal(size=(self.X.shape[0], 2))
+        self.X_te = rng.normal(size=(20, 6))
+        self.n_groups = 40
+
+    def test_groups(self):
+        X_c, Y_c, weights, inverse = collapse_duplicates(self.X, self.Y)
+        self.assertEqual(X_c.shape[0], self.n_groups)
+        self.assertEqual(weights.sum(), self.X.shape[0])
+        np.testing.assert_allclose(X_c[inverse], self.X, rtol=1e-15)
+        for g in range(self.n_groups):
+            np.testing.assert_allclose(Y_c[g],
+                                       self.Y[inverse == g].mean(axis=0))
+
+    def test_weighted_solve(self):
+        reg = 1e-3
+        K = gaussian_kernel(self.X, self.X, 2.0, use_tf=False)
+        K[np.diag_indices_from(K)] += reg
+        alpha = LA.cho_solve(LA.cho_factor(K), self.Y)
+        Y_pr = np.dot(gaussian_kernel(self.X_te, self.X, 2.0, use_tf=False),
+                      alpha)
+
+        X_c, Y_c, weights, _ = collapse_duplicates(self.X, self.Y)
+        K_c = gaussian_kernel(X_c, X_c, 2.0, use_tf=False)
+        K_c[np.diag_indices_from(K_c)] += reg / weights
+        alpha_c = LA.cho_solve(LA.cho_factor(K_c), Y_c)
+        Y_pr_c = np.dot(gaussian_kernel(self.X_te, X_c, 2.0, use_tf=False),
+                        alpha_c)
+
+        np.testing.assert_allclose(Y_pr_c, Y_pr, rtol=1e-6, atol=1e-8)
+
+    def test_krr_collapse_eps(self):
+        X = np.concatenate([self.X, self.X_te])
+        Y = np.concatenate([self.Y,
+                            np.zeros((self.X_te.shape[0], 2))])
+        size = self.X.shape[0]
+        for eps in [0.0, 1e-9]:
+            mae, _ = krr(X, Y, training_size=size, sigma=2.0, reg=1e-3,
+                         use_tf=False, show_msgs=False, collapse_eps=eps)
+            mae_full, _ = krr(X, Y, training_size=size, sigma=2.0,
+                              reg=1e-3, use_tf=False, show_msgs=False)
+            np.testing.assert_allclose(mae, mae_full, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+import numpy as np
+from scipy.spatial.distance import cdist
+from scipy import linalg as LA
+from ml_exp.selection import farthest_point_sampling, cur_selection
+
+
+def _brute_force_fps(X,
+                     n_select,
+                     start,
+                     metric):
+    """
+    Farthest point sampling with the full distance matrix.
+    """
+    D = cdist(X, X, metric='sqeuclidean' if metric == 'l2' else 'cityblock')
+    idx = [start]
+    for _ in range(1, n_select):
+        min_dist = D[:, idx].min(axis=1)
+        min_dist[idx] = -np.inf
+        idx.append(int(np.argmax(min_dist)))
+
+    return np.array(idx)
+
+
+class TestFarthestPointSampling(unittest.TestCase):
+    def test_brute_force(self):
+        X = np.random.default_rng(0).normal(size=(300, 6))
+        for metric in ['l2', 'l1']:
+            idx = farthest_point_sampling(X, 40, metric=metric, start=7)
+            np.testing.assert_array_equal(
+                idx, _brute_force_fps(X, 40, 7, metric))
+
+    def test_l1_blocks(self):
+        X = np.random.default_rng(2).normal(size=(301, 6))
+        idx = _brute_force_fps(X, 30, 3, 'l1')
+        for block_size in [1, 64, 301, 1000]:
+            np.testing.assert_array_equal(
+                farthest_point_sampling(X, 30, metric='l1', start=3,
+                                        block_size=block_size),
+                idx)
+
+    def test_duplicates(self):
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(20, 6))[rng.integers(20, size=200)]
+        n_distinct = np.unique(X, axis=0).shape[0]
+        idx = farthest_point_sampling(X, n_distinct)
+        self.assertEqual(np.unique(idx).shape[0], n_distinct)
+        self.assertEqual(np.unique(X[idx], axis=0).shape[0], n_distinct)
+        with self.assertRaises(ValueError):
+            farthest_point_sampling(X, n_distinct + 1)
+
+
+class TestCURSelection(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        # Low rank descriptors plus one outlier direction held by one row.
+        self.X = np.dot(rng.normal(size=(400, 3)), rng.normal(size=(3, 10)))
+        self.X[123, :] += 50.0*np.eye(10)[9]
+
+    def test_scores_match_svd(self):
+        U, _, _ = LA.svd(self.X, full_matrices=False)
+        for k in [2, 4]:
+            _, scores = cur_selection(self.X, 4, n_components=k, kernel=None,
+                                      deterministic=True, block_size=37)
+            np.testing.assert_allclose(scores,
+                                       np.sum(U[:, :k]**2, axis=1),
+                                       rtol=1e-6, atol=1e-10)
+            self.assertAlmostEqual(scores.sum(), k)
+
+    def test_deterministic(self):
+        idx, scores = cur_selection(self.X, 4, kernel=None,
+                                    deterministic=True)
+        np.testing.assert_array_equal(idx, np.argsort(scores)[::-1][:4])
+        # The outlier is alone in its direction, its score is ~1.
+        self.assertEqual(idx[0], 123)
+        self.assertAlmostEqual(scores[123], 1.0)
+
+    def test_sampled(self):
+        for kernel in ['gaussian', 'laplacian']:
+            idx, scores = cur_selection(self.X, 50, kernel=kernel,
+                                        sigma=20.0, n_features=100)
+            self.assertEqual(np.unique(idx).shape[0], 50)
+            self.assertTrue(np.all(scores >= 0.0))
+            np.testing.assert_array_equal(
+                idx, cur_selection(self.X, 50, kernel=kernel, sigma=20.0,
+                                   n_features=100)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""MIT License
+
+Copyright (c) 2019 David Luevano Alvarado
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from ml_exp.tuning import successive_halving
+
+KEYS = ['descriptor', 'kernel', 'metric', 'sigma']
+
+
+class TestSuccessiveHalving(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(700, 6))
+        self.Y = np.sin(self.X[:, 0]) + 0.5*self.X[:, 1]
+        self.sigmas = [0.3, 1.0, 3.0, 10.0]
+        self.regs = [1e-6, 1e-2]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmp.name, 'log.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_schedule(self):
+        best, log = successive_halving(self.X, self.Y, self.sigmas,
+                                       regs=self.regs,
+                                       kernels=['gaussian', 'laplacian'],
+                                       metrics=['l2', 'l1'],
+                                       min_size=50,
+                                       training_size=400,
+                                       validation_size=200,
+                                       log_file=self.log_file,
+                                       show_msgs=False)
+        self.assertEqual(self.sigmas, [0.3, 1.0, 3.0, 10.0])
+
+        # 4 sigmas for the gaussian and 8 for the laplacian (l2 and l1).
+        n_candidates = [12, 6, 3, 2, 1]
+        sizes = [50, 84, 141, 237, 400]
+        rounds = [[e for e in log if e['round'] == r] for r in range(5)]
+        self.assertEqual(len(log), sum(n_candidates)*len(self.regs))
+        for r in range(5):
+            self.assertEqual(len(rounds[r]), n_candidates[r]*len(self.regs))
+            self.assertTrue(all(e['training_size'] == sizes[r]
+                                for e in rounds[r]))
+
+            # Survivors are the best candidates (with their best reg).
+            scores = dict()
+            for e in rounds[r]:
+                c = tuple(e[k] for k in KEYS)
+                scores[c] = min(scores.get(c, np.inf), e['mae'])
+            if r < 4:
+                survivors = set(tuple(e[k] for k in KEYS)
+                                for e in rounds[r + 1])
+                ranked = sorted(scores, key=scores.get)
+                self.assertEqual(survivors,
+                                 set(ranked[:n_candidates[r + 1]]))
+
+        last = min(rounds[-1], key=lambda e: e['mae'])
+        self.assertEqual(best, {k: last[k] for k in KEYS + ['reg',
+                                                           'training_size',
+                                                           'mae']})
+
+        with open(self.log_file) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines, log)
+
+    def test_deterministic(self):
+        kwargs = {'regs': self.regs, 'min_size': 50, 'training_size': 200,
+                  'validation_size': 200, 'show_msgs': False}
+        best, _ = successive_halving(self.X, self.Y, self.sigmas, **kwargs)
+        self.assertEqual(best['kernel'], 'gaussian')
+        self.assertEqual(successive_halving(self.X, self.Y, self.sigmas,
+                                            **kwargs)[0],
+                         best)
+
+    def test_lists(self):
+        with self.assertRaises(TypeError):
+            successive_halving(self.X, self.Y, (1.0, 3.0), show_msgs=False)
+        with self.assertRaises(TypeError):
+            successive_halving(self.X, self.Y, self.sigmas, regs=1e-8,
+                               show_msgs=False)
+        with self.assertRaises(ValueError):
+            successive_halving(self.X, self.Y, [], show_msgs=False)
+
+
+if __name__ == '__main__':
+    unittest.main()